@@ -1,4 +1,3 @@
-import inspect
 import logging
 from playwright.sync_api import expect, Page
 import re
@@ -16,11 +15,10 @@ def run_stealth_diagnostic(page: Page, quiet = True):
     Run a collection of tests to try and get an idea of how this program looks
     to others.
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     if not isinstance(page, Page):
         raise ValueError(
-            f"({tag}) invalid page parameter. Expecting type playwright.sync_api.Page, "
+            f"({__name__}.run_stealth_diagnostic) invalid page parameter. "
+            f"Expecting type playwright.sync_api.Page, "
             f"received {type(page)} instead"
         )
 
@@ -35,36 +33,33 @@ def print_webdriver_status(page: Page):
 
     :param page: playwright page object
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     webdriver_status = page.evaluate("navigator.webdriver")
-    logger.info(f"({tag}) webdriver status -> navigator.webdriver == {'True' if webdriver_status else 'False'}")
+    logger.info("webdriver status -> navigator.webdriver == %s", "True" if webdriver_status else "False")
 
 
 def check_fingerprint_score(page: Page):
     """
     Go to fingerprint score calculator tool.
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     if not isinstance(page, Page):
         raise ValueError(
-            f"({tag}) invalid page parameter. Expecting type playwright.sync_api.Page, "
+            f"({__name__}.check_fingerprint_score) invalid page parameter. "
+            f"Expecting type playwright.sync_api.Page, "
             f"received {type(page)} instead"
         )
 
-    logger.info(f"({tag}) trying fingerprint score...")
+    logger.info("trying fingerprint score...")
     page.goto(FINGERPRINT_SCAN_URL)
 
     risk_score = None
     if page.locator("id=fingerprintScore").count() == 0:
-        logger.info(f"({tag}) finger print score inconclusive...")
+        logger.info("finger print score inconclusive...")
     else:
         risk_score = page.locator("id=fingerprintScore").inner_text()
         match = re.search(r"Bot Risk Score: (?P<score_numer>[0-9]+)\/(?P<score_denom>[0-9]+)", risk_score)
         risk_score = float(match.group["score_numer"]) / float(match.group["score_denom"]) * 100
 
-        logger.info(f"({tag}) Fingerprint score obtained (higher is more risk): {risk_score}")
+        logger.info("Fingerprint score obtained (higher is more risk): %s", risk_score)
 
     return risk_score
 
@@ -73,15 +68,14 @@ def check_entropy(page: Page, quiet = False):
     """
     Go to diagnostic tool for browser fingerprinting uniqueness score.
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     if not isinstance(page, Page):
         raise ValueError(
-            f"({tag}) invalid page parameter. Expecting type playwright.sync_api.Page, "
+            f"({__name__}.check_entropy) invalid page parameter. "
+            f"Expecting type playwright.sync_api.Page, "
             f"received {type(page)} instead"
         )
 
-    logger.info(f"({tag}) going to Cover Your Tracks fingerprint diagnostic.")
+    logger.info("going to Cover Your Tracks fingerprint diagnostic.")
     page.goto(COVER_YOUR_TRACKS_URL)
 
     page.get_by_role("link", name="Test Your Browser").click()
@@ -91,7 +85,7 @@ def check_entropy(page: Page, quiet = False):
     expect(page.locator("id=fp_status")).not_to_be_empty(timeout=30000)
 
     if not quiet:
-        logger.info(f"({tag}) *** RESULTS ***")
+        logger.info("*** RESULTS ***")
 
     for result in page.locator(".results-table").filter(has=page.locator("h4")).all():
         header = result.locator("h4").inner_text()
@@ -106,22 +100,22 @@ def check_entropy(page: Page, quiet = False):
             uniqueness = float(match.groupdict()["odds"])
 
         if not quiet:
-            logger.info(f"({tag}) === {header} ({uniqueness})")
-            logger.info(f"({tag})   {item_name}")
+            logger.info("=== %s (%s)", header, uniqueness)
+            logger.info("  %s", item_name)
 
         if quiet and uniqueness >= ENTROPY_WARNING_THRESHOLD:
-            logger.warning(f"({tag}) WARNING highly unique {header} ({uniqueness})")
+            logger.warning("WARNING highly unique %s (%s)", header, uniqueness)
 
     if not quiet:
-        logger.info(f"({tag}) *** OVERALL ASSESSMENT ***")
+        logger.info("*** OVERALL ASSESSMENT ***")
 
         status = page.locator("id=fp_status").inner_text()
-        logger.info(f"({tag}) {status}")
+        logger.info("%s", status)
 
     overall_uniqueness = page.locator("div.entropy").locator("p").nth(0).inner_text().replace("\r\n", "")
 
     if not quiet:
-        logger.info(f"({tag}) {overall_uniqueness}")
+        logger.info("%s", overall_uniqueness)
 
     match = re.search(r"one in (?P<uniqueness>[0-9]*?(\.[0-9]+)?) browsers", overall_uniqueness)
     return float(match.groupdict()["uniqueness"]) if match and "uniqueness" in match.groupdict() else 1.0
@@ -133,16 +127,15 @@ def check_sannysoft(page: Page):
 
     :param page: playwright page object
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     if not isinstance(page, Page):
         raise ValueError(
-            f"({tag}) invalid page parameter. Expecting type playwright.sync_api.Page, "
+            f"({__name__}.check_sannysoft) invalid page parameter. "
+            f"Expecting type playwright.sync_api.Page, "
             f"received {type(page)} instead"
         )
 
-    logger.info(f"({tag}) running diagnostics...")
+    logger.info("running diagnostics...")
     print_webdriver_status(page)
 
-    logger.warning(f"({tag}) Page load may get stuck. You may need to Ctrl+C out of this...")
+    logger.warning("Page load may get stuck. You may need to Ctrl+C out of this...")
     page.goto(SANNYSOFT_URL, timeout = 0)
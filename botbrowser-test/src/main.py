@@ -6,9 +6,10 @@ from playwright.sync_api import Page, Playwright, sync_playwright
 from playwright_stealth import Stealth
 
 import diagnostics
+import logtag
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format = "[%(levelname)s] %(message)s")
+logtag.setup()
 
 parser = argparse.ArgumentParser(
     prog="Playwright Botbrowser Test",
@@ -38,8 +39,8 @@ if __name__ == "__main__":
         if args.remote_debugging_port:
             browser_args.append(f"--remote_debugging_port={args.remote_debugging_port}")
 
-        logger.info(f"Browser executable path: {browser_executable_path}")
-        logger.info(f"Browser args: {browser_args}")
+        logger.info("Browser executable path: %s", browser_executable_path)
+        logger.info("Browser args: %s", browser_args)
 
         browser = p.chromium.launch(
             headless = False,
@@ -3,9 +3,10 @@ import logging
 import pdb
 
 import diagnostics
+import logtag
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format = "[%(levelname)s] %(message)s")
+logtag.setup()
 
 
 if __name__ == "__main__":
@@ -14,10 +15,10 @@ if __name__ == "__main__":
     with Camoufox() as browser:
         page = browser.new_page()
 
-        logging.info(f"Created new browser page...")
-        logging.info(f"UserAgent = {page.evaluate('navigator.userAgent')}")
-        logging.info(f"Screen offset = {page.evaluate('window.screenX')}, {page.evaluate('window.screenY')}")
-        logging.info(f"Screen size = {page.evaluate('window.outerWidth')}, {page.evaluate('window.outerHeight')}")
+        logging.info("Created new browser page...")
+        logging.info("UserAgent = %s", page.evaluate("navigator.userAgent"))
+        logging.info("Screen offset = %s, %s", page.evaluate("window.screenX"), page.evaluate("window.screenY"))
+        logging.info("Screen size = %s, %s", page.evaluate("window.outerWidth"), page.evaluate("window.outerHeight"))
 
         breakpoint()
 
@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import json
+import logging
+import re
+import statistics
+import sys
+import time
+
+from playwright.async_api import async_playwright
+
+from internal import config, logtag, snapshot
+from internal.parsers import costco_sameday_async, safeway_async
+
+logger = logging.getLogger(__name__)
+logtag.setup()
+
+PARSERS = {
+    "costco": costco_sameday_async,
+    "safeway": safeway_async,
+}
+
+PERCENTILES = [50, 90, 99]
+
+script_tag_re = re.compile(r"<script\b.*?</script>", re.IGNORECASE | re.DOTALL)
+
+
+def parser_functions(parser):
+    """
+    Get every extraction function of an async parser module worth timing.
+
+    :param parser: async parser module
+
+    :return: dict of function name -> coroutine function taking a page
+    """
+    names = sorted(name for name in dir(parser) if name.startswith("get_product"))
+    return {name: getattr(parser, name) for name in names + ["extract_product"]}
+
+
+def summarize(samples):
+    """
+    Boil a list of latencies down to percentiles.
+
+    :param samples: list of latencies in milliseconds
+
+    :return: dict of "p50"/"p90"/"p99"/"mean" -> milliseconds
+    """
+    if len(samples) > 1:
+        cuts = statistics.quantiles(samples, n = 100, method = "inclusive")
+        summary = {f"p{p}": cuts[p - 1] for p in PERCENTILES}
+    else:
+        summary = {f"p{p}": samples[0] for p in PERCENTILES}
+
+    summary["mean"] = statistics.fmean(samples)
+    return summary
+
+
+async def benchmark_store(context, store, corpus_dir, iterations):
+    """
+    Time every extraction function of a store's parser against each saved
+    product page.
+
+    :param context: playwright async BrowserContext to load snapshots into
+    :param store: store name (key in PARSERS)
+    :param corpus_dir: directory with snapshot.save_snapshot output
+    :param iterations: how many times to call each function per page
+
+    :return: dict of "store.function" -> percentile summary
+    """
+    snapshots = snapshot.load_snapshots(store, corpus_dir)
+    if not snapshots:
+        logger.warning("[%s] no snapshots in %s, skipping...", store, corpus_dir)
+        return {}
+
+    functions = parser_functions(PARSERS[store])
+    samples = {name: [] for name in functions}
+
+    page = await context.new_page()
+    for path, html in snapshots.items():
+        # the saved dom is already rendered, the site's scripts would only
+        # try to hydrate it again
+        await page.set_content(script_tag_re.sub("", html))
+
+        for name, function in functions.items():
+            for _ in range(iterations):
+                start_time = time.perf_counter()
+                try:
+                    await function(page)
+                except Exception as e:
+                    # a snapshot that breaks a parser is a bug, but keep timing the rest
+                    logger.warning("[%s] %s failed on %s: %s", store, name, path, e)
+                    break
+                samples[name].append((time.perf_counter() - start_time) * 1000)
+
+    await page.close()
+
+    logger.info("[%s] timed %s page(s) x %s iteration(s)", store, len(snapshots), iterations)
+    return {f"{store}.{name}": summarize(times) for name, times in samples.items() if times}
+
+
+def compare(results, baseline, threshold):
+    """
+    Find functions whose median latency got worse than the baseline by more
+    than threshold.
+
+    :param results: dict of "store.function" -> percentile summary
+    :param baseline: same shape as results, from an earlier run
+    :param threshold: allowed slowdown as a fraction, e.g. 0.2 for 20%
+
+    :return: list of str describing each regression
+    """
+    regressions = []
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+
+        before = baseline[name]["p50"]
+        after = summary["p50"]
+        if before > 0 and (after - before) / before > threshold:
+            regressions.append(f"{name}: p50 {before:.2f} ms -> {after:.2f} ms (+{(after - before) / before:.0%})")
+
+    return regressions
+
+
+async def main(args):
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless = True)
+
+        # saved pages still reference the live site's stylesheets and images.
+        # Keep them from loading so we only time the parsers
+        context = await browser.new_context()
+        await context.route("**/*", lambda route: route.abort())
+
+        results = {}
+        for store in args.stores:
+            results.update(await benchmark_store(context, store, args.corpus, args.iterations))
+
+        await browser.close()
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the product parsers against saved page snapshots.")
+    parser.add_argument("--corpus", default = config.snapshot_dir(), help = "directory with saved snapshots (SAVE_SNAPSHOTS=true)")
+    parser.add_argument("--stores", nargs = "+", default = list(PARSERS), choices = list(PARSERS))
+    parser.add_argument("--iterations", type = int, default = 20, help = "calls per function per page")
+    parser.add_argument("--baseline", default = "benchmark-baseline.no-git.json", help = "results file to compare against")
+    parser.add_argument("--threshold", type = float, default = 0.2, help = "allowed p50 slowdown before failing, e.g. 0.2 = 20%%")
+    parser.add_argument("--save-baseline", action = "store_true", help = "overwrite the baseline with this run")
+    args = parser.parse_args()
+
+    # the parsers log every field they find, which would swamp the report
+    logging.getLogger("internal").setLevel(logging.WARNING)
+
+    results = asyncio.run(main(args))
+    if not results:
+        logger.error("Nothing was benchmarked. Record snapshots with SAVE_SNAPSHOTS=true first.")
+        sys.exit(1)
+
+    for name, summary in sorted(results.items()):
+        logger.info(
+            f"{name:55} " + " ".join(f"{key}={value:7.2f}ms" for key, value in summary.items())
+        )
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent = 2)
+        logger.info("Saved baseline to %s", args.baseline)
+        sys.exit(0)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        logger.info("No baseline at %s, run with --save-baseline to create one", args.baseline)
+        sys.exit(0)
+
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        logger.error("REGRESSION %s", regression)
+
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,304 @@
+from datetime import datetime
+import logging
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+
+def load_daily_prices(conn, days = 90, item_group = None, column = "price", now = None):
+    """
+    Load price history into a (sku x day) matrix. When a sku was scraped more
+    than once in a day, the last price of the day wins. Days it wasn't
+    scraped are NaN.
+
+    :param conn: connection from history.connect()
+    :param days: how many days of history to load, ending today
+    :param item_group: only load this item group
+    :param column: which history column to load, "price" or "unit_price"
+    :param now: datetime to count back from, defaults to now
+
+    :return: dict with "keys" (list of (store, sku)), "dates" (datetime64[D]
+        array) and "values" (float array of shape (len(keys), len(dates)))
+    """
+    if column not in ["price", "unit_price"]:
+        raise ValueError(
+            f"({__name__}.load_daily_prices) invalid column parameter. "
+            f"Expecting price or unit_price, received {column}"
+        )
+
+    end = np.datetime64((now or datetime.now()).date(), "D")
+    start = end - np.timedelta64(days - 1, "D")
+
+    query = f"SELECT store, sku, substr(date, 1, 10), {column} FROM prices WHERE date >= ? AND date < ?"
+    params = [str(start), str(end + np.timedelta64(1, "D"))]
+    if item_group is not None:
+        query += " AND item_group = ?"
+        params.append(item_group)
+    rows = conn.execute(query + " ORDER BY date", params).fetchall()
+
+    # unchanged scrapes don't add rows, so a sku that was still seen in the
+    # window may have its last record from before it. Start it off on day 0
+    # with that record and let forward_fill do the rest
+    seed_query = f"""
+        SELECT p.store, p.sku, ?, p.{column} FROM latest_prices l
+        JOIN prices p ON p.store = l.store AND p.sku = l.sku AND p.date = (
+            SELECT MAX(date) FROM prices WHERE store = l.store AND sku = l.sku AND date < ?
+        )
+        WHERE COALESCE(l.seen, l.date) >= ?
+    """
+    seed_params = [str(start), str(start), str(start)]
+    if item_group is not None:
+        seed_query += " AND l.item_group = ?"
+        seed_params.append(item_group)
+    rows = conn.execute(seed_query, seed_params).fetchall() + rows
+
+    keys = sorted({(row[0], row[1]) for row in rows})
+    key_index = {key: i for i, key in enumerate(keys)}
+    dates = np.arange(start, end + np.timedelta64(1, "D"), dtype = "datetime64[D]")
+    values = np.full((len(keys), len(dates)), np.nan)
+
+    if rows:
+        sku_idx = np.fromiter((key_index[(row[0], row[1])] for row in rows), dtype = np.intp, count = len(rows))
+        day_idx = (np.array([row[2] for row in rows], dtype = "datetime64[D]") - start).astype(np.intp)
+        prices = np.array([row[3] for row in rows], dtype = float)
+
+        # seeds come first and rows are in date order, so later writes to the
+        # same cell win
+        values[sku_idx, day_idx] = prices
+
+    return {"keys": keys, "dates": dates, "values": values}
+
+
+def forward_fill(values):
+    """
+    Carry each sku's last known price forward over days it wasn't scraped.
+    Leading NaNs (before the first scrape) stay NaN.
+
+    :param values: float array of shape (skus, days)
+
+    :return: new float array of the same shape
+    """
+    # index of the last day with a price, leading gaps point at day 0 (NaN)
+    idx = np.where(np.isnan(values), 0, np.arange(values.shape[1]))
+    np.maximum.accumulate(idx, axis = 1, out = idx)
+    return values[np.arange(values.shape[0])[:, None], idx]
+
+
+def rolling_mean(values, window):
+    """
+    Mean of the last `window` days for every sku and day, ignoring NaNs.
+
+    :param values: float array of shape (skus, days)
+    :param window: window length in days
+
+    :return: float array of shape (skus, days), NaN where the window is empty
+    """
+    present = ~np.isnan(values)
+    sums = np.cumsum(np.where(present, values, 0.0), axis = 1)
+    counts = np.cumsum(present, axis = 1)
+
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def rolling_extreme(values, window, reducer):
+    """
+    Rolling min or max of the last `window` days, ignoring NaNs.
+
+    :param values: float array of shape (skus, days)
+    :param window: window length in days
+    :param reducer: np.nanmin or np.nanmax
+
+    :return: float array of shape (skus, days), NaN where the window is empty
+    """
+    padded = np.pad(values, ((0, 0), (window - 1, 0)), constant_values = np.nan)
+    windows = sliding_window_view(padded, window, axis = 1)
+
+    result = np.full(values.shape, np.nan)
+    has_data = ~np.all(np.isnan(windows), axis = 2)
+    result[has_data] = reducer(windows[has_data], axis = 1)
+    return result
+
+
+def ewma(values, alpha):
+    """
+    Exponentially weighted moving average. Loops over days, but every sku is
+    updated at once per day. Days without a price keep the previous average.
+
+    :param values: float array of shape (skus, days)
+    :param alpha: weight of the newest day, between 0 and 1
+
+    :return: float array of shape (skus, days)
+    """
+    result = np.full(values.shape, np.nan)
+    current = np.full(values.shape[0], np.nan)
+
+    for day in range(values.shape[1]):
+        current = ewma_step(current, values[:, day], alpha)
+        result[:, day] = current
+
+    return result
+
+
+def ewma_step(current, prices, alpha):
+    """
+    Advance an ewma by one day.
+
+    :param current: float array with each sku's average so far (NaN if none)
+    :param prices: float array with each sku's price today (NaN if not scraped)
+    :param alpha: weight of the newest day, between 0 and 1
+
+    :return: new float array with each sku's average
+    """
+    return np.where(
+        np.isnan(prices),
+        current,
+        np.where(np.isnan(current), prices, alpha * prices + (1 - alpha) * current),
+    )
+
+
+def summarize(prices, window = 30, alpha = 0.2):
+    """
+    Compute every statistic for every sku in one pass over the matrix.
+
+    :param prices: dict from load_daily_prices
+    :param window: rolling window length in days
+    :param alpha: ewma weight of the newest day
+
+    :return: dict of (store, sku) -> dict with price, mean, ewma, min, max
+        and percent_below_average as of the last day
+    """
+    values = forward_fill(prices["values"])
+    if values.shape[1] == 0:
+        return {}
+
+    mean = rolling_mean(values, window)[:, -1]
+    low = rolling_extreme(values[:, -window:], window, np.nanmin)[:, -1]
+    high = rolling_extreme(values[:, -window:], window, np.nanmax)[:, -1]
+    average = ewma(values, alpha)[:, -1]
+    current = values[:, -1]
+
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        below = (mean - current) / mean * 100
+
+    return to_summary(prices["keys"], current, mean, average, low, high, below)
+
+
+def to_summary(keys, current, mean, average, low, high, below):
+    """
+    Zip per-sku statistic arrays into plain python dicts.
+
+    :param keys: list of (store, sku)
+    :param current, mean, average, low, high, below: float arrays, one value per key
+
+    :return: dict of (store, sku) -> dict with price, mean, ewma, min, max
+        and percent_below_average
+    """
+    columns = {
+        "price": current.tolist(),
+        "mean": mean.tolist(),
+        "ewma": average.tolist(),
+        "min": low.tolist(),
+        "max": high.tolist(),
+        "percent_below_average": below.tolist(),
+    }
+
+    return {
+        key: {name: values[i] for name, values in columns.items()}
+        for i, key in enumerate(keys)
+    }
+
+
+def make_state(prices, window = 30, alpha = 0.2):
+    """
+    Build the running state used by update() from a full history load, so
+    later days can be added without reloading everything.
+
+    :param prices: dict from load_daily_prices
+    :param window: rolling window length in days
+    :param alpha: ewma weight of the newest day
+
+    :return: dict with keys, the last `window` days of prices and the ewma
+    """
+    values = forward_fill(prices["values"])
+    recent = np.full((len(prices["keys"]), window), np.nan)
+    take = min(window, values.shape[1])
+    if take > 0:
+        recent[:, -take:] = values[:, -take:]
+
+    return {
+        "keys": list(prices["keys"]),
+        "key_index": {key: i for i, key in enumerate(prices["keys"])},
+        "date": prices["dates"][-1] if len(prices["dates"]) else None,
+        "window": window,
+        "alpha": alpha,
+        "recent": recent,
+        "ewma": ewma(values, alpha)[:, -1] if values.shape[1] else np.full(len(prices["keys"]), np.nan),
+    }
+
+
+def update(state, day_prices, date = None):
+    """
+    Add one day of prices to the running state. Cost is O(skus x window)
+    no matter how long the history is.
+
+    :param state: dict from make_state, updated in place
+    :param day_prices: dict of (store, sku) -> price scraped that day. Skus
+        that weren't scraped keep their last price
+    :param date: the day being added, defaults to the day after state["date"]
+
+    :return: the same state, for chaining
+    """
+    # new skus get a row of NaNs
+    new_keys = [key for key in day_prices if key not in state["key_index"]]
+    if new_keys:
+        for key in new_keys:
+            state["key_index"][key] = len(state["keys"])
+            state["keys"].append(key)
+        state["recent"] = np.vstack([state["recent"], np.full((len(new_keys), state["window"]), np.nan)])
+        state["ewma"] = np.concatenate([state["ewma"], np.full(len(new_keys), np.nan)])
+
+    today = state["recent"][:, -1].copy()
+    if day_prices:
+        rows = np.fromiter((state["key_index"][key] for key in day_prices), dtype = np.intp, count = len(day_prices))
+        today[rows] = np.fromiter(day_prices.values(), dtype = float, count = len(day_prices))
+
+    state["recent"] = np.concatenate([state["recent"][:, 1:], today[:, None]], axis = 1)
+    state["ewma"] = ewma_step(state["ewma"], today, state["alpha"])
+
+    if date is not None:
+        state["date"] = np.datetime64(date, "D")
+    elif state["date"] is not None:
+        state["date"] = state["date"] + np.timedelta64(1, "D")
+
+    return state
+
+
+def summarize_state(state):
+    """
+    Current statistics from a running state, same shape as summarize().
+
+    :param state: dict from make_state / update
+
+    :return: dict of (store, sku) -> dict with price, mean, ewma, min, max
+        and percent_below_average
+    """
+    recent = state["recent"]
+    has_data = ~np.all(np.isnan(recent), axis = 1)
+
+    mean = np.full(len(state["keys"]), np.nan)
+    low = np.full(len(state["keys"]), np.nan)
+    high = np.full(len(state["keys"]), np.nan)
+    mean[has_data] = np.nanmean(recent[has_data], axis = 1)
+    low[has_data] = np.nanmin(recent[has_data], axis = 1)
+    high[has_data] = np.nanmax(recent[has_data], axis = 1)
+    current = recent[:, -1]
+
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        below = (mean - current) / mean * 100
+
+    return to_summary(state["keys"], current, mean, state["ewma"], low, high, below)
@@ -0,0 +1,178 @@
+import asyncio
+import contextlib
+from datetime import datetime
+import gzip
+import json
+import logging
+import os
+
+from .config import *
+from .snapshot import url_slug
+
+logger = logging.getLogger(__name__)
+
+# every artifact file name starts with this, so one run's files sort
+# together. Forked worker processes inherit it
+RUN_ID = datetime.now().strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+# a jpeg of the viewport is a fraction of the size and encode time of a full
+# page png, and plenty to see what went wrong
+SCREENSHOT_QUALITY = 60
+
+# file writes started by capture() that haven't finished yet, see flush()
+pending_writes = set()
+
+
+def anomalies(product):
+    """
+    Check a scraped product for signs the page wasn't what the parser
+    expected, e.g. a changed layout or a captcha instead of the product.
+
+    :param product: Product
+
+    :return: list of str with what looks wrong, empty if nothing does
+    """
+    reasons = [f"no {field}" for field in ["name", "sku"] if product.get(field) is None]
+
+    # out of stock items have no price by design, but they do say why
+    if product.get("price") is None and not product.get("availability"):
+        reasons.append("no price")
+    if product.get("price") is not None and product["price"] <= 0:
+        reasons.append(f"price is {product['price']}")
+    return reasons
+
+
+def artifact_name(store, url):
+    """
+    Get the path an artifact is saved to, without its extension. Names are
+    keyed by run and url, so a failing url doesn't overwrite its own
+    artifacts from earlier runs.
+
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param url: product page url
+
+    :return: str with path prefix for the artifact's files
+    """
+    return os.path.join(artifact_dir(), store, f"{RUN_ID}-{url_slug(url)}")
+
+
+async def capture(page, store, url, reason):
+    """
+    Save a screenshot and the html of a page that failed to scrape, or gave
+    back a suspicious product. Only the two browser round trips are awaited
+    here. Compressing and writing the files happens on a thread while the
+    scrape moves on (see flush()). Never raises, a broken page shouldn't turn
+    one failure into two.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param url: product page url
+    :param reason: str with what went wrong, saved next to the artifact
+
+    :return: None
+    """
+    max_bytes = artifact_max_mb() * 1024 * 1024
+    if max_bytes <= 0:
+        return
+
+    try:
+        screenshot = await page.screenshot(type = "jpeg", quality = SCREENSHOT_QUALITY)
+        html = await page.content()
+    except Exception:
+        logger.warning("[%s] Could not capture artifacts for %s", store, url, exc_info = True)
+        return
+
+    task = asyncio.create_task(asyncio.to_thread(write, store, url, reason, screenshot, html, max_bytes))
+    pending_writes.add(task)
+    task.add_done_callback(pending_writes.discard)
+
+
+def write(store, url, reason, screenshot, html, max_bytes):
+    """
+    Write one artifact (screenshot, gzipped html and a json file saying why)
+    and evict old ones to stay under max_bytes. Runs on a worker thread.
+
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param url: product page url
+    :param reason: str with what went wrong
+    :param screenshot: bytes with jpeg screenshot
+    :param html: str with page html
+    :param max_bytes: size limit for the whole artifact directory
+
+    :return: None
+    """
+    name = artifact_name(store, url)
+    try:
+        os.makedirs(os.path.dirname(name), exist_ok = True)
+        with open(name + ".jpg", "wb") as f:
+            f.write(screenshot)
+        with gzip.open(name + ".html.gz", "wt") as f:
+            f.write(html)
+        with open(name + ".json", "w") as f:
+            json.dump(
+                {"store": store, "url": url, "reason": reason, "run": RUN_ID, "date": datetime.now().isoformat()}, f
+            )
+    except OSError:
+        logger.warning("[%s] Could not write artifacts for %s", store, url, exc_info = True)
+        return
+
+    logger.info(
+        "[%s] Saved artifacts for %s (%s) to %s.*", store, url, reason, name,
+        extra = {"store": store, "url": url},
+    )
+    evict(artifact_dir(), max_bytes)
+
+
+def evict(directory, max_bytes):
+    """
+    Delete the least recently used artifacts until the directory fits in
+    max_bytes. An artifact's files go together, and it counts as used when
+    any of them was last read or written.
+
+    :param directory: artifact directory
+    :param max_bytes: size limit
+
+    :return: int with number of artifacts deleted
+    """
+    # artifact path prefix -> [last used, size, paths]
+    artifacts = {}
+    for root, _, names in os.walk(directory):
+        for file_name in names:
+            path = os.path.join(root, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # another process evicted it first
+                continue
+
+            entry = artifacts.setdefault(os.path.join(root, file_name.split(".", 1)[0]), [0, 0, []])
+            entry[0] = max(entry[0], stat.st_atime, stat.st_mtime)
+            entry[1] += stat.st_size
+            entry[2].append(path)
+
+    total = sum(entry[1] for entry in artifacts.values())
+    deleted = 0
+    for _, size, paths in sorted(artifacts.values()):
+        if total <= max_bytes:
+            break
+
+        for path in paths:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        total -= size
+        deleted += 1
+
+    if deleted:
+        logger.info("Evicted %s artifact(s) to stay under %.0f MB", deleted, max_bytes / 1024 / 1024)
+    return deleted
+
+
+async def flush():
+    """
+    Wait for every artifact that is still being written. Call before the
+    event loop shuts down.
+
+    :return: None
+    """
+    if pending_writes:
+        await asyncio.gather(*pending_writes, return_exceptions = True)
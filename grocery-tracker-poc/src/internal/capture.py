@@ -0,0 +1,129 @@
+import asyncio
+import logging
+
+from . import readiness, tracing
+from .config import *
+
+logger = logging.getLogger(__name__)
+
+
+def find_dicts(payload, predicate):
+    """
+    Walk a decoded json payload and yield every dict that matches.
+
+    :param payload: decoded json (dicts, lists and scalars)
+    :param predicate: callable taking a dict and returning bool
+
+    :return: generator of matching dicts, outermost first
+    """
+    pending = [payload]
+    while pending:
+        node = pending.pop(0)
+        if isinstance(node, dict):
+            if predicate(node):
+                yield node
+            pending.extend(node.values())
+        elif isinstance(node, list):
+            pending.extend(node)
+
+
+def find_value(payload, keys):
+    """
+    Get the first value stored under any of the keys, searching nested dicts
+    and lists breadth first.
+
+    :param payload: decoded json (dicts, lists and scalars)
+    :param keys: list of key names to look for
+
+    :return: the value, or None if none of the keys are present
+    """
+    for node in find_dicts(payload, lambda d: any(key in d for key in keys)):
+        for key in keys:
+            if key in node and node[key] is not None:
+                return node[key]
+    return None
+
+
+@tracing.traced
+async def goto_and_capture(page, url, parser, timeout = None):
+    """
+    Navigate to a product page and build the product record straight from
+    the store's own json api response, as soon as it lands. Doesn't wait for
+    the page to render.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param url: product page url
+    :param parser: parser module with is_product_response and
+        product_from_json (see parsers/costco_sameday.py)
+    :param timeout: seconds to wait for a matching response, defaults to
+        config.xhr_capture_timeout()
+
+    :return: Product, or None if no matching response arrived in time (the
+        page is left loading so the caller can fall back to the dom)
+    """
+    if timeout is None:
+        timeout = xhr_capture_timeout()
+
+    product_id = parser.product_id_from_url(url)
+    captured = asyncio.get_running_loop().create_future()
+
+    async def handle_response(response):
+        if captured.done() or not parser.is_product_response(response.url):
+            return
+
+        try:
+            product = parser.product_from_json(await response.json(), product_id)
+        except Exception:
+            # not json, body already gone, or a shape we don't understand
+            return
+
+        if product is not None and not captured.done():
+            captured.set_result(product)
+
+    page.on("response", handle_response)
+    try:
+        await page.goto(url, wait_until = "commit")
+        product = await asyncio.wait_for(captured, timeout)
+        logger.info("Captured product from api response: %s", product, extra = {"url": url, "sku": product["sku"]})
+        return product
+    except asyncio.TimeoutError:
+        logger.info("No product api response for %s within %s seconds...", url, timeout, extra = {"url": url})
+        return None
+    finally:
+        page.remove_listener("response", handle_response)
+
+
+@tracing.traced
+async def extract_product_from_page(page, url, parser, async_parser):
+    """
+    Get a product record for a url, preferring the json api response and
+    falling back to scraping the rendered dom when none arrives.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param url: product page url
+    :param parser: sync parser module with the json helpers
+    :param async_parser: async parser module with extract_product
+
+    :return: Product
+    """
+    if xhr_capture():
+        product = await goto_and_capture(page, url, parser)
+        if product is not None:
+            tracing.set_outcome("api")
+            return product
+
+        tracing.set_outcome("dom_fallback")
+
+        logger.info("Falling back to dom extraction for %s...", url)
+    else:
+        await page.goto(url, wait_until = "domcontentloaded")
+
+    # wait for the product fields to render rather than for every image and
+    # script on the page to finish loading
+    await readiness.wait_until(
+        "product",
+        lambda timeout: page.wait_for_function(
+            readiness.product_ready_js(parser.EXTRACT_PRODUCT_JS), polling = 100, timeout = timeout
+        ),
+    )
+    return await async_parser.extract_product(page)
@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import time
+
+from .config import *
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Keeps track of which stores are failing, so browser time isn't spent on
+    a site that is timing out or serving pages the parsers can't read.
+
+    Every store starts closed. After threshold failures in a row its circuit
+    opens and its urls are skipped for backoff seconds. Once that is up the
+    store is tried again: one success closes the circuit, one failure opens
+    it again for twice as long, up to max_backoff. States are saved to
+    config.circuit_file(), so the backoff carries over to the next run.
+    """
+
+    def __init__(self, threshold = None, backoff = None, max_backoff = None, path = None):
+        """
+        :param threshold: failures in a row that open a circuit, defaults to
+            config.circuit_threshold()
+        :param backoff: seconds a circuit first stays open, defaults to
+            config.circuit_backoff()
+        :param max_backoff: longest a circuit stays open, defaults to
+            config.circuit_max_backoff()
+        :param path: override for config.circuit_file(), None to use it
+        """
+        self.threshold = circuit_threshold() if threshold is None else threshold
+        self.backoff = circuit_backoff() if backoff is None else backoff
+        self.max_backoff = circuit_max_backoff() if max_backoff is None else max_backoff
+        self.path = circuit_file() if path is None else path
+
+        # store -> dict with failures, open_until (unix time or None) and
+        # backoff (seconds the circuit was last opened for)
+        self.states = self.load()
+
+        # stores whose state changed since load(), see save()
+        self.changed = set()
+
+    def load(self):
+        """
+        :return: dict of store -> state saved by an earlier run
+        """
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.warning("Could not read circuit states from %s, ignoring them...", self.path)
+            return {}
+
+    def save(self):
+        """
+        Write the states that changed in this run. The file is read again
+        first, so worker processes don't undo each other's stores.
+        """
+        if not self.changed:
+            return
+
+        states = self.load()
+        states.update({store: self.states[store] for store in self.changed})
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        with open(self.path + f".{os.getpid()}.tmp", "w") as f:
+            json.dump(states, f, indent = 2)
+        os.replace(self.path + f".{os.getpid()}.tmp", self.path)
+
+        self.changed.clear()
+
+    def state(self, store):
+        """
+        :param store: store name (key in config.PRODUCT_URLS)
+
+        :return: dict with the store's failures, open_until and backoff
+        """
+        return self.states.setdefault(store, {"failures": 0, "open_until": None, "backoff": 0})
+
+    def allow(self, store):
+        """
+        Check whether a store should be scraped right now. A store whose
+        backoff is up is allowed, and the next success or failure decides
+        whether its circuit closes or opens again.
+
+        :param store: store name (key in config.PRODUCT_URLS)
+
+        :return: bool - False while the store's circuit is open
+        """
+        open_until = self.state(store)["open_until"]
+        return open_until is None or time.time() >= open_until
+
+    def record_success(self, store):
+        """
+        :param store: store name (key in config.PRODUCT_URLS)
+        """
+        state = self.state(store)
+        if state["open_until"] is not None:
+            logger.info("[%s] store is back, closing circuit", store)
+        elif state["failures"] == 0:
+            return
+
+        state.update({"failures": 0, "open_until": None, "backoff": 0})
+        self.changed.add(store)
+
+    def record_failure(self, store, reason):
+        """
+        Count a timeout or failed extraction, opening the store's circuit if
+        it has failed too often.
+
+        :param store: store name (key in config.PRODUCT_URLS)
+        :param reason: str with what went wrong, for the log
+
+        :return: bool - True if the circuit is now open
+        """
+        state = self.state(store)
+        state["failures"] += 1
+        self.changed.add(store)
+        logger.warning(
+            "[%s] failure %s/%s: %s", store, state["failures"], self.threshold, reason,
+            extra = {"store": store},
+        )
+
+        # a failed retry after a backoff opens the circuit again straight away
+        if state["open_until"] is None and state["failures"] < self.threshold:
+            return False
+
+        backoff = min(state["backoff"] * 2, self.max_backoff) if state["backoff"] else self.backoff
+        state.update({"open_until": time.time() + backoff, "backoff": backoff})
+        logger.warning(
+            "[%s] circuit open, skipping the store for %.0f seconds", store, backoff,
+            extra = {"store": store, "duration": backoff},
+        )
+        return True
@@ -1,14 +1,16 @@
-import inspect
 import logging
 import os
+from playwright.async_api import Playwright as AsyncPlaywright
 from playwright.sync_api import Page, Playwright
 import subprocess
 
+from . import tracing
 from .config import *
 
 logger = logging.getLogger(__name__)
 
 
+@tracing.traced
 def make_browser(playwright: Playwright, launch_config = {}, browser_config = {}):
     """
     Make a playwright browser instance
@@ -19,11 +21,10 @@ def make_browser(playwright: Playwright, launch_config = {}, browser_config = {}
 
     :returns: tuple with browser and context
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     if not isinstance(playwright, Playwright):
         raise ValueError(
-            f"({tag}) invalid playwright parameter. Expecting type playwright.sync_api.Playwright, "
+            f"({__name__}.make_browser) invalid playwright parameter. "
+            f"Expecting type playwright.sync_api.Playwright, "
             f"received {type(playwright)} instead"
         )
 
@@ -38,6 +39,37 @@ def make_browser(playwright: Playwright, launch_config = {}, browser_config = {}
     return (browser, context)
 
 
+@tracing.traced
+async def make_browser_async(playwright: AsyncPlaywright, launch_config = {}, browser_config = {}):
+    """
+    Make a playwright browser instance using the async api. Same as
+    make_browser, but the returned browser can host many contexts that are
+    driven concurrently from one event loop.
+
+    :param playwright: async playwright instance
+    :param launch_config: dictionary with playwright launch config parameters
+    :param browser_config: dictionary with playwright browser context parameters
+
+    :returns: tuple with browser and context
+    """
+    if not isinstance(playwright, AsyncPlaywright):
+        raise ValueError(
+            f"({__name__}.make_browser_async) invalid playwright parameter. "
+            f"Expecting type playwright.async_api.Playwright, "
+            f"received {type(playwright)} instead"
+        )
+
+    if "BROWSER" in os.environ and os.environ["BROWSER"] == "chromium":
+        browser = await playwright.chromium.launch(**launch_config)
+    else:
+        browser = await playwright.firefox.launch(**launch_config)
+
+    logger.info("Creating new browser instance...")
+    context = await browser.new_context(**browser_config)
+
+    return (browser, context)
+
+
 def should_pause_at_beginning():
     if pause_at_beginning() == None:
         if environment() == "dev" and in_docker():
@@ -54,15 +86,13 @@ def pause_page(page: Page):
     """
     Wraps playwright function, to close debug window afterwards
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     if not isinstance(page, Page):
         raise ValueError(
-            f"({tag}) invalid page parameter. Expecting type playwright.sync_api.Page, "
+            f"({__name__}.pause_page) invalid page parameter. Expecting type playwright.sync_api.Page, "
             f"received {type(page)} instead"
         )
 
-    logger.info(f"({tag}) Pausing playwright...")
+    logger.info("Pausing playwright...")
     page.pause()
 
     if in_docker():
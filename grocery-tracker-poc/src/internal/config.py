@@ -28,6 +28,53 @@ PRODUCT_URLS = {
     ],
 }
 
+# item groups are what the user compares across stores, e.g. "strawberries".
+# NOTE: every hardcoded url is some kind of strawberry for now
+ITEM_GROUPS = {
+    "strawberries": [url for store_urls in PRODUCT_URLS.values() for url in store_urls],
+}
+
+# resource types and third party domains that the parsers never need. The
+# parsers check element visibility, so stylesheets have to stay allowed.
+BLOCKED_RESOURCE_TYPES = ["image", "media", "font"]
+BLOCKED_DOMAINS = [
+    "doubleclick.net",
+    "google-analytics.com",
+    "googletagmanager.com",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "bing.com",
+    "pinterest.com",
+    "tiktok.com",
+    "quantummetric.com",
+    "adobedtm.com",
+    "demdex.net",
+    "omtrdc.net",
+]
+
+# seconds to leave between product page navigations on the same site, picked
+# at random between min and max for every request. Sites missing from here
+# aren't paced
+POLITENESS_INTERVALS = {
+    "safeway.com": {"min": 5, "max": 40},
+}
+
+# per store request filtering rules. allow_domains wins over block_domains,
+# but not over block_resource_types
+ROUTING_RULES = {
+    "costco": {
+        "block_resource_types": BLOCKED_RESOURCE_TYPES,
+        "block_domains": BLOCKED_DOMAINS,
+        "allow_domains": ["costco.com", "instacart.com"],
+    },
+    "safeway": {
+        "block_resource_types": BLOCKED_RESOURCE_TYPES,
+        "block_domains": BLOCKED_DOMAINS,
+        "allow_domains": ["safeway.com", "albertsons.com"],
+    },
+}
+
 
 def environment():
     """
@@ -59,3 +106,387 @@ def pause_at_beginning():
     if "PAUSE_AT_BEGINNING" not in os.environ:
         return None
     return bool(os.environ["PAUSE_AT_BEGINNING"])
+
+
+def run_mode():
+    """
+    Set environment variable 'RUN_MODE' to pick what the app does after the
+    browser is up. Defaults to running the stealth diagnostic.
+
+    :return: str with run mode ("diagnostic"|"scrape")
+    """
+    run_mode = os.environ["RUN_MODE"] if "RUN_MODE" in os.environ else "diagnostic"
+    return "scrape" if run_mode == "scrape" else "diagnostic"
+
+
+def max_concurrency():
+    """
+    Set environment variable 'MAX_CONCURRENCY' to limit how many stores are
+    scraped at the same time.
+
+    :return: int with maximum number of stores to scrape at once (at least 1)
+    """
+    if "MAX_CONCURRENCY" not in os.environ:
+        return 2
+    return max(1, int(os.environ["MAX_CONCURRENCY"]))
+
+
+def pool_max_uses():
+    """
+    Set environment variable 'POOL_MAX_USES' to recycle a pooled browser after
+    it has been checked out this many times.
+
+    :return: int with number of checkouts before a browser is relaunched
+    """
+    if "POOL_MAX_USES" not in os.environ:
+        return 50
+    return max(1, int(os.environ["POOL_MAX_USES"]))
+
+
+def pool_max_rss_mb():
+    """
+    Set environment variable 'POOL_MAX_RSS_MB' to recycle pooled browsers
+    while the browser processes use more than this much memory.
+
+    :return: int with memory limit in MB, or None if not set (no limit)
+    """
+    if "POOL_MAX_RSS_MB" not in os.environ:
+        return None
+    return int(os.environ["POOL_MAX_RSS_MB"])
+
+
+def session_dir():
+    """
+    Set environment variable 'SESSION_DIR' to change where saved per-location
+    browser sessions (cookies and localStorage) are kept.
+
+    :return: str with path to session directory
+    """
+    return os.environ["SESSION_DIR"] if "SESSION_DIR" in os.environ else "sessions.no-git"
+
+
+def session_ttl_hours():
+    """
+    Set environment variable 'SESSION_TTL_HOURS' to change how long a saved
+    per-location session is trusted before set_location runs again.
+
+    :return: float with session lifetime in hours
+    """
+    if "SESSION_TTL_HOURS" not in os.environ:
+        return 24.0
+    return float(os.environ["SESSION_TTL_HOURS"])
+
+
+def request_filtering():
+    """
+    Set environment variable 'REQUEST_FILTERING' to "false" to load product
+    pages with every resource instead of applying ROUTING_RULES.
+
+    On by default, knowing it costs the pool's warm http cache: playwright
+    turns the cache off for a page once it has a route, and there is no
+    route-free way to block by resource type. Blocking images, media and
+    trackers saves more per product page than caching the site's scripts
+    and stylesheets, and keeps third party beacons (which are never cached
+    anyway) from firing at all. Compare log_route_stats and trace p50s
+    against a run with this off before changing the default.
+
+    :return: bool - True if requests should be filtered
+    """
+    return os.environ["REQUEST_FILTERING"] != "false" if "REQUEST_FILTERING" in os.environ else True
+
+
+def xhr_capture():
+    """
+    Set environment variable 'XHR_CAPTURE' to "true" to build product data
+    from the store's json api responses instead of the rendered page. Off by
+    default until the parsers' PRODUCT_API_RE patterns have been checked against
+    real traffic, since a pattern that never matches costs every product page
+    the whole xhr_capture_timeout().
+
+    :return: bool - True if api responses should be used when available
+    """
+    return os.environ["XHR_CAPTURE"] == "true" if "XHR_CAPTURE" in os.environ else False
+
+
+def xhr_capture_timeout():
+    """
+    Set environment variable 'XHR_CAPTURE_TIMEOUT' to change how many seconds
+    to wait for a product api response before scraping the page instead.
+
+    :return: float with timeout in seconds
+    """
+    if "XHR_CAPTURE_TIMEOUT" not in os.environ:
+        return 2.0
+    return float(os.environ["XHR_CAPTURE_TIMEOUT"])
+
+
+def har_mode():
+    """
+    Set environment variable 'HAR_MODE' to record every request a scrape makes
+    to HAR files, or to replay a scrape from them without touching the network.
+
+    :return: str with har mode ("off"|"record"|"replay")
+    """
+    har_mode = os.environ["HAR_MODE"] if "HAR_MODE" in os.environ else "off"
+    return har_mode if har_mode in ["record", "replay"] else "off"
+
+
+def har_dir():
+    """
+    Set environment variable 'HAR_DIR' to change where recorded HAR files go.
+
+    :return: str with path to har directory
+    """
+    return os.environ["HAR_DIR"] if "HAR_DIR" in os.environ else "har.no-git"
+
+
+def save_snapshots():
+    """
+    Set environment variable 'SAVE_SNAPSHOTS' to "true" to save the html of
+    every product page scraped, for benchmark.py and offline re-parsing.
+
+    :return: bool - True if product page html should be saved
+    """
+    return os.environ["SAVE_SNAPSHOTS"] == "true" if "SAVE_SNAPSHOTS" in os.environ else False
+
+
+def snapshot_dir():
+    """
+    Set environment variable 'SNAPSHOT_DIR' to change where product page html
+    snapshots are kept.
+
+    :return: str with path to snapshot directory
+    """
+    return os.environ["SNAPSHOT_DIR"] if "SNAPSHOT_DIR" in os.environ else "snapshots.no-git"
+
+
+def item_group(url):
+    """
+    Look up which item group a product url belongs to.
+
+    :param url: product page url
+
+    :return: str with item group name, or None if the url isn't in ITEM_GROUPS
+    """
+    for group, urls in ITEM_GROUPS.items():
+        if url in urls:
+            return group
+    return None
+
+
+def history_db():
+    """
+    Set environment variable 'HISTORY_DB' to change where the price history
+    sqlite database is kept.
+
+    :return: str with path to sqlite database
+    """
+    return os.environ["HISTORY_DB"] if "HISTORY_DB" in os.environ else "history.no-git.sqlite"
+
+
+def rescrape_planning():
+    """
+    Set environment variable 'RESCRAPE_PLANNING' to "false" to visit every
+    product url on every run instead of only the ones that are due.
+
+    :return: bool - True if only due urls should be scraped
+    """
+    return os.environ["RESCRAPE_PLANNING"] != "false" if "RESCRAPE_PLANNING" in os.environ else True
+
+
+def rescrape_min_hours():
+    """
+    Set environment variable 'RESCRAPE_MIN_HOURS' to change the shortest time
+    between two scrapes of the same product, no matter how often it changes.
+
+    :return: float with minimum re-scrape interval in hours
+    """
+    if "RESCRAPE_MIN_HOURS" not in os.environ:
+        return 6.0
+    return float(os.environ["RESCRAPE_MIN_HOURS"])
+
+
+def rescrape_max_hours():
+    """
+    Set environment variable 'RESCRAPE_MAX_HOURS' to change the longest time
+    a product can go without being scraped, even if it never changes.
+
+    :return: float with maximum re-scrape interval in hours
+    """
+    if "RESCRAPE_MAX_HOURS" not in os.environ:
+        return 7 * 24.0
+    return float(os.environ["RESCRAPE_MAX_HOURS"])
+
+
+def tracing_enabled():
+    """
+    Set environment variable 'TRACING' to "true" to time every step of a
+    scrape and write a per-run summary to trace_file().
+
+    :return: bool - True if spans should be recorded
+    """
+    return os.environ["TRACING"] == "true" if "TRACING" in os.environ else False
+
+
+def trace_file():
+    """
+    Set environment variable 'TRACE_FILE' to change where the per-run timing
+    summary is written.
+
+    :return: str with path to trace json file
+    """
+    return os.environ["TRACE_FILE"] if "TRACE_FILE" in os.environ else "trace.no-git.json"
+
+
+def log_format():
+    """
+    Set environment variable 'LOG_FORMAT' to "json" to write one json object
+    per log line, with fields like store, sku, url and duration broken out.
+
+    :return: str with log format ("text"|"json")
+    """
+    log_format = os.environ["LOG_FORMAT"] if "LOG_FORMAT" in os.environ else "text"
+    return "json" if log_format == "json" else "text"
+
+
+def scrape_workers():
+    """
+    Set environment variable 'SCRAPE_WORKERS' to split the product urls in
+    scrape mode across this many worker processes, each with its own browser.
+
+    :return: int with number of worker processes, 1 to scrape in this process
+    """
+    if "SCRAPE_WORKERS" not in os.environ:
+        return 1
+    return max(1, int(os.environ["SCRAPE_WORKERS"]))
+
+
+def worker_max_restarts():
+    """
+    Set environment variable 'WORKER_MAX_RESTARTS' to change how many times
+    crashed scrape worker processes are replaced before the run gives up on
+    the urls they didn't finish.
+
+    :return: int with number of restarts allowed per run
+    """
+    if "WORKER_MAX_RESTARTS" not in os.environ:
+        return 3
+    return max(0, int(os.environ["WORKER_MAX_RESTARTS"]))
+
+
+def work_queue():
+    """
+    Set environment variable 'WORK_QUEUE' to scrape from a work queue shared
+    with other nodes instead of every node scraping every due url, e.g.
+    "sqlite:///data/queue.sqlite" (see internal/workqueue.py).
+
+    :return: str with work queue url, or None if not set (no queue)
+    """
+    return os.environ["WORK_QUEUE"] if "WORK_QUEUE" in os.environ else None
+
+
+def work_queue_lease_size():
+    """
+    Set environment variable 'WORK_QUEUE_LEASE_SIZE' to change how many urls
+    a node takes from the work queue at a time.
+
+    :return: int with number of urls per lease
+    """
+    if "WORK_QUEUE_LEASE_SIZE" not in os.environ:
+        return 10
+    return max(1, int(os.environ["WORK_QUEUE_LEASE_SIZE"]))
+
+
+def work_queue_visibility_timeout():
+    """
+    Set environment variable 'WORK_QUEUE_VISIBILITY_TIMEOUT' to change how
+    many seconds a node has to finish the urls it leased before they are
+    handed to another node.
+
+    :return: float with lease timeout in seconds
+    """
+    if "WORK_QUEUE_VISIBILITY_TIMEOUT" not in os.environ:
+        return 900.0
+    return float(os.environ["WORK_QUEUE_VISIBILITY_TIMEOUT"])
+
+
+def artifact_dir():
+    """
+    Set environment variable 'ARTIFACT_DIR' to change where screenshots and
+    html of failed or suspicious scrapes are kept.
+
+    :return: str with path to artifact directory
+    """
+    return os.environ["ARTIFACT_DIR"] if "ARTIFACT_DIR" in os.environ else "artifacts.no-git"
+
+
+def artifact_max_mb():
+    """
+    Set environment variable 'ARTIFACT_MAX_MB' to change how much disk the
+    failure artifacts may use before the least recently used are deleted.
+
+    :return: float with size limit in MB, 0 to never capture artifacts
+    """
+    if "ARTIFACT_MAX_MB" not in os.environ:
+        return 200.0
+    return float(os.environ["ARTIFACT_MAX_MB"])
+
+
+def circuit_threshold():
+    """
+    Set environment variable 'CIRCUIT_THRESHOLD' to change how many timeouts
+    or failed extractions in a row make a store's remaining urls be skipped.
+
+    :return: int with number of failures that opens a store's circuit
+    """
+    if "CIRCUIT_THRESHOLD" not in os.environ:
+        return 3
+    return max(1, int(os.environ["CIRCUIT_THRESHOLD"]))
+
+
+def circuit_backoff():
+    """
+    Set environment variable 'CIRCUIT_BACKOFF' to change how many seconds a
+    failing store is left alone before it is tried again. Doubles every time
+    the retry fails too.
+
+    :return: float with first backoff in seconds
+    """
+    if "CIRCUIT_BACKOFF" not in os.environ:
+        return 300.0
+    return float(os.environ["CIRCUIT_BACKOFF"])
+
+
+def circuit_max_backoff():
+    """
+    Set environment variable 'CIRCUIT_MAX_BACKOFF' to cap how long a failing
+    store is left alone.
+
+    :return: float with longest backoff in seconds
+    """
+    if "CIRCUIT_MAX_BACKOFF" not in os.environ:
+        return 6 * 3600.0
+    return float(os.environ["CIRCUIT_MAX_BACKOFF"])
+
+
+def circuit_file():
+    """
+    Set environment variable 'CIRCUIT_FILE' to change where store circuit
+    states are kept between runs.
+
+    :return: str with path to circuit json file
+    """
+    return os.environ["CIRCUIT_FILE"] if "CIRCUIT_FILE" in os.environ else "circuits.no-git.json"
+
+
+def ready_timeout():
+    """
+    Set environment variable 'READY_TIMEOUT' to change how many seconds to
+    wait for a page to show what the next step needs (see
+    internal/readiness.py) before carrying on anyway.
+
+    :return: float with fallback timeout in seconds
+    """
+    if "READY_TIMEOUT" not in os.environ:
+        return 15.0
+    return float(os.environ["READY_TIMEOUT"])
@@ -0,0 +1,62 @@
+import logging
+import os
+
+from .config import *
+
+logger = logging.getLogger(__name__)
+
+
+def har_path(store):
+    """
+    Get the HAR file a store's scrape is recorded to. One file per store
+    covers the storefront, the location dialog and every product url.
+
+    :param store: store name (key in config.PRODUCT_URLS)
+
+    :return: str with path to the har file
+    """
+    return os.path.join(har_dir(), store + ".har")
+
+
+async def install_har(page, store, mode = None):
+    """
+    Record or replay a page's traffic. Has to be installed before any other
+    routes (see routing.install_routes) so those still get a say first.
+
+    In record mode every response is stored in the HAR, which playwright
+    writes out when the context closes. In replay mode every request is
+    answered from the HAR and anything that wasn't recorded is aborted, so
+    nothing goes out to the network.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param mode: override for config.har_mode()
+
+    :return: str with har mode that was applied ("off"|"record"|"replay")
+    """
+    if mode is None:
+        mode = har_mode()
+
+    if mode == "off":
+        return mode
+
+    path = har_path(store)
+    if mode == "record":
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        logger.info("[%s] Recording traffic to %s...", store, path)
+        await page.route_from_har(path, update = True, update_content = "embed")
+    elif mode == "replay":
+        if not os.path.isfile(path):
+            raise ValueError(
+                f"({__name__}.install_har) No recording for {store} at {path}. "
+                f"Run with HAR_MODE=record first"
+            )
+        logger.info("[%s] Replaying traffic from %s...", store, path)
+        await page.route_from_har(path, not_found = "abort")
+    else:
+        raise ValueError(
+            f"({__name__}.install_har) invalid mode parameter. "
+            f"Expecting off, record or replay, received {mode}"
+        )
+
+    return mode
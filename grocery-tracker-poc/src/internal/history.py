@@ -0,0 +1,332 @@
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import sqlite3
+
+from .config import *
+from . import units
+
+logger = logging.getLogger(__name__)
+
+# prices is append only, one row per scraped product whose record changed
+# since the last scrape. latest_prices holds the newest row per (store, sku)
+# so "what does it cost now" never has to scan the history, plus a hash of
+# that record and when it was last seen unchanged
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    id INTEGER PRIMARY KEY,
+    store TEXT NOT NULL,
+    sku TEXT NOT NULL,
+    item_group TEXT,
+    name TEXT,
+    price REAL,
+    availability TEXT,
+    location TEXT,
+    url TEXT,
+    date TEXT NOT NULL,
+    quantity REAL,
+    unit TEXT,
+    unit_price REAL
+);
+CREATE INDEX IF NOT EXISTS prices_store_sku_date ON prices (store, sku, date);
+CREATE INDEX IF NOT EXISTS prices_item_group_date ON prices (item_group, date);
+CREATE INDEX IF NOT EXISTS prices_url_date ON prices (url, date);
+
+CREATE TABLE IF NOT EXISTS latest_prices (
+    store TEXT NOT NULL,
+    sku TEXT NOT NULL,
+    item_group TEXT,
+    name TEXT,
+    price REAL,
+    availability TEXT,
+    location TEXT,
+    url TEXT,
+    date TEXT NOT NULL,
+    quantity REAL,
+    unit TEXT,
+    unit_price REAL,
+    hash TEXT,
+    seen TEXT,
+    PRIMARY KEY (store, sku)
+);
+CREATE INDEX IF NOT EXISTS latest_prices_item_group ON latest_prices (item_group);
+"""
+
+# columns added after the first version of the schema, per table. Older
+# databases get them through ALTER TABLE in migrate()
+ADDED_COLUMNS = {
+    "prices": {
+        "quantity": "REAL",
+        "unit": "TEXT",
+        "unit_price": "REAL",
+    },
+    "latest_prices": {
+        "quantity": "REAL",
+        "unit": "TEXT",
+        "unit_price": "REAL",
+        "hash": "TEXT",
+        "seen": "TEXT",
+    },
+}
+
+# created after migrate() so they never refer to a column that isn't there yet.
+# Ranking an item group by unit price walks this index instead of sorting
+INDEXES = """
+CREATE INDEX IF NOT EXISTS latest_prices_unit_price ON latest_prices (item_group, unit, unit_price);
+"""
+
+# joins each latest_prices row l to the last prices row of its sku from
+# before a cutoff date (the one ? placeholder), see sku_history
+SEED_JOIN = """
+JOIN prices p ON p.store = l.store AND p.sku = l.sku AND p.date = (
+    SELECT MAX(date) FROM prices WHERE store = l.store AND sku = l.sku AND date < ?
+)
+"""
+
+COLUMNS = [
+    "store", "sku", "item_group", "name", "price", "availability", "location", "url", "date",
+    "quantity", "unit", "unit_price",
+]
+
+# what makes two scrapes of a product "the same". date is left out on purpose
+FINGERPRINT_COLUMNS = ["name", "price", "availability", "location", "url", "quantity", "unit"]
+
+# sqlite caps the number of ? in one statement
+LOOKUP_BATCH_SIZE = 400
+
+
+def connect(path = None):
+    """
+    Open the price history database, creating tables and indexes if needed.
+
+    :param path: override for config.history_db()
+
+    :return: sqlite3.Connection with rows returned as sqlite3.Row
+    """
+    if path is None:
+        path = history_db()
+
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+
+    # WAL lets readers query while a scrape is appending
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.executescript(SCHEMA)
+    migrate(conn)
+    conn.executescript(INDEXES)
+    return conn
+
+
+def migrate(conn):
+    """
+    Add any of ADDED_COLUMNS missing from a database made by an older version.
+
+    :param conn: sqlite3.Connection with the tables from SCHEMA
+
+    :return: None
+    """
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, column_type in columns.items():
+            if column not in existing:
+                logger.info("Adding column %s to %s", column, table)
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    conn.commit()
+
+
+def to_row(product):
+    """
+    Flatten a product record into a tuple in COLUMNS order.
+
+    :param product: Product with store, url and date filled in
+
+    :return: tuple ready for executemany
+    """
+    date = product["date"]
+    return (
+        product["store"],
+        str(product["sku"]),
+        product.get("item_group") or item_group(product.get("url")),
+        product.get("name"),
+        product.get("price"),
+        product.get("availability"),
+        product.get("location"),
+        product.get("url"),
+        date.isoformat() if isinstance(date, datetime) else date,
+        product.get("quantity"),
+        product.get("unit"),
+        product.get("unit_price"),
+    )
+
+
+def fingerprint(row):
+    """
+    Hash the parts of a row that matter for change detection.
+
+    :param row: tuple from to_row()
+
+    :return: str with hex digest
+    """
+    values = [row[COLUMNS.index(column)] for column in FINGERPRINT_COLUMNS]
+    return hashlib.blake2b(json.dumps(values).encode(), digest_size = 16).hexdigest()
+
+
+def known_hashes(conn, keys):
+    """
+    Look up the stored fingerprint of every (store, sku) in keys.
+
+    :param conn: connection from connect()
+    :param keys: list of (store, sku)
+
+    :return: dict of (store, sku) -> hash, missing keys were never stored
+    """
+    hashes = {}
+    for i in range(0, len(keys), LOOKUP_BATCH_SIZE):
+        batch = keys[i:i + LOOKUP_BATCH_SIZE]
+        values = ", ".join("(?, ?)" for _ in batch)
+        for row in conn.execute(
+            f"SELECT store, sku, hash FROM latest_prices WHERE (store, sku) IN (VALUES {values})",
+            [value for key in batch for value in key],
+        ):
+            hashes[(row[0], row[1])] = row[2]
+    return hashes
+
+
+def append(conn, products, skip_unchanged = True):
+    """
+    Add a batch of scraped products to the history in one transaction.
+    Products without a sku can't be tracked over time and are skipped.
+
+    A product that looks exactly like its last stored record (same
+    FINGERPRINT_COLUMNS) only bumps latest_prices.seen instead of adding a
+    row, so the history grows with price changes rather than with scrapes.
+    Days without a row are forward filled by analytics.
+
+    :param conn: connection from connect()
+    :param products: list of Product with store, url and date filled in
+    :param skip_unchanged: False to write a row for every product
+
+    :return: int with number of rows written
+    """
+    for product in products:
+        if "unit_price" not in product:
+            units.normalize(product)
+
+    rows = [to_row(product) for product in products if product.get("sku") is not None]
+    if len(rows) < len(products):
+        logger.warning("Skipping %s product(s) with no sku", len(products) - len(rows))
+
+    hashes = [fingerprint(row) for row in rows]
+    known = known_hashes(conn, list({(row[0], row[1]) for row in rows})) if skip_unchanged else {}
+
+    changed = []
+    seen = []
+    for row, row_hash in zip(rows, hashes):
+        key = (row[0], row[1])
+        if skip_unchanged and known.get(key) == row_hash:
+            seen.append((row[COLUMNS.index("date")], key[0], key[1]))
+        else:
+            changed.append(row + (row_hash, row[COLUMNS.index("date")]))
+            known[key] = row_hash
+
+    latest_columns = COLUMNS + ["hash", "seen"]
+    placeholders = ", ".join("?" for _ in COLUMNS)
+    with conn:
+        conn.executemany(
+            f"INSERT INTO prices ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+            [row[:len(COLUMNS)] for row in changed],
+        )
+        conn.executemany(
+            f"INSERT INTO latest_prices ({', '.join(latest_columns)}) "
+            f"VALUES ({', '.join('?' for _ in latest_columns)}) "
+            f"ON CONFLICT (store, sku) DO UPDATE SET "
+            + ", ".join(f"{column} = excluded.{column}" for column in latest_columns[2:])
+            + " WHERE excluded.date >= latest_prices.date",
+            changed,
+        )
+        conn.executemany(
+            "UPDATE latest_prices SET seen = ?1 WHERE store = ?2 AND sku = ?3 AND COALESCE(seen, date) < ?1",
+            seen,
+        )
+
+    logger.info("Wrote %s changed price(s) to history, %s unchanged", len(changed), len(seen))
+    return len(changed)
+
+
+def rank_by_unit_price(conn, item_group, unit = None):
+    """
+    Rank the current prices of an item group across stores, cheapest per
+    unit first. Products with no known size are left out.
+
+    :param conn: connection from connect()
+    :param item_group: item group name (key in config.ITEM_GROUPS)
+    :param unit: only compare this canonical unit (e.g. "lb"), defaults to
+        every unit. Prices in different units aren't comparable, so they are
+        grouped by unit first
+
+    :return: list of sqlite3.Row ordered by unit, then unit_price
+    """
+    query = "SELECT * FROM latest_prices WHERE item_group = ? AND unit_price IS NOT NULL"
+    params = [item_group]
+
+    if unit is not None:
+        query += " AND unit = ?"
+        params.append(unit)
+
+    return conn.execute(query + " ORDER BY unit, unit_price", params).fetchall()
+
+
+def sku_history(conn, store, sku, days = 30, now = None):
+    """
+    Get every price recorded for one sku over the last few days. Unchanged
+    scrapes don't add rows, so if the sku was still seen in the window, the
+    row it was last recorded with before the window comes first: that's the
+    price it started the window at.
+
+    :param conn: connection from connect()
+    :param store: store name
+    :param sku: sku to look up
+    :param days: how far back to go
+    :param now: datetime to count back from, defaults to now
+
+    :return: list of sqlite3.Row, oldest first
+    """
+    since = ((now or datetime.now()) - timedelta(days = days)).isoformat()
+    return conn.execute(
+        f"""
+        SELECT * FROM prices WHERE store = ? AND sku = ? AND date >= ?
+        UNION ALL
+        SELECT p.* FROM latest_prices l {SEED_JOIN}
+        WHERE l.store = ? AND l.sku = ? AND COALESCE(l.seen, l.date) >= ?
+        ORDER BY date
+        """,
+        (store, str(sku), since, since, store, str(sku), since),
+    ).fetchall()
+
+
+def group_history(conn, item_group, days = 30, now = None):
+    """
+    Get every price recorded for an item group, across stores, over the last
+    few days. Like sku_history, every sku still seen in the window starts
+    with the row it was last recorded with before the window.
+
+    :param conn: connection from connect()
+    :param item_group: item group name (key in config.ITEM_GROUPS)
+    :param days: how far back to go
+    :param now: datetime to count back from, defaults to now
+
+    :return: list of sqlite3.Row, oldest first
+    """
+    since = ((now or datetime.now()) - timedelta(days = days)).isoformat()
+    return conn.execute(
+        f"""
+        SELECT * FROM prices WHERE item_group = ? AND date >= ?
+        UNION ALL
+        SELECT p.* FROM latest_prices l {SEED_JOIN}
+        WHERE l.item_group = ? AND COALESCE(l.seen, l.date) >= ?
+        ORDER BY date
+        """,
+        (item_group, since, since, item_group, since),
+    ).fetchall()
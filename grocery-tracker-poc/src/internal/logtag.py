@@ -0,0 +1,177 @@
+import atexit
+from datetime import datetime, timezone
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue
+
+from .config import *
+
+# every line is prefixed with the module and function that logged it, e.g.
+# "[INFO] (internal.pool.acquire) ...". logging already knows both for each
+# record it emits, so call sites don't have to work them out on every call
+FORMAT = "[%(levelname)s] %(tag)s%(message)s"
+
+# attributes every LogRecord has. Anything else on a record came in through
+# extra = {...} and gets its own field in json output
+RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime", "tag"}
+
+
+class TagFormatter(logging.Formatter):
+    """
+    Formatter that fills in %(tag)s with "(module.function) ". Lines logged
+    from module level get no tag.
+    """
+
+    def format(self, record):
+        record.tag = "" if record.funcName == "<module>" else f"({record.name}.{record.funcName}) "
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formatter that writes one json object per line with time, level, logger,
+    function and message, plus any fields passed with extra = {...}, e.g.
+    `logger.info("Scraped %s", url, extra = {"store": store, "url": url})`.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "function": record.funcName,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in record.__dict__.items() if key not in RECORD_ATTRIBUTES})
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default = str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread. The stock one
+    renders the message before queueing it, which is exactly the work we want
+    off the thread driving the browser. Only the queue is touched here.
+    """
+
+    def prepare(self, record):
+        # dicts are often changed right after being logged (a product gets
+        # its store added), so keep a shallow copy of what they were
+        if isinstance(record.args, dict):
+            # logging unpacks a lone dict argument into args itself
+            record.args = dict(record.args)
+        elif record.args:
+            record.args = tuple(dict(arg) if isinstance(arg, dict) else arg for arg in record.args)
+        return record
+
+
+# the QueueListener writing this process's log lines, see stop_listener()
+listener = None
+
+
+def start_listener(log_queue, handler):
+    """
+    Start a background thread that writes queued records with handler.
+
+    :param log_queue: queue the root logger's DeferredQueueHandler puts into
+    :param handler: logging.Handler that does the actual writing
+
+    :return: started QueueListener
+    """
+    global listener
+    listener = QueueListener(log_queue, handler, respect_handler_level = True)
+    listener.start()
+    return listener
+
+
+def stop_listener():
+    """
+    Write out every queued record and stop the listener thread. Runs at exit
+    on its own, but multiprocessing children leave through os._exit, which
+    skips atexit (and bootstrap drops any multiprocessing.util.Finalize
+    registered before the target runs), so a child process has to call this
+    itself before returning or its last lines are lost.
+
+    :return: None
+    """
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def setup(level = logging.INFO, json_logs = None):
+    """
+    Configure the root logger for entry point scripts, in place of
+    logging.basicConfig. Records are put on an in-memory queue and formatted
+    and written by a background thread, so a slow terminal or log pipe never
+    stalls the caller. Messages should use %-style args rather than f-strings
+    so lines below the log level are never formatted at all.
+
+    :param level: minimum level to print
+    :param json_logs: True for one json object per line, defaults to
+        config.log_format() == "json"
+
+    :return: None
+    """
+    if json_logs is None:
+        json_logs = log_format() == "json"
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if json_logs else TagFormatter(FORMAT))
+
+    queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+    start_listener(queue_handler.queue, handler)
+    atexit.register(stop_listener)
+    logging.basicConfig(level = level, handlers = [queue_handler])
+
+    def after_fork():
+        # a forked child gets a copy of the queue but not the thread reading
+        # it. The copy still holds whatever the parent hadn't written yet,
+        # which the parent writes itself, so the child starts on a new queue
+        queue_handler.queue = queue.SimpleQueue()
+        start_listener(queue_handler.queue, handler)
+
+    os.register_at_fork(after_in_child = after_fork)
+
+
+if __name__ == "__main__":
+    # micro-benchmark: what the old per-call tag cost compared to letting
+    # logging fill it in. Run with `python -m internal.logtag` from src
+    import inspect
+    import io
+    import timeit
+
+    logger = logging.getLogger("logtag.benchmark")
+    logger.propagate = False
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(TagFormatter(FORMAT))
+    logger.addHandler(handler)
+
+    def old_tag(depth):
+        if depth:
+            return old_tag(depth - 1)
+        tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
+        logger.debug(f"({tag}) message")
+
+    def new_tag(depth):
+        if depth:
+            return new_tag(depth - 1)
+        logger.debug("message")
+
+    # a parser call sits about 20 frames deep under asyncio and playwright
+    for depth in [0, 20]:
+        for level, name in [(logging.INFO, "disabled"), (logging.DEBUG, "enabled")]:
+            logger.setLevel(level)
+            number = 2000
+            old = timeit.timeit(lambda: old_tag(depth), number = number) / number
+            new = timeit.timeit(lambda: new_tag(depth), number = number) / number
+            print(
+                f"depth {depth:2}, log line {name:8}: inspect.stack() tag {old * 1e6:8.1f} us/call, "
+                f"formatter tag {new * 1e6:6.2f} us/call ({old / new:.0f}x)"
+            )
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+from playwright.async_api import async_playwright
+from playwright_stealth import Stealth
+import time
+
+from . import artifacts, readiness, tracing
+from .circuit import CircuitBreaker
+from .config import *
+from .politeness import PolitenessScheduler
+from .pool import BrowserPool
+
+logger = logging.getLogger(__name__)
+
+
+def run(scrapers, urls = None, max_workers = None, launch_config = {}, browser_config = {}):
+    """
+    Blocking entry point for run_stores. Spins up an event loop and an async
+    playwright instance and tears both down when every store is done.
+
+    :param scrapers: dict of store name -> coroutine function taking
+        (page, urls, scheduler, on_product, breaker) and returning a list of product dicts
+    :param urls: dict of store name -> list of product urls. Stores missing
+        from it fall back to config.PRODUCT_URLS
+    :param max_workers: how many stores to scrape at once. Defaults to
+        config.max_concurrency()
+    :param launch_config: dictionary with playwright launch config parameters
+    :param browser_config: dictionary with playwright browser context parameters
+
+    :return: list of product dicts from every store, each tagged with "store"
+    """
+    async def main():
+        async with Stealth().use_async(async_playwright()) as p:
+            return await run_stores(p, scrapers, urls, max_workers, launch_config, browser_config)
+
+    return asyncio.run(main())
+
+
+async def run_stores(playwright, scrapers, urls = None, max_workers = None, launch_config = {}, browser_config = {}):
+    """
+    Scrape several stores at the same time and merge the results, in a
+    Session that only lasts for this one call.
+
+    :param playwright: async playwright instance
+    :param scrapers: dict of store name -> coroutine function taking
+        (page, urls, scheduler, on_product, breaker) and returning a list of product dicts
+    :param urls: dict of store name -> list of product urls. Stores missing
+        from it fall back to config.PRODUCT_URLS
+    :param max_workers: how many stores to scrape at once. Defaults to
+        config.max_concurrency()
+    :param launch_config: dictionary with playwright launch config parameters
+    :param browser_config: dictionary with playwright browser context parameters
+
+    :return: list of product dicts from every store, each tagged with "store"
+    """
+    session = Session(playwright, len(scrapers), max_workers, launch_config, browser_config)
+    try:
+        await session.start()
+        return await session.scrape(scrapers, urls)
+    finally:
+        await session.close()
+
+
+class Session:
+    """
+    Warm browser pool, with the politeness scheduler and circuit breaker that
+    go with it, kept for as many scrapes as the caller needs. A node working
+    through the work queue scrapes every leased batch in one session, so
+    browsers, contexts (and the store locations set in them) and site pacing
+    carry over from one batch to the next.
+    """
+
+    def __init__(self, playwright, stores, max_workers = None, launch_config = {}, browser_config = {}):
+        """
+        :param playwright: async playwright instance
+        :param stores: most stores a single scrape() call gets
+        :param max_workers: how many stores to scrape at once. Defaults to
+            config.max_concurrency()
+        :param launch_config: dictionary with playwright launch config parameters
+        :param browser_config: dictionary with playwright browser context parameters
+        """
+        if max_workers is None:
+            max_workers = max_concurrency()
+
+        # the pool size doubles as the concurrency limit, a store can't start
+        # until it gets a context
+        self.pool = BrowserPool(
+            playwright = playwright,
+            size = max(1, min(max_workers, stores)),
+            launch_config = launch_config,
+            browser_config = browser_config,
+            max_uses = pool_max_uses(),
+            max_rss_mb = pool_max_rss_mb(),
+        )
+
+        # one scheduler for the whole session, so stores that share a site
+        # also share its pacing. Nothing to be polite to when replaying a HAR
+        # file
+        self.scheduler = PolitenessScheduler(enabled = har_mode() != "replay")
+        self.breaker = CircuitBreaker()
+
+    async def start(self):
+        """
+        Launch every browser in the pool up front.
+
+        :return: self, so this can be chained off the constructor
+        """
+        await self.pool.start()
+        return self
+
+    async def scrape(self, scrapers, urls = None):
+        """
+        Scrape several stores at the same time and merge the results. Every
+        store checks its own context out of the pool, all driven from the
+        same event loop, so total wall time is roughly the slowest store
+        instead of the sum of all of them.
+
+        :param scrapers: dict of store name -> coroutine function taking
+            (page, urls, scheduler, on_product, breaker) and returning a list of product dicts
+        :param urls: dict of store name -> list of product urls. Stores
+            missing from it fall back to config.PRODUCT_URLS
+
+        :return: list of product dicts from every store, each tagged with "store"
+        """
+        if not isinstance(scrapers, dict):
+            raise ValueError(
+                f"({__name__}.Session.scrape) invalid scrapers parameter. Expecting type dict, "
+                f"received {type(scrapers)} instead"
+            )
+
+        if urls is None:
+            urls = {}
+
+        if self.pool.exhausted:
+            raise RuntimeError(f"({__name__}.Session.scrape) No browsers left in the pool!")
+
+        logger.info("Scraping %s store(s), at most %s at a time...", len(scrapers), self.pool.size)
+        start_time = time.monotonic()
+
+        try:
+            results = await asyncio.gather(*[
+                run_store(
+                    self.pool, store, scraper, urls.get(store, PRODUCT_URLS[store]), self.scheduler,
+                    breaker = self.breaker,
+                )
+                for store, scraper in scrapers.items()
+            ])
+        finally:
+            await artifacts.flush()
+
+            # right away rather than at close(), so other nodes and later
+            # runs see a store that started failing
+            self.breaker.save()
+
+        products = [product for store_products in results for product in store_products]
+
+        logger.info(
+            "Collected %s product(s) in %.1f seconds", len(products), time.monotonic() - start_time,
+        )
+        return products
+
+    async def close(self):
+        """
+        Shut the browsers down and log the stats of every scrape in the
+        session.
+        """
+        await self.pool.close()
+
+        self.scheduler.log_stats()
+        readiness.log_stats()
+        tracing.export()
+
+
+async def run_store(pool, store, scraper, urls, scheduler, on_product = None, breaker = None):
+    """
+    Scrape a single store in a context from the browser pool. Errors are
+    logged instead of raised so one broken store does not throw away the
+    results of the others.
+
+    :param pool: started BrowserPool to check a context out of
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param scraper: coroutine function taking (page, urls, scheduler,
+        on_product, breaker) and returning a list of product dicts
+    :param urls: list of product urls to pass to the scraper
+    :param scheduler: PolitenessScheduler shared by every store in the run
+    :param on_product: function called with every product dict as soon as it
+        is scraped, before the store is done. None to only return them
+    :param breaker: CircuitBreaker shared by every store in the run,
+        defaults to a new one
+
+    :return: list of product dicts, each tagged with "store"
+    """
+    if breaker is None:
+        breaker = CircuitBreaker()
+
+    # don't even check a browser out for a store that is failing
+    if not breaker.allow(store):
+        logger.warning("[%s] circuit is open, deferring %s url(s)", store, len(urls), extra = {"store": store})
+        return []
+
+    logger.info("[%s] starting %s url(s)...", store, len(urls))
+    start_time = time.monotonic()
+
+    products = []
+    try:
+        with tracing.span("store", store = store):
+            async with pool.context() as context:
+                page = await context.new_page()
+                try:
+                    products = await scraper(
+                        page, urls, scheduler = scheduler, on_product = on_product, breaker = breaker
+                    )
+                except Exception as e:
+                    breaker.record_failure(store, f"{type(e).__name__}: {e}")
+
+                    # grab the page before the pool closes it
+                    await artifacts.capture(page, store, page.url, f"{type(e).__name__}: {e}")
+                    raise
+    except Exception:
+        logger.exception("[%s] scrape failed!", store)
+
+    for product in products:
+        product["store"] = store
+
+    duration = time.monotonic() - start_time
+    logger.info(
+        "[%s] finished with %s product(s) in %.1f seconds", store, len(products), duration,
+        extra = {"store": store, "products": len(products), "duration": duration},
+    )
+    return products
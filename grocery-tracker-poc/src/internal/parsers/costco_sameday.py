@@ -1,15 +1,87 @@
-import inspect
 import logging
 import playwright
 from playwright.sync_api import expect, Page
 import re
 
+from ..capture import find_dicts, find_value
+from .. import readiness, tracing
+from ..product import Product
+
 DEFAULT_ZIPCODE = "94041"
 STOREFRONT_URL = "https://sameday.costco.com"
 
 logger = logging.getLogger(__name__)
 extract_price_re = re.compile(r"Current price:\s+\$(?P<price>[0-9]+\.[0-9]{2})")
+product_id_re = re.compile(r"/products/(?P<product_id>[0-9]+)")
+json_price_re = re.compile(r"\$(?P<price>[0-9]+\.[0-9]{2})")
+
+# sameday is instacart under the hood, product pages are filled in from
+# graphql item queries
+PRODUCT_API_RE = re.compile(r"/graphql\?.*operationName=(Items|ItemDetail|Item)")
+
+# pulls the raw text of every product field in one page.evaluate call instead
+# of one round trip per locator. Mirrors the selectors in the get_product_*
+# functions below. Returns null if the page doesn't look like a product page.
+EXTRACT_PRODUCT_JS = """() => {
+    const details = document.getElementById("item_details");
+    const content = details ? details.querySelectorAll("div")[1] : null;
+    if (!content) return null;
+
+    const text = (element) => element ? element.innerText : null;
+    const visible = (element) => element.getClientRects().length > 0;
+
+    // innermost div that mentions "Item:", same as the div:text() selector
+    const sku = Array.from(content.querySelectorAll("div"))
+        .filter((div) => div.innerText.includes("Item:"))
+        .pop();
+
+    const price = Array.from(content.querySelectorAll("span:not(.screen-reader-only)"))
+        .find((span) => span.innerText.includes("Current price") && visible(span));
+
+    let availability = null;
+    if (content.innerText.includes("Out of stock")) {
+        // selecting random gibberish class, but it seems to be the easiest way for now...
+        availability = text(content.querySelector("div.e-i9gxme"));
+    } else {
+        availability = text(content.querySelector("div.e-pftdsf"));
+    }
+
+    return {
+        name: text(content.querySelector("h1")),
+        sku: sku ? sku.innerText.replace("Item: ", "") : null,
+        price: text(price),
+        availability: availability,
+    };
+}"""
+
+def delivery_button(page):
+    """
+    Locator for the delivery address button, which shows up once the
+    storefront is usable. Works with sync and async pages.
+
+    :param page: playwright Page
+
+    :return: playwright Locator
+    """
+    return page.get_by_role("button").filter(has_text="Delivery").first
+
+
+def location_banner(page, street_address, zipcode):
+    """
+    Locator for the delivery address button once it shows the given address,
+    the same check is_location_set does. Works with sync and async pages.
+
+    :param page: playwright Page
+    :param street_address: string of the street address that should be set
+    :param zipcode: string of the zipcode that should be set
 
+    :return: playwright Locator
+    """
+    address_re = re.compile(f"{re.escape(street_address)}|{re.escape(str(zipcode))}", re.IGNORECASE)
+    return page.get_by_role("button").filter(has_text="Delivery").filter(has_text=address_re).first
+
+
+@tracing.traced
 def navigate_to_storefront(page: Page, storefront_url = STOREFRONT_URL):
     """
     Navigate a playwright browser to the store front so that it is ready for
@@ -21,37 +93,39 @@ def navigate_to_storefront(page: Page, storefront_url = STOREFRONT_URL):
 
     :return: None
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     if not isinstance(page, Page):
         raise ValueError(
-            f"({tag}) page parameter is invalid. Expecting type playwright.sync_api.Page, "
+            f"({__name__}.navigate_to_storefront) page parameter is invalid. "
+            f"Expecting type playwright.sync_api.Page, "
             f"instead received {type(page)}"
         )
 
-    logger.info(f"({tag}) Browsing to {storefront_url}...")
+    logger.info("Browsing to %s...", storefront_url)
     page.goto(storefront_url)
 
     # if this is a completely new user, costco may show an address select
     # box before sending you to a storefront
     if page.get_by_placeholder("Enter ZIP Code").is_visible():
-        logger.info(f"({tag}) Zip code landing page detected...")
+        logger.info("Zip code landing page detected...")
         page.get_by_placeholder("Enter ZIP Code").fill(DEFAULT_ZIPCODE)
 
         submit_btn = page.get_by_role("button").filter(has_text="Start Shopping")
         if submit_btn.is_visible():
-            logger.info(f"({tag}) Clicking through zip code landing page...")
+            logger.info("Clicking through zip code landing page...")
             submit_btn.click()
 
-        page.wait_for_load_state("networkidle")
+        readiness.wait_until_sync(
+            "storefront", lambda timeout: delivery_button(page).wait_for(timeout=timeout)
+        )
 
     # dismiss modal notification if present
     modal_notification = page.get_by_role("button").filter(has_text="Start Shopping")
     if modal_notification.is_visible():
-        logger.info(f"({tag}) TOS modal detected. Dismissing modal...")
+        logger.info("TOS modal detected. Dismissing modal...")
         modal_notification.click()
 
 
+@tracing.traced
 def set_location(page: Page, street_address, zipcode):
     """
     Sets the location using the in-page store locator dialog.
@@ -62,39 +136,159 @@ def set_location(page: Page, street_address, zipcode):
 
     :return: None
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     if not isinstance(page, Page):
         raise ValueError(
-            f"({tag}) page parameter is invalid. Expecting type playwright.sync_api.Page, "
+            f"({__name__}.set_location) page parameter is invalid. "
+            f"Expecting type playwright.sync_api.Page, "
             f"instead received {type(page)}"
         )
 
-    logger.info(f"({tag}) Setting location to {street_address + ' ' + str(zipcode)}...")
+    logger.info("Setting location to %s...", street_address + " " + str(zipcode))
 
-    logger.info(f"({tag}) Waiting for delivery address box to load...")
+    logger.info("Waiting for delivery address box to load...")
     expect(page.get_by_role("button").filter(has_text="Delivery")).to_be_visible(timeout=30000)
 
     set_address_modal = page.get_by_role("button").filter(has_text="Delivery")
     expect(set_address_modal).to_be_enabled()
-    logger.info(f"({tag}) Opening delivery address box modal...")
+    logger.info("Opening delivery address box modal...")
     set_address_modal.click()
 
-    logger.info(f"({tag}) Filling out street address for " + street_address)
+    logger.info("Filling out street address for " + street_address)
     page.get_by_role("button").filter(has_text="Edit").click()
     page.locator("id=streetAddress").fill(street_address + ", " + zipcode)
     page.locator("id=address-suggestion-list_0").get_by_role("button").click()
 
     address_submit_btn = page.get_by_role("button").filter(has_text="Save Address")
     expect(address_submit_btn).to_be_enabled()
-    logger.info(f"({tag}) Saving address...")
+    logger.info("Saving address...")
     address_submit_btn.click()
 
-    logger.info(f"({tag}) Waiting for page to update with address info...")
-    page.wait_for_load_state("networkidle")
-    logger.info(f"({tag}) Page refresh done!")
+    logger.info("Waiting for page to update with address info...")
+    readiness.wait_until_sync(
+        "location_banner",
+        lambda timeout: location_banner(page, street_address, zipcode).wait_for(timeout=timeout),
+    )
+    logger.info("Page refresh done!")
+
+
+@tracing.traced
+def extract_product(page: Page) -> Product:
+    """
+    Parse every product field from a product page in a single round trip to
+    the browser. Falls back to the per-field get_product_* functions if the
+    page isn't laid out the way we expect.
+
+    :param page: valid handle to playwright.sync_api.Page to control browser
+
+    :return: Product with name, sku, price and availability
+    """
+    fields = page.evaluate(EXTRACT_PRODUCT_JS)
+    if fields is None or fields["name"] is None:
+        logger.warning("Batch extraction failed, falling back to per-field extraction...")
+        return {
+            "name": get_product_name(page),
+            "sku": get_product_inventory_number(page),
+            "price": get_product_price(page),
+            "availability": get_product_availability(page),
+        }
+
+    product = make_product(fields)
+    logger.info("Found product: %s", product)
+    return product
+
+
+def make_product(fields) -> Product:
+    """
+    Turn the raw strings returned by EXTRACT_PRODUCT_JS into a Product.
+
+    :param fields: dict with raw name, sku, price and availability strings
+
+    :return: Product
+    """
+    return {
+        "name": fields["name"],
+        "sku": fields["sku"],
+        "price": parse_price(fields["price"]) if fields["price"] is not None else None,
+        "availability": fields["availability"],
+    }
+
+
+def parse_price(price_text):
+    """
+    Pull the dollar amount out of the price label text.
+
+    :param price_text: str like "Current price: $8.99"
+
+    :return: float with product price
+    """
+    try:
+        product_price_extract = extract_price_re.search(price_text)
+        return float(product_price_extract.group("price"))
+    except (AttributeError, IndexError):
+        raise ValueError(
+            f"({__name__}.parse_price) Could not extract item price. Item Price not formatted as"
+            f"expected! -> '" + str(price_text) + "'"
+        )
+
+
+def product_id_from_url(url):
+    """
+    Get the product id out of a product page url.
+
+    :param url: str like ".../products/18876359-strawberries-2-lbs-2-lb"
+
+    :return: str with product id, or None if the url isn't a product page
+    """
+    match = product_id_re.search(url)
+    return match.group("product_id") if match else None
+
+
+def is_product_response(url):
+    """
+    Check if a network response could hold product data.
+
+    :param url: str with response url
+
+    :return: bool - True if the response should be parsed with product_from_json
+    """
+    return PRODUCT_API_RE.search(url) is not None
+
+
+def product_from_json(payload, product_id) -> Product:
+    """
+    Build a product record from an item api payload.
+
+    :param payload: decoded json from a response matching PRODUCT_API_RE
+    :param product_id: str with the product id from the page url
+
+    :return: Product, or None if the payload doesn't describe this product
+    """
+    if product_id is None:
+        return None
+
+    def is_item(node):
+        return "name" in node and (
+            str(node.get("productId", "")) == product_id
+            or str(node.get("id", "")).endswith("-" + product_id)
+        )
+
+    item = next(find_dicts(payload, is_item), None)
+    if item is None:
+        return None
+
+    price_text = find_value(item.get("price", {}), ["priceString", "fullPriceString"])
+    price_match = json_price_re.search(price_text) if isinstance(price_text, str) else None
 
+    return {
+        "name": item["name"],
+        "sku": str(find_value(item, ["retailerReferenceCode", "productId"]) or product_id),
+        "price": float(price_match.group("price")) if price_match else None,
+        "availability": find_value(item.get("availability", {}), ["stockLevelLabelString"]),
+        "size": item.get("size") if isinstance(item.get("size"), str) else None,
+    }
 
+
+@tracing.traced
 def get_product_name(page):
     """
     Parse the product name from a product page.
@@ -103,14 +297,13 @@ def get_product_name(page):
 
     :return: str with product name
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     content = page.locator("id=item_details").locator("div").nth(1)
     product_name = content.locator("h1").inner_text()
-    logger.info(f"({tag}) Found product name: {product_name}")
+    logger.info("Found product name: %s", product_name)
     return product_name
 
 
+@tracing.traced
 def get_product_inventory_number(page):
     """
     Parse the product inventory number.
@@ -119,8 +312,6 @@ def get_product_inventory_number(page):
 
     :return: str with inventory number
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     content = page.locator("id=item_details").locator("div").nth(1)
     product_inventory_number = (
         content
@@ -129,10 +320,11 @@ def get_product_inventory_number(page):
             .replace("Item: ", "")
     )
 
-    logger.info(f"({tag}) Found product inventory number: {product_inventory_number}")
+    logger.info("Found product inventory number: %s", product_inventory_number)
     return product_inventory_number
 
 
+@tracing.traced
 def get_product_price(page):
     """
     Parse the price of the product.
@@ -141,8 +333,6 @@ def get_product_price(page):
 
     :return: float with product price, or None if none available
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     content = page.locator("id=item_details").locator("div").nth(1)
 
     if not (
@@ -151,7 +341,7 @@ def get_product_price(page):
             .filter(has_text="Current price")
             .is_visible()
     ):
-        logger.info(f"({tag}) No pricing data on this page!")
+        logger.info("No pricing data on this page!")
         return None
 
     product_price = (
@@ -161,19 +351,13 @@ def get_product_price(page):
             .inner_text()
     )
 
-    try:
-        product_price_extract = extract_price_re.search(product_price)
-        product_price = float(product_price_extract.group("price"))
-    except IndexError:
-        raise ValueError(
-            f"({tag}) Could not extract item price. Item Price not formatted as"
-            f"expected! -> '" + str(product_price) + "'"
-        )
+    product_price = parse_price(product_price)
 
-    logger.info(f"({tag}) Found product price: {product_price}")
+    logger.info("Found product price: %s", product_price)
     return product_price
 
 
+@tracing.traced
 def get_product_availability(page):
     """
     Parse any product availability messages, if exists.
@@ -182,8 +366,6 @@ def get_product_availability(page):
 
     :return: str with availability string, or None if doesn't exist
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     product_availability = None
     content = page.locator("id=item_details").locator("div").nth(1)
     if content.filter(has_text="Out of stock").count() > 0:
@@ -193,8 +375,8 @@ def get_product_availability(page):
         product_availability = content.locator("div.e-pftdsf").inner_text()
 
     if product_availability != None:
-        logger.info(f"({tag}) Found product availability: '{product_availability}'")
+        logger.info("Found product availability: '%s'", product_availability)
     else:
-        logger.info(f"({tag}) Product availability information not available...")
+        logger.info("Product availability information not available...")
 
     return product_availability
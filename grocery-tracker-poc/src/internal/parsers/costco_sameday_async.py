@@ -0,0 +1,260 @@
+import asyncio
+import logging
+from playwright.async_api import expect, Page
+
+from .. import readiness, tracing
+from ..product import Product
+from .costco_sameday import (
+    DEFAULT_ZIPCODE, EXTRACT_PRODUCT_JS, STOREFRONT_URL, delivery_button, location_banner, make_product, parse_price,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@tracing.traced
+async def navigate_to_storefront(page: Page, storefront_url = STOREFRONT_URL):
+    """
+    Navigate a playwright browser to the store front so that it is ready for
+    further operations. This involves dismissing any modal pop-ups and anything
+    else that must be done before reaching the index.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param storefront_url: leave blank for costco sameday index
+
+    :return: None
+    """
+    if not isinstance(page, Page):
+        raise ValueError(
+            f"({__name__}.navigate_to_storefront) page parameter is invalid. "
+            f"Expecting type playwright.async_api.Page, "
+            f"instead received {type(page)}"
+        )
+
+    logger.info("Browsing to %s...", storefront_url)
+    await page.goto(storefront_url)
+
+    # if this is a completely new user, costco may show an address select
+    # box before sending you to a storefront
+    if await page.get_by_placeholder("Enter ZIP Code").is_visible():
+        logger.info("Zip code landing page detected...")
+        await page.get_by_placeholder("Enter ZIP Code").fill(DEFAULT_ZIPCODE)
+
+        submit_btn = page.get_by_role("button").filter(has_text="Start Shopping")
+        if await submit_btn.is_visible():
+            logger.info("Clicking through zip code landing page...")
+            await submit_btn.click()
+
+        await readiness.wait_until(
+            "storefront", lambda timeout: delivery_button(page).wait_for(timeout=timeout)
+        )
+
+    # dismiss modal notification if present
+    modal_notification = page.get_by_role("button").filter(has_text="Start Shopping")
+    if await modal_notification.is_visible():
+        logger.info("TOS modal detected. Dismissing modal...")
+        await modal_notification.click()
+
+
+@tracing.traced
+async def set_location(page: Page, street_address, zipcode):
+    """
+    Sets the location using the in-page store locator dialog.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param street_address: string of the street address to use
+    :param zipcode: string of the zipcode to use
+
+    :return: None
+    """
+    if not isinstance(page, Page):
+        raise ValueError(
+            f"({__name__}.set_location) page parameter is invalid. "
+            f"Expecting type playwright.async_api.Page, "
+            f"instead received {type(page)}"
+        )
+
+    logger.info("Setting location to %s...", street_address + " " + str(zipcode))
+
+    logger.info("Waiting for delivery address box to load...")
+    set_address_modal = page.get_by_role("button").filter(has_text="Delivery")
+    await expect(set_address_modal).to_be_visible(timeout=30000)
+    await expect(set_address_modal).to_be_enabled()
+    logger.info("Opening delivery address box modal...")
+    await set_address_modal.click()
+
+    logger.info("Filling out street address for " + street_address)
+    await page.get_by_role("button").filter(has_text="Edit").click()
+    await page.locator("id=streetAddress").fill(street_address + ", " + zipcode)
+    await page.locator("id=address-suggestion-list_0").get_by_role("button").click()
+
+    address_submit_btn = page.get_by_role("button").filter(has_text="Save Address")
+    await expect(address_submit_btn).to_be_enabled()
+    logger.info("Saving address...")
+    await address_submit_btn.click()
+
+    logger.info("Waiting for page to update with address info...")
+    await readiness.wait_until(
+        "location_banner",
+        lambda timeout: location_banner(page, street_address, zipcode).wait_for(timeout=timeout),
+    )
+    logger.info("Page refresh done!")
+
+
+@tracing.traced
+async def is_location_set(page: Page, street_address, zipcode):
+    """
+    Check whether the delivery location is already set, e.g. from restored
+    session cookies. The delivery button shows part of the saved address
+    once one has been picked.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param street_address: string of the street address that should be set
+    :param zipcode: string of the zipcode that should be set
+
+    :return: bool - True if the delivery button shows the address or zipcode
+    """
+    delivery_button = page.get_by_role("button").filter(has_text="Delivery")
+    if await delivery_button.count() == 0:
+        logger.info("No delivery address button on page...")
+        return False
+
+    banner = await delivery_button.first.inner_text()
+    logger.info("Delivery address button says '%s'", banner)
+    return street_address.lower() in banner.lower() or str(zipcode) in banner
+
+
+@tracing.traced
+async def extract_product(page: Page) -> Product:
+    """
+    Parse every product field from a product page in a single round trip to
+    the browser. Falls back to get_product if the page isn't laid out the way
+    we expect.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+
+    :return: Product with name, sku, price and availability
+    """
+    fields = await page.evaluate(EXTRACT_PRODUCT_JS)
+    if fields is None or fields["name"] is None:
+        logger.warning("Batch extraction failed, falling back to per-field extraction...")
+        return await get_product(page)
+
+    product = make_product(fields)
+    logger.info("Found product: %s", product)
+    return product
+
+
+@tracing.traced
+async def get_product(page: Page) -> Product:
+    """
+    Parse every product field from a product page. The individual lookups do
+    not depend on each other, so they are all awaited together.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+
+    :return: Product with name, sku, price and availability
+    """
+    name, sku, price, availability = await asyncio.gather(
+        get_product_name(page),
+        get_product_inventory_number(page),
+        get_product_price(page),
+        get_product_availability(page),
+    )
+
+    return {
+        "name": name,
+        "sku": sku,
+        "price": price,
+        "availability": availability,
+    }
+
+
+@tracing.traced
+async def get_product_name(page: Page):
+    """
+    Parse the product name from a product page.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+
+    :return: str with product name
+    """
+    content = page.locator("id=item_details").locator("div").nth(1)
+    product_name = await content.locator("h1").inner_text()
+    logger.info("Found product name: %s", product_name)
+    return product_name
+
+
+@tracing.traced
+async def get_product_inventory_number(page: Page):
+    """
+    Parse the product inventory number.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+
+    :return: str with inventory number
+    """
+    content = page.locator("id=item_details").locator("div").nth(1)
+    product_inventory_number = (
+        await content
+            .locator("div:text('Item:')")
+            .inner_text()
+    ).replace("Item: ", "")
+
+    logger.info("Found product inventory number: %s", product_inventory_number)
+    return product_inventory_number
+
+
+@tracing.traced
+async def get_product_price(page: Page):
+    """
+    Parse the price of the product.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+
+    :return: float with product price, or None if none available
+    """
+    content = page.locator("id=item_details").locator("div").nth(1)
+    price_label = (
+        content
+            .locator("span:not(.screen-reader-only)")
+            .filter(has_text="Current price")
+    )
+
+    if not await price_label.is_visible():
+        logger.info("No pricing data on this page!")
+        return None
+
+    product_price = parse_price(await price_label.inner_text())
+
+    logger.info("Found product price: %s", product_price)
+    return product_price
+
+
+@tracing.traced
+async def get_product_availability(page: Page):
+    """
+    Parse any product availability messages, if exists.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+
+    :return: str with availability string, or None if doesn't exist
+    """
+    product_availability = None
+    content = page.locator("id=item_details").locator("div").nth(1)
+    out_of_stock_count, availability_count = await asyncio.gather(
+        content.filter(has_text="Out of stock").count(),
+        content.locator("div.e-pftdsf").count(),
+    )
+
+    if out_of_stock_count > 0:
+        # selecting random gibberish class, but it seems to be the easiest way for now...
+        product_availability = await content.locator("div.e-i9gxme").inner_text()
+    elif availability_count > 0:
+        product_availability = await content.locator("div.e-pftdsf").inner_text()
+
+    if product_availability != None:
+        logger.info("Found product availability: '%s'", product_availability)
+    else:
+        logger.info("Product availability information not available...")
+
+    return product_availability
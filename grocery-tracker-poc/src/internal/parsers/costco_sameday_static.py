@@ -0,0 +1,121 @@
+import logging
+from ..product import Product
+from .costco_sameday import make_product, parse_price
+from .static_html import parse, text
+
+logger = logging.getLogger(__name__)
+
+
+def get_content(tree):
+    """
+    Find the product details section, same as
+    locator("id=item_details").locator("div").nth(1) in the browser parser.
+
+    :param tree: selectolax LexborHTMLParser
+
+    :return: selectolax LexborNode, or None if this isn't a product page
+    """
+    divs = tree.css("#item_details div")
+    return divs[1] if len(divs) > 1 else None
+
+
+def extract_product(html) -> Product:
+    """
+    Parse every product field from saved product page html without a
+    browser. Returns the same record as costco_sameday.extract_product.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: Product, or None if the page isn't a product page
+    """
+    tree = parse(html)
+    if get_content(tree) is None:
+        logger.warning("No product details on page!")
+        return None
+
+    return make_product({
+        "name": get_product_name(tree),
+        "sku": get_product_inventory_number(tree),
+        "price": get_product_price_text(tree),
+        "availability": get_product_availability(tree),
+    })
+
+
+def get_product_name(html):
+    """
+    Parse the product name from product page html.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: str with product name, or None if not found
+    """
+    content = get_content(parse(html))
+    return text(content.css_first("h1")) if content is not None else None
+
+
+def get_product_inventory_number(html):
+    """
+    Parse the product inventory number from product page html.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: str with inventory number, or None if not found
+    """
+    content = get_content(parse(html))
+    if content is None:
+        return None
+
+    # innermost div that mentions "Item:", same as the div:text() selector
+    matches = [div for div in content.css("div") if "Item:" in (text(div) or "")]
+    return text(matches[-1]).replace("Item: ", "") if matches else None
+
+
+def get_product_price_text(html):
+    """
+    Find the raw price label text. Hidden labels can't be told apart from
+    visible ones without a browser, so the first one wins.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: str like "Current price: $8.99", or None if there is no price
+    """
+    content = get_content(parse(html))
+    if content is None:
+        return None
+
+    for span in content.css("span:not(.screen-reader-only)"):
+        if "Current price" in (text(span) or ""):
+            return text(span)
+
+    return None
+
+
+def get_product_price(html):
+    """
+    Parse the price of the product from product page html.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: float with product price, or None if none available
+    """
+    price_text = get_product_price_text(html)
+    return parse_price(price_text) if price_text is not None else None
+
+
+def get_product_availability(html):
+    """
+    Parse any product availability messages from product page html.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: str with availability string, or None if doesn't exist
+    """
+    content = get_content(parse(html))
+    if content is None:
+        return None
+
+    if "Out of stock" in (text(content) or ""):
+        # selecting random gibberish class, but it seems to be the easiest way for now...
+        return text(content.css_first("div.e-i9gxme"))
+
+    return text(content.css_first("div.e-pftdsf"))
@@ -1,14 +1,53 @@
-import inspect
 import logging
 import playwright
 from playwright.sync_api import expect
 import re
 
+from ..capture import find_dicts, find_value
+from .. import readiness, tracing
+from ..product import Product
+
 STOREFRONT_URL="https://www.safeway.com"
 
 logger = logging.getLogger(__name__)
 extract_price_re = re.compile(r"Your Price:\s+\$(?P<price>[0-9]+\.[0-9]{2})")
+product_id_re = re.compile(r"product-details\.(?P<product_id>[0-9]+)\.html")
+
+# product detail pages are filled in from the albertsons product xapi
+PRODUCT_API_RE = re.compile(r"/xapi/.*(product|pdp)", re.IGNORECASE)
+
+# pulls the raw text of every product field in one page.evaluate call instead
+# of one round trip per locator. Mirrors the selectors in the get_product_*
+# functions below. Returns null if the page doesn't look like a product page.
+EXTRACT_PRODUCT_JS = """() => {
+    const info = document.querySelector("div.product-info");
+    if (!info) return null;
+
+    const heading = info.querySelector("h1, h2, h3, h4, h5, h6, [role=heading]");
+    const price = document.querySelector("div.product-details__price-box span.sr-only");
+
+    return {
+        name: heading ? heading.innerText : null,
+        sku: heading ? heading.getAttribute("id") : null,
+        price: price ? price.innerText : null,
+        availability: null,
+    };
+}"""
+
+def location_banner(page, zipcode):
+    """
+    Locator for the delivery address banner once it shows the given zipcode,
+    the same check is_location_set does. Works with sync and async pages.
+
+    :param page: playwright Page
+    :param zipcode: string of the zipcode that should be set
+
+    :return: playwright Locator
+    """
+    return page.locator("id=openFulfillmentModalButton").filter(has_text=str(zipcode)).first
+
 
+@tracing.traced
 def navigate_to_storefront(page, storefront_url = STOREFRONT_URL):
     """
     Navigate a playwright browser to the store front so that it is ready for
@@ -20,18 +59,18 @@ def navigate_to_storefront(page, storefront_url = STOREFRONT_URL):
 
     :return: None
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     if not isinstance(page, playwright.sync_api.Page):
         raise ValueError(
-            f"({tag}) page parameter is invalid. Expecting type playwright.sync_api.Page, "
+            f"({__name__}.navigate_to_storefront) page parameter is invalid. "
+            f"Expecting type playwright.sync_api.Page, "
             f"instead received {type(page)}"
         )
 
-    logger.info(f"({tag}) Browsing to {storefront_url}...")
+    logger.info("Browsing to %s...", storefront_url)
     page.goto(storefront_url)
 
 
+@tracing.traced
 def set_location(page, street_address, zipcode):
     """
     Sets the location using the in-page store locator dialog.
@@ -42,20 +81,19 @@ def set_location(page, street_address, zipcode):
 
     :return: None
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     if not isinstance(page, playwright.sync_api.Page):
         raise ValueError(
-            f"({tag}) page parameter is invalid. Expecting type playwright.sync_api.Page, "
+            f"({__name__}.set_location) page parameter is invalid. "
+            f"Expecting type playwright.sync_api.Page, "
             f"instead received {type(page)}"
         )
 
-    logger.info(f"({tag}) Setting location to {street_address + ' ' + str(zipcode)}...")
+    logger.info("Setting location to %s...", street_address + " " + str(zipcode))
 
     # open address selection modal
     # NOTE: only the inner div responds to the click event and not the element
     # that has the button aria role on it...
-    logger.info(f"({tag}) Opening delivery address box modal...")
+    logger.info("Opening delivery address box modal...")
     address_selector = (
         page
             .get_by_role("button")
@@ -78,23 +116,140 @@ def set_location(page, street_address, zipcode):
     address_results = page.locator("div.card-store.row")
     address_target = address_results.filter(has_text=street_address)
     if address_target.count() > 0:
-        logger.info(f"({tag}) Found exact match! Setting address...")
+        logger.info("Found exact match! Setting address...")
         address_target.get_by_role("button", name="Select").click()
     elif address_results.count() > 0:
         logger.info(
-            f"({tag}) Could not find match, using zipcode only! Setting address "
+            "Could not find match, using zipcode only! Setting address "
             f"to {address_results.nth(0).locator('p.body-m').nth(0).inner_text()}..."
         )
         address_results.nth(0).get_by_role("button", name="Select").click()
     else:
-        raise ValueError(f"({tag}) Could not find any store locations on page!")
+        raise ValueError(f"({__name__}.set_location) Could not find any store locations on page!")
 
-    logger.info(f"({tag}) Waiting for page to update with address info...")
+    logger.info("Waiting for page to update with address info...")
     expect(address_selector).to_be_visible(timeout=30000)
-    page.wait_for_load_state("networkidle")
-    logger.info(f"({tag}) Page refresh done!")
+    readiness.wait_until_sync(
+        "location_banner", lambda timeout: location_banner(page, zipcode).wait_for(timeout=timeout)
+    )
+    logger.info("Page refresh done!")
+
+
+@tracing.traced
+def extract_product(page) -> Product:
+    """
+    Parse every product field from a product page in a single round trip to
+    the browser. Falls back to the per-field get_product_* functions if the
+    page isn't laid out the way we expect.
+
+    :param page: valid handle to playwright.sync_api.Page to control browser
+
+    :return: Product with name, sku, price and availability
+    """
+    fields = page.evaluate(EXTRACT_PRODUCT_JS)
+    if fields is None or fields["name"] is None or fields["price"] is None:
+        logger.warning("Batch extraction failed, falling back to per-field extraction...")
+        return {
+            "name": get_product_name(page),
+            "sku": get_product_inventory_number(page),
+            "price": get_product_price(page),
+            "availability": None,
+        }
+
+    product = make_product(fields)
+    logger.info("Found product: %s", product)
+    return product
+
+
+def make_product(fields) -> Product:
+    """
+    Turn the raw strings returned by EXTRACT_PRODUCT_JS into a Product.
+
+    :param fields: dict with raw name, sku, price and availability strings
+
+    :return: Product
+    """
+    return {
+        "name": fields["name"],
+        "sku": fields["sku"],
+        "price": parse_price(fields["price"]) if fields["price"] is not None else None,
+        "availability": fields["availability"],
+    }
+
+
+def parse_price(price_text):
+    """
+    Pull the dollar amount out of the screen reader price text.
 
+    :param price_text: str like "Your Price: $4.99"
 
+    :return: float with product price
+    """
+    try:
+        product_price_extract = extract_price_re.search(price_text)
+        return float(product_price_extract.group("price"))
+    except (AttributeError, IndexError):
+        raise ValueError(
+            f"({__name__}.parse_price) Could not extract item price. Item Price not formatted as"
+            f"expected! -> '" + str(price_text) + "'"
+        )
+
+
+def product_id_from_url(url):
+    """
+    Get the product id out of a product page url.
+
+    :param url: str like ".../product-details.184070124.html"
+
+    :return: str with product id, or None if the url isn't a product page
+    """
+    match = product_id_re.search(url)
+    return match.group("product_id") if match else None
+
+
+def is_product_response(url):
+    """
+    Check if a network response could hold product data.
+
+    :param url: str with response url
+
+    :return: bool - True if the response should be parsed with product_from_json
+    """
+    return PRODUCT_API_RE.search(url) is not None
+
+
+def product_from_json(payload, product_id) -> Product:
+    """
+    Build a product record from a product api payload.
+
+    :param payload: decoded json from a response matching PRODUCT_API_RE
+    :param product_id: str with the product id from the page url
+
+    :return: Product, or None if the payload doesn't describe this product
+    """
+    if product_id is None:
+        return None
+
+    def is_product(node):
+        return "name" in node and any(
+            str(node.get(key, "")) == product_id for key in ["pid", "bpn", "id"]
+        )
+
+    product = next(find_dicts(payload, is_product), None)
+    if product is None:
+        return None
+
+    price = find_value(product, ["price", "basePrice"])
+
+    return {
+        "name": product["name"],
+        "sku": product_id,
+        "price": float(price) if isinstance(price, (int, float)) else None,
+        "availability": None,
+    }
+
+
+@tracing.traced
 def get_product_name(page):
     """
     Parse the product name from a product page.
@@ -103,13 +258,12 @@ def get_product_name(page):
 
     :return: str with product name
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     product_name = page.locator("div.product-info").get_by_role("heading").inner_text()
-    logger.info(f"({tag}) Found product name: {product_name}")
+    logger.info("Found product name: %s", product_name)
     return product_name
 
 
+@tracing.traced
 def get_product_inventory_number(page):
     """
     Parse the product inventory number.
@@ -118,18 +272,17 @@ def get_product_inventory_number(page):
 
     :return: str with inventory number
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     product_inventory_number = (
         page
             .locator("div.product-info")
             .get_by_role("heading")
             .get_attribute("id")
     )
-    logger.info(f"({tag}) Found product inventory number: {product_inventory_number}")
+    logger.info("Found product inventory number: %s", product_inventory_number)
     return product_inventory_number
 
 
+@tracing.traced
 def get_product_price(page):
     """
     Parse the price of the product.
@@ -138,16 +291,9 @@ def get_product_price(page):
 
     :return: float with product price, or None if none available
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
-    try:
-        product_price = page.locator("div.product-details__price-box span.sr-only").inner_text()
-        product_price = float(product_price_extract.group("price"))
-    except IndexError:
-        raise ValueError(
-            f"({tag}) Could not extract item price. Item Price not formatted as"
-            f"expected! -> '" + str(product_price) + "'"
-        )
+    product_price = parse_price(
+        page.locator("div.product-details__price-box span.sr-only").inner_text()
+    )
 
-    logger.info(f"({tag}) Found product price: {product_price}")
+    logger.info("Found product price: %s", product_price)
     return product_price
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+from playwright.async_api import expect, Page
+
+from .. import readiness, tracing
+from ..product import Product
+from .safeway import EXTRACT_PRODUCT_JS, STOREFRONT_URL, location_banner, make_product, parse_price
+
+logger = logging.getLogger(__name__)
+
+
+@tracing.traced
+async def navigate_to_storefront(page: Page, storefront_url = STOREFRONT_URL):
+    """
+    Navigate a playwright browser to the store front so that it is ready for
+    further operations. This involves dismissing any modal pop-ups and anything
+    else that must be done before reaching the index.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param storefront_url: leave blank for safeway site index
+
+    :return: None
+    """
+    if not isinstance(page, Page):
+        raise ValueError(
+            f"({__name__}.navigate_to_storefront) page parameter is invalid. "
+            f"Expecting type playwright.async_api.Page, "
+            f"instead received {type(page)}"
+        )
+
+    logger.info("Browsing to %s...", storefront_url)
+    await page.goto(storefront_url)
+
+
+@tracing.traced
+async def set_location(page: Page, street_address, zipcode):
+    """
+    Sets the location using the in-page store locator dialog.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param street_address: string of the street address to use
+    :param zipcode: string of the zipcode to use
+
+    :return: None
+    """
+    if not isinstance(page, Page):
+        raise ValueError(
+            f"({__name__}.set_location) page parameter is invalid. "
+            f"Expecting type playwright.async_api.Page, "
+            f"instead received {type(page)}"
+        )
+
+    logger.info("Setting location to %s...", street_address + " " + str(zipcode))
+
+    # open address selection modal
+    # NOTE: only the inner div responds to the click event and not the element
+    # that has the button aria role on it...
+    logger.info("Opening delivery address box modal...")
+    address_selector = (
+        page
+            .get_by_role("button")
+            .filter(has=page.locator("id=openFulfillmentModalButton"))
+            .locator("id=openFulfillmentModalButton")
+    )
+    await address_selector.click()
+
+    # fill out address form
+    zipcode_input = page.get_by_placeholder("Enter ZIP Code to get started.")
+    await expect(zipcode_input).to_be_visible()
+
+    await zipcode_input.fill(zipcode)
+    await page.get_by_label("search Zipcode").click()
+
+    await page.get_by_role("button").filter(has_text="Load More Stores").click()
+
+    # find address in results
+    address_results = page.locator("div.card-store.row")
+    address_target = address_results.filter(has_text=street_address)
+    target_count, results_count = await asyncio.gather(
+        address_target.count(),
+        address_results.count(),
+    )
+
+    if target_count > 0:
+        logger.info("Found exact match! Setting address...")
+        await address_target.get_by_role("button", name="Select").click()
+    elif results_count > 0:
+        logger.info(
+            "Could not find match, using zipcode only! Setting address "
+            f"to {await address_results.nth(0).locator('p.body-m').nth(0).inner_text()}..."
+        )
+        await address_results.nth(0).get_by_role("button", name="Select").click()
+    else:
+        raise ValueError(f"({__name__}.set_location) Could not find any store locations on page!")
+
+    logger.info("Waiting for page to update with address info...")
+    await expect(address_selector).to_be_visible(timeout=30000)
+    await readiness.wait_until(
+        "location_banner", lambda timeout: location_banner(page, zipcode).wait_for(timeout=timeout)
+    )
+    logger.info("Page refresh done!")
+
+
+@tracing.traced
+async def is_location_set(page: Page, street_address, zipcode):
+    """
+    Check whether the store location is already set, e.g. from restored
+    session cookies. The delivery address banner shows the selected zipcode
+    once a store has been picked.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param street_address: string of the street address that should be set
+    :param zipcode: string of the zipcode that should be set
+
+    :return: bool - True if the banner shows the zipcode
+    """
+    address_selector = page.locator("id=openFulfillmentModalButton")
+    if await address_selector.count() == 0:
+        logger.info("No delivery address banner on page...")
+        return False
+
+    banner = await address_selector.first.inner_text()
+    logger.info("Delivery address banner says '%s'", banner)
+    return str(zipcode) in banner
+
+
+@tracing.traced
+async def extract_product(page: Page) -> Product:
+    """
+    Parse every product field from a product page in a single round trip to
+    the browser. Falls back to get_product if the page isn't laid out the way
+    we expect.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+
+    :return: Product with name, sku, price and availability
+    """
+    fields = await page.evaluate(EXTRACT_PRODUCT_JS)
+    if fields is None or fields["name"] is None or fields["price"] is None:
+        logger.warning("Batch extraction failed, falling back to per-field extraction...")
+        return await get_product(page)
+
+    product = make_product(fields)
+    logger.info("Found product: %s", product)
+    return product
+
+
+@tracing.traced
+async def get_product(page: Page) -> Product:
+    """
+    Parse every product field from a product page. The individual lookups do
+    not depend on each other, so they are all awaited together.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+
+    :return: Product with name, sku, price and availability
+    """
+    name, sku, price = await asyncio.gather(
+        get_product_name(page),
+        get_product_inventory_number(page),
+        get_product_price(page),
+    )
+
+    return {
+        "name": name,
+        "sku": sku,
+        "price": price,
+        "availability": None,
+    }
+
+
+@tracing.traced
+async def get_product_name(page: Page):
+    """
+    Parse the product name from a product page.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+
+    :return: str with product name
+    """
+    product_name = await page.locator("div.product-info").get_by_role("heading").inner_text()
+    logger.info("Found product name: %s", product_name)
+    return product_name
+
+
+@tracing.traced
+async def get_product_inventory_number(page: Page):
+    """
+    Parse the product inventory number.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+
+    :return: str with inventory number
+    """
+    product_inventory_number = await (
+        page
+            .locator("div.product-info")
+            .get_by_role("heading")
+            .get_attribute("id")
+    )
+    logger.info("Found product inventory number: %s", product_inventory_number)
+    return product_inventory_number
+
+
+@tracing.traced
+async def get_product_price(page: Page):
+    """
+    Parse the price of the product.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+
+    :return: float with product price, or None if none available
+    """
+    product_price = parse_price(
+        await page.locator("div.product-details__price-box span.sr-only").inner_text()
+    )
+
+    logger.info("Found product price: %s", product_price)
+    return product_price
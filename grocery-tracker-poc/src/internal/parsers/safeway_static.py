@@ -0,0 +1,90 @@
+import logging
+from ..product import Product
+from .safeway import make_product, parse_price
+from .static_html import parse, text
+
+logger = logging.getLogger(__name__)
+
+
+def get_heading(tree):
+    """
+    Find the product heading, same as
+    locator("div.product-info").get_by_role("heading") in the browser parser.
+
+    :param tree: selectolax LexborHTMLParser
+
+    :return: selectolax LexborNode, or None if this isn't a product page
+    """
+    info = tree.css_first("div.product-info")
+    if info is None:
+        return None
+
+    return info.css_first("h1, h2, h3, h4, h5, h6, [role=heading]")
+
+
+def extract_product(html) -> Product:
+    """
+    Parse every product field from saved product page html without a
+    browser. Returns the same record as safeway.extract_product.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: Product, or None if the page isn't a product page
+    """
+    tree = parse(html)
+    if get_heading(tree) is None:
+        logger.warning("No product info on page!")
+        return None
+
+    return make_product({
+        "name": get_product_name(tree),
+        "sku": get_product_inventory_number(tree),
+        "price": get_product_price_text(tree),
+        "availability": None,
+    })
+
+
+def get_product_name(html):
+    """
+    Parse the product name from product page html.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: str with product name, or None if not found
+    """
+    return text(get_heading(parse(html)))
+
+
+def get_product_inventory_number(html):
+    """
+    Parse the product inventory number from product page html.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: str with inventory number, or None if not found
+    """
+    heading = get_heading(parse(html))
+    return heading.attributes.get("id") if heading is not None else None
+
+
+def get_product_price_text(html):
+    """
+    Find the raw screen reader price text.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: str like "Your Price: $4.99", or None if there is no price
+    """
+    return text(parse(html).css_first("div.product-details__price-box span.sr-only"))
+
+
+def get_product_price(html):
+    """
+    Parse the price of the product from product page html.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: float with product price, or None if none available
+    """
+    price_text = get_product_price_text(html)
+    return parse_price(price_text) if price_text is not None else None
@@ -0,0 +1,24 @@
+from selectolax.lexbor import LexborHTMLParser
+
+
+def parse(html):
+    """
+    Parse a product page, unless it already is.
+
+    :param html: str with page html, or an already parsed LexborHTMLParser
+
+    :return: selectolax LexborHTMLParser
+    """
+    return html if isinstance(html, LexborHTMLParser) else LexborHTMLParser(html)
+
+
+def text(node):
+    """
+    Get the text of a node with whitespace collapsed, roughly what innerText
+    gives in the browser.
+
+    :param node: selectolax LexborNode, or None
+
+    :return: str with text, or None if there is no node
+    """
+    return " ".join(node.text(deep = True, separator = " ").split()) if node is not None else None
@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta
+import logging
+
+from .config import *
+
+logger = logging.getLogger(__name__)
+
+# one row per url with how many records it has and how many of those saw a
+# different price or availability than the one before
+CHANGES_QUERY = """
+SELECT url, COUNT(*) AS scrapes, MIN(date) AS first, MAX(date) AS last, SUM(changed) AS changes
+FROM (
+    SELECT url, date,
+        LAG(date) OVER w IS NOT NULL
+        AND (price IS NOT LAG(price) OVER w OR availability IS NOT LAG(availability) OVER w) AS changed
+    FROM prices
+    WHERE url IS NOT NULL AND date >= ?
+    WINDOW w AS (PARTITION BY url ORDER BY date)
+)
+GROUP BY url
+"""
+
+# unchanged scrapes only bump latest_prices.seen, so that's where the last
+# visit to a url is
+SEEN_QUERY = """
+SELECT url, MIN(date) AS date, MAX(COALESCE(seen, date)) AS seen FROM latest_prices
+WHERE url IS NOT NULL GROUP BY url
+"""
+
+
+def change_history(conn, days = 90, now = None):
+    """
+    Count how often every product url's price or availability changed.
+
+    :param conn: connection from history.connect()
+    :param days: how far back to look
+    :param now: datetime to count back from, defaults to now
+
+    :return: dict of url -> dict with scrapes (stored records), first, last
+        (datetimes, last includes unchanged visits) and changes
+    """
+    since = ((now or datetime.now()) - timedelta(days = days)).isoformat()
+    seen = {row["url"]: row for row in conn.execute(SEEN_QUERY)}
+
+    history = {}
+    for row in conn.execute(CHANGES_QUERY, (since,)):
+        last = max(row["last"], seen[row["url"]]["seen"]) if row["url"] in seen else row["last"]
+        history[row["url"]] = {
+            "scrapes": row["scrapes"],
+            "first": datetime.fromisoformat(row["first"]),
+            "last": datetime.fromisoformat(last),
+            "changes": row["changes"],
+        }
+
+    # still being seen, but it hasn't changed since before the lookback
+    for url, row in seen.items():
+        if url not in history:
+            history[url] = {
+                "scrapes": 1,
+                "first": datetime.fromisoformat(row["date"]),
+                "last": datetime.fromisoformat(row["seen"]),
+                "changes": 0,
+            }
+
+    return history
+
+
+def interval(history, min_hours, max_hours):
+    """
+    Pick how long to wait before scraping a product again. A product that
+    changed every 2 days on average is checked every day, so changes are
+    seen about as fast as they happen. One that never changed backs off to
+    however long it has been stable.
+
+    :param history: dict from change_history for one url
+    :param min_hours: shortest allowed interval
+    :param max_hours: longest allowed interval
+
+    :return: timedelta
+    """
+    span_hours = (history["last"] - history["first"]).total_seconds() / 3600
+
+    if history["changes"] > 0:
+        hours = span_hours / history["changes"] / 2
+    else:
+        hours = span_hours
+
+    return timedelta(hours = min(max(hours, min_hours), max_hours))
+
+
+def plan(conn, urls_by_store, min_hours = None, max_hours = None, now = None):
+    """
+    Work out when every product url is next due.
+
+    :param conn: connection from history.connect()
+    :param urls_by_store: dict of store name -> list of product urls, like
+        config.PRODUCT_URLS
+    :param min_hours: override for config.rescrape_min_hours()
+    :param max_hours: override for config.rescrape_max_hours()
+    :param now: datetime to plan from, defaults to now
+
+    :return: dict of url -> dict with store, next_due (datetime), interval
+        (timedelta, None if never scraped) and due (bool)
+    """
+    if not isinstance(urls_by_store, dict):
+        raise ValueError(
+            f"({__name__}.plan) invalid urls_by_store parameter. Expecting type dict, "
+            f"received {type(urls_by_store)} instead"
+        )
+
+    if min_hours is None:
+        min_hours = rescrape_min_hours()
+    if max_hours is None:
+        max_hours = rescrape_max_hours()
+    if now is None:
+        now = datetime.now()
+
+    # look back far enough to see at least a couple of max intervals
+    changes = change_history(conn, days = max(90, 3 * max_hours / 24), now = now)
+
+    schedule = {}
+    for store, urls in urls_by_store.items():
+        for url in urls:
+            if url not in changes:
+                # never scraped, or not within the lookback
+                schedule[url] = {"store": store, "next_due": now, "interval": None, "due": True}
+                continue
+
+            wait = interval(changes[url], min_hours, max_hours)
+            next_due = changes[url]["last"] + wait
+            schedule[url] = {"store": store, "next_due": next_due, "interval": wait, "due": next_due <= now}
+
+    return schedule
+
+
+def due_urls(conn, urls_by_store, min_hours = None, max_hours = None, now = None):
+    """
+    Filter product urls down to the ones that are due for a scrape.
+
+    :param conn: connection from history.connect()
+    :param urls_by_store: dict of store name -> list of product urls
+    :param min_hours: override for config.rescrape_min_hours()
+    :param max_hours: override for config.rescrape_max_hours()
+    :param now: datetime to plan from, defaults to now
+
+    :return: dict of store name -> list of due urls. Stores with nothing due
+        are left out
+    """
+    schedule = plan(conn, urls_by_store, min_hours, max_hours, now)
+
+    due = {}
+    for url, entry in schedule.items():
+        if entry["due"]:
+            due.setdefault(entry["store"], []).append(url)
+        else:
+            logger.debug(
+                "[%s] skipping %s, next due %s", entry["store"], url, entry["next_due"].strftime("%Y-%m-%d %H:%M"),
+                extra = {"store": entry["store"], "url": url},
+            )
+
+    logger.info("%s/%s url(s) due", sum(len(urls) for urls in due.values()), len(schedule))
+    return due
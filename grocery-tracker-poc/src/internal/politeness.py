@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import multiprocessing
+import random
+import time
+from urllib.parse import urlsplit
+
+from .config import *
+from .routing import domain_matches
+
+logger = logging.getLogger(__name__)
+
+
+def shared_slots(intervals = None):
+    """
+    Make next-request times that can be handed to worker processes, so
+    their schedulers take turns on a site instead of each pacing on its own.
+    Has to be created before the workers are started.
+
+    :param intervals: dict of domain -> {"min": seconds, "max": seconds}.
+        Defaults to config.POLITENESS_INTERVALS
+
+    :return: dict of domain -> multiprocessing.Value with the monotonic time
+        the next request may go out
+    """
+    if intervals is None:
+        intervals = POLITENESS_INTERVALS
+    return {domain: multiprocessing.Value("d", 0.0) for domain in intervals}
+
+
+class PolitenessScheduler:
+    """
+    Paces navigations per site. Every site gets its own minimum interval, so
+    a store waiting out its cooldown only holds up its own requests while
+    every other store keeps going on the same event loop.
+
+    Slots are handed out in the order wait() is called: each call reserves
+    the next free time for its site and sleeps until then. The first request
+    to a site goes out right away.
+
+    Schedulers in different processes can share their slots (see
+    shared_slots()), so a site is paced the same no matter how many worker
+    processes are scraping it.
+    """
+
+    def __init__(self, intervals = None, enabled = True, slots = None):
+        """
+        :param intervals: dict of domain -> {"min": seconds, "max": seconds}.
+            Defaults to config.POLITENESS_INTERVALS
+        :param enabled: False to never wait, e.g. when replaying a HAR file
+        :param slots: dict from shared_slots() to share pacing with other
+            processes, None to pace this process on its own
+        """
+        self.intervals = POLITENESS_INTERVALS if intervals is None else intervals
+        self.enabled = enabled
+        self.slots = slots
+
+        # domain -> monotonic time the next request may go out
+        self.next_time = {}
+
+        # domain -> dict with requests, waiting, max_waiting and seconds_waited
+        self.stats = {}
+
+    def domain(self, url):
+        """
+        :param url: str with request url
+
+        :return: str with the configured domain the url falls under, or None
+            if the site isn't paced
+        """
+        host = urlsplit(url).hostname or ""
+        return next((domain for domain in self.intervals if domain_matches(host, [domain])), None)
+
+    async def wait(self, url):
+        """
+        Sleep until it's this url's site's turn.
+
+        :param url: str with the url about to be loaded
+
+        :return: float with seconds spent waiting
+        """
+        domain = self.domain(url)
+        if domain is None or not self.enabled:
+            return 0.0
+
+        stats = self.stats.setdefault(domain, {"requests": 0, "waiting": 0, "max_waiting": 0, "seconds_waited": 0.0})
+        stats["requests"] += 1
+
+        # reserve a slot before sleeping, so concurrent callers line up
+        # behind each other instead of all waking at the same time
+        now = time.monotonic()
+        interval = self.intervals[domain]
+        if self.slots is not None and domain in self.slots:
+            # the monotonic clock is system wide, so every process agrees on it
+            with self.slots[domain].get_lock():
+                start = max(now, self.slots[domain].value)
+                self.slots[domain].value = start + random.uniform(interval["min"], interval["max"])
+        else:
+            start = max(now, self.next_time.get(domain, now))
+            self.next_time[domain] = start + random.uniform(interval["min"], interval["max"])
+
+        delay = start - now
+        if delay <= 0:
+            return 0.0
+
+        stats["waiting"] += 1
+        stats["max_waiting"] = max(stats["max_waiting"], stats["waiting"])
+        logger.info(
+            "[%s] waiting %.1f seconds, %s request(s) queued", domain, delay, stats["waiting"],
+            extra = {"domain": domain, "url": url, "duration": delay, "queue_depth": stats["waiting"]},
+        )
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            stats["waiting"] -= 1
+            stats["seconds_waited"] += delay
+
+        return delay
+
+    def log_stats(self):
+        """
+        Log how many requests went to each paced site and how long they waited.
+        """
+        for domain, stats in self.stats.items():
+            logger.info(
+                "[%s] %s request(s), waited %.1f seconds in total, at most %s queued at once",
+                domain, stats["requests"], stats["seconds_waited"], stats["max_waiting"],
+            )
@@ -0,0 +1,275 @@
+import asyncio
+import contextlib
+import logging
+import os
+
+from .common import make_browser_async
+
+logger = logging.getLogger(__name__)
+
+
+def process_tree_rss():
+    """
+    Add up the resident memory of this process and all of its descendants
+    (the playwright driver and every browser it launched). Reads /proc, so
+    this only works on linux, which is what the docker image runs.
+
+    :return: int with rss in bytes, or None if it can't be measured here
+    """
+    if not os.path.isdir("/proc"):
+        return None
+
+    children = {}
+    rss_pages = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # the process name can contain spaces, so split after it
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+
+        children.setdefault(int(fields[1]), []).append(int(pid))
+        rss_pages[int(pid)] = int(fields[21])
+
+    total = 0
+    pending = [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        total += rss_pages.get(pid, 0)
+        pending.extend(children.get(pid, []))
+
+    return total * os.sysconf("SC_PAGE_SIZE")
+
+
+class BrowserPool:
+    """
+    Bounded pool of pre-launched browsers, each with one long lived context.
+    Workers check a context out, use it, and check it back in. Contexts are
+    kept around between checkouts so the http cache and cookies stay warm.
+
+    An entry is recycled (closed and relaunched in the background) when its
+    browser disconnects, after max_uses checkouts, or when the whole browser
+    process tree is above max_rss_mb. Replacements are launched as soon as
+    an entry is retired, so once the pool is warm a checkout only has to wait
+    for another worker to give a context back. If the last browser can't be
+    replaced, every waiting and later checkout raises instead of waiting for
+    a context that will never come back.
+    """
+
+    def __init__(self, playwright, size, launch_config = {}, browser_config = {}, max_uses = 50, max_rss_mb = None):
+        """
+        :param playwright: async playwright instance
+        :param size: number of browsers to keep warm
+        :param launch_config: dictionary with playwright launch config parameters
+        :param browser_config: dictionary with playwright browser context parameters
+        :param max_uses: recycle a browser after this many checkouts
+        :param max_rss_mb: recycle browsers while the process tree uses more
+            than this much memory. None to disable
+        """
+        if size < 1:
+            raise ValueError(
+                f"({__name__}.BrowserPool.__init__) invalid size parameter. "
+                f"Pool needs at least 1 browser, received {size}"
+            )
+
+        self.playwright = playwright
+        self.size = size
+        self.launch_config = launch_config
+        self.browser_config = browser_config
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+
+        self.idle = asyncio.Queue()
+        self.uses = {}
+        self.browsers = {}
+        self.launching = set()
+        self.closed = False
+
+        # set once every browser is gone and none could be launched again
+        self.exhausted = False
+
+    async def start(self):
+        """
+        Launch every browser in the pool up front.
+
+        :return: self, so this can be chained off the constructor
+        """
+        logger.info("Warming up %s browser(s)...", self.size)
+        await asyncio.gather(*[self.launch() for _ in range(self.size)])
+        return self
+
+    async def launch(self):
+        """
+        Launch one browser and context and put it in the idle queue.
+        """
+        try:
+            browser, context = await make_browser_async(
+                playwright = self.playwright,
+                launch_config = self.launch_config,
+                browser_config = self.browser_config,
+            )
+        except Exception:
+            logger.exception("Could not launch browser for the pool!")
+            raise
+
+        if self.closed:
+            await browser.close()
+            return
+
+        self.browsers[context] = browser
+        self.uses[context] = 0
+        self.idle.put_nowait(context)
+
+    async def relaunch(self, attempts = 3):
+        """
+        Launch a replacement browser, retrying with a short backoff so one
+        failed launch doesn't permanently shrink the pool.
+
+        :param attempts: how many launches to try before giving up
+        """
+        for attempt in range(attempts):
+            try:
+                await self.launch()
+                return
+            except Exception:
+                await asyncio.sleep(2 ** attempt)
+
+        logger.error("Giving up on replacement browser, pool is down to %s!", len(self.browsers))
+
+        # nothing checked out will come back and nothing else is launching,
+        # so wake up everyone waiting in acquire()
+        if not self.browsers and not self.launching - {asyncio.current_task()}:
+            self.exhausted = True
+            self.idle.put_nowait(None)
+
+    def launch_in_background(self):
+        """
+        Start a replacement launch without waiting for it.
+        """
+        task = asyncio.create_task(self.relaunch())
+        self.launching.add(task)
+        task.add_done_callback(self.launching.discard)
+
+    async def acquire(self):
+        """
+        Check a healthy context out of the pool, waiting for one to be
+        returned if they are all in use.
+
+        :return: playwright async BrowserContext
+        """
+        while True:
+            if self.closed:
+                raise RuntimeError(f"({__name__}.BrowserPool.acquire) Pool is closed!")
+            if self.exhausted:
+                raise RuntimeError(f"({__name__}.BrowserPool.acquire) No browsers left in the pool!")
+
+            context = await self.idle.get()
+            if context is None:
+                # close() or relaunch() giving up, pass it on to the next waiter
+                self.idle.put_nowait(None)
+                continue
+
+            if self.browsers[context].is_connected():
+                self.uses[context] += 1
+                return context
+
+            logger.warning("Found a disconnected browser in the pool, replacing it...")
+            await self.retire(context)
+
+    async def release(self, context):
+        """
+        Check a context back in. Its pages are closed, and the browser is
+        recycled if it is unhealthy or past its use or memory limits.
+
+        :param context: context previously returned from acquire()
+        """
+        if context not in self.browsers:
+            raise ValueError(
+                f"({__name__}.BrowserPool.release) context parameter does not belong to this pool!"
+            )
+
+        try:
+            for page in context.pages:
+                await page.close()
+        except Exception:
+            logger.warning("Could not close pages, recycling browser...")
+            await self.retire(context)
+            return
+
+        reason = None
+        if not self.browsers[context].is_connected():
+            reason = "browser disconnected"
+        elif self.max_uses is not None and self.uses[context] >= self.max_uses:
+            reason = f"used {self.uses[context]} times"
+        elif self.max_rss_mb is not None:
+            rss = process_tree_rss()
+            if rss is not None and rss > self.max_rss_mb * 1024 * 1024:
+                reason = f"browsers using {rss // (1024 * 1024)} MB"
+
+        if reason is not None:
+            logger.info("Recycling browser (%s)...", reason)
+            await self.retire(context)
+        else:
+            self.idle.put_nowait(context)
+
+    async def retire(self, context):
+        """
+        Close a browser and launch its replacement in the background.
+
+        :param context: context whose browser should be closed
+        """
+        browser = self.browsers.pop(context)
+        self.uses.pop(context)
+
+        with contextlib.suppress(Exception):
+            await context.close()
+            await browser.close()
+
+        if not self.closed:
+            self.launch_in_background()
+
+    @contextlib.asynccontextmanager
+    async def context(self):
+        """
+        Check out a context for the duration of an `async with` block.
+
+        :return: playwright async BrowserContext
+        """
+        context = await self.acquire()
+        try:
+            yield context
+        finally:
+            await self.release(context)
+
+    async def close(self):
+        """
+        Shut down every browser in the pool, including any replacements that
+        are still launching.
+        """
+        self.closed = True
+
+        for task in list(self.launching):
+            task.cancel()
+        await asyncio.gather(*self.launching, return_exceptions = True)
+
+        logger.info("Closing %s browser(s)...", len(self.browsers))
+
+        # close contexts first so anything that is only flushed on context
+        # close (e.g. recorded HAR files) gets written out
+        await asyncio.gather(
+            *[context.close() for context in self.browsers],
+            return_exceptions = True,
+        )
+        await asyncio.gather(
+            *[browser.close() for browser in self.browsers.values()],
+            return_exceptions = True,
+        )
+        self.browsers.clear()
+        self.uses.clear()
+
+        # wake up anyone still waiting in acquire()
+        self.idle.put_nowait(None)
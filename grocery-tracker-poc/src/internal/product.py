@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import NotRequired, TypedDict
+
+
+class Product(TypedDict):
+    """
+    One scraped product record. The parsers fill in the first four fields,
+    the rest are added by the scrape loop in main.py and the orchestrator.
+    quantity, unit and unit_price come from units.normalize().
+    """
+    name: str
+    sku: str
+    price: float | None
+    availability: str | None
+    date: NotRequired[datetime]
+    location: NotRequired[str]
+    store: NotRequired[str]
+    url: NotRequired[str]
+    size: NotRequired[str | None]
+    quantity: NotRequired[float | None]
+    unit: NotRequired[str | None]
+    unit_price: NotRequired[float | None]
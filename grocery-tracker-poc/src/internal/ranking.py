@@ -0,0 +1,124 @@
+from collections import Counter
+import logging
+
+from . import history
+from .config import *
+
+logger = logging.getLogger(__name__)
+
+# item group -> dict with "entries" (dicts from latest_prices, cheapest per
+# unit first) and "unit" (the unit most of the group is sold in). Built on
+# the first query for a group and dropped by invalidate() when a scrape for
+# that group is written, so repeat queries never touch sqlite
+rankings = {}
+
+
+def invalidate(item_groups = None):
+    """
+    Drop cached rankings so the next query rebuilds them from the database.
+    Call after history.append().
+
+    :param item_groups: iterable of item group names, or list of Product to
+        invalidate the groups they belong to. None drops every group
+
+    :return: None
+    """
+    if item_groups is None:
+        rankings.clear()
+        return
+
+    for group in item_groups:
+        if isinstance(group, dict):
+            group = group.get("item_group") or item_group(group.get("url"))
+        rankings.pop(group, None)
+
+
+def group_ranking(conn, group):
+    """
+    Get the cached ranking of an item group, building it if needed.
+
+    :param conn: connection from history.connect()
+    :param group: item group name (key in config.ITEM_GROUPS)
+
+    :return: dict with "entries", one per (store, sku) with a known unit
+        price ordered by unit then unit_price, and "unit", the most common unit
+    """
+    ranking = rankings.get(group)
+    if ranking is None:
+        entries = [dict(row) for row in history.rank_by_unit_price(conn, group)]
+        ranking = {"entries": entries, "unit": most_common_unit(entries)}
+        rankings[group] = ranking
+        logger.debug("Built ranking for %s with %s product(s)", group, len(entries))
+
+    return ranking
+
+
+def most_common_unit(entries):
+    """
+    :param entries: list of dict with a "unit" key
+
+    :return: str with the unit most entries use, or None if there are none
+    """
+    counts = Counter(entry["unit"] for entry in entries)
+    return counts.most_common(1)[0][0] if counts else None
+
+
+def rank(conn, group, location = None, unit = None):
+    """
+    List an item group across stores, cheapest per unit first.
+
+    :param conn: connection from history.connect()
+    :param group: item group name (key in config.ITEM_GROUPS)
+    :param location: only include products scraped for this location. Matches
+        any part of the stored location, so a zip code works
+    :param unit: canonical unit to compare in (e.g. "lb"). Prices in
+        different units aren't comparable, so this defaults to the unit most
+        of the group is sold in
+
+    :return: list of dict, cheapest first
+    """
+    ranking = group_ranking(conn, group)
+    entries = ranking["entries"]
+    if location is not None:
+        entries = [entry for entry in entries if location in (entry["location"] or "")]
+
+    if unit is None:
+        unit = ranking["unit"] if location is None else most_common_unit(entries)
+
+    return [entry for entry in entries if entry["unit"] == unit]
+
+
+def best(conn, group, location = None, unit = None):
+    """
+    Find the cheapest product per unit of an item group.
+
+    :param conn: connection from history.connect()
+    :param group: item group name (key in config.ITEM_GROUPS)
+    :param location: only include products scraped for this location
+    :param unit: canonical unit to compare in, see rank()
+
+    :return: dict from latest_prices, or None if nothing in the group has a
+        known unit price
+    """
+    ranking = group_ranking(conn, group)
+
+    # entries are sorted by unit first, so the first match is the cheapest
+    if location is None and unit is None:
+        unit = ranking["unit"]
+        return next((entry for entry in ranking["entries"] if entry["unit"] == unit), None)
+
+    entries = rank(conn, group, location, unit)
+    return entries[0] if entries else None
+
+
+def best_for_list(conn, groups, location = None):
+    """
+    Find the cheapest product per unit for every item group on a shopping list.
+
+    :param conn: connection from history.connect()
+    :param groups: list of item group names
+    :param location: only include products scraped for this location
+
+    :return: dict of item group -> dict from latest_prices (or None)
+    """
+    return {group: best(conn, group, location) for group in groups}
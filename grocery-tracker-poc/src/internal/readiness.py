@@ -0,0 +1,127 @@
+import logging
+from playwright.async_api import TimeoutError
+import time
+
+from . import tracing
+from .config import *
+
+logger = logging.getLogger(__name__)
+
+# step name -> dict with waits, timeouts and seconds spent waiting
+stats = {}
+
+
+def product_ready_js(extract_product_js):
+    """
+    Turn a parser's EXTRACT_PRODUCT_JS into a predicate for
+    page.wait_for_function that is true once the fields extract_product
+    needs have rendered: a name, and a price or an availability message.
+
+    :param extract_product_js: str with a js function returning the product
+        fields, or null
+
+    :return: str with js function returning bool
+    """
+    return f"""() => {{
+    const fields = ({extract_product_js})();
+    return Boolean(fields && fields.name && (fields.price || fields.availability));
+}}"""
+
+
+def record(name, start_time, ready):
+    """
+    Log and count one wait.
+
+    :param name: str with step name
+    :param start_time: time.monotonic() from before the wait
+    :param ready: bool - False if the wait timed out
+
+    :return: float with seconds waited
+    """
+    duration = time.monotonic() - start_time
+
+    step = stats.setdefault(name, {"waits": 0, "timeouts": 0, "seconds": 0.0})
+    step["waits"] += 1
+    step["seconds"] += duration
+
+    if ready:
+        logger.info("%s ready after %.2f seconds", name, duration, extra = {"step": name, "duration": duration})
+    else:
+        step["timeouts"] += 1
+        logger.warning(
+            "%s not ready after %.2f seconds, carrying on anyway", name, duration,
+            extra = {"step": name, "duration": duration},
+        )
+
+    return duration
+
+
+async def wait_until(name, condition, timeout = None):
+    """
+    Wait for the one thing the next step needs, e.g. the address banner
+    showing the new zipcode, instead of for the whole page to go quiet. A
+    condition that never comes true is given up on after the fallback
+    timeout and the caller carries on, same as before.
+
+    :param name: str with step name, for the log, stats and tracing
+    :param condition: function taking a timeout in milliseconds and returning
+        an awaitable that resolves once the page is ready, e.g.
+        `lambda timeout: locator.wait_for(timeout = timeout)`
+    :param timeout: fallback timeout in seconds, defaults to
+        config.ready_timeout()
+
+    :return: bool - True if the condition came true, False on timeout
+    """
+    if timeout is None:
+        timeout = ready_timeout()
+
+    start_time = time.monotonic()
+    with tracing.span("ready." + name):
+        try:
+            await condition(timeout * 1000)
+            ready = True
+        except TimeoutError:
+            tracing.set_outcome("timeout")
+            ready = False
+
+    record(name, start_time, ready)
+    return ready
+
+
+def wait_until_sync(name, condition, timeout = None):
+    """
+    Same as wait_until, for the sync api.
+
+    :param name: str with step name, for the log, stats and tracing
+    :param condition: function taking a timeout in milliseconds that returns
+        once the page is ready
+    :param timeout: fallback timeout in seconds, defaults to
+        config.ready_timeout()
+
+    :return: bool - True if the condition came true, False on timeout
+    """
+    if timeout is None:
+        timeout = ready_timeout()
+
+    start_time = time.monotonic()
+    with tracing.span("ready." + name):
+        try:
+            condition(timeout * 1000)
+            ready = True
+        except TimeoutError:
+            tracing.set_outcome("timeout")
+            ready = False
+
+    record(name, start_time, ready)
+    return ready
+
+
+def log_stats():
+    """
+    Log how long each kind of wait took this run and how often it timed out.
+    """
+    for name, step in stats.items():
+        logger.info(
+            "%s: %s wait(s), %.1f seconds in total, %s timed out",
+            name, step["waits"], step["seconds"], step["timeouts"],
+        )
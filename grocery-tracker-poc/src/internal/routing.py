@@ -0,0 +1,109 @@
+from collections import Counter
+import logging
+from urllib.parse import urlparse
+
+from .config import *
+
+logger = logging.getLogger(__name__)
+
+
+def domain_matches(host, domains):
+    """
+    Check if a host is one of the domains or a subdomain of one of them.
+
+    :param host: str with hostname, e.g. "www.google-analytics.com"
+    :param domains: list of domains, e.g. ["google-analytics.com"]
+
+    :return: bool - True if the host falls under one of the domains
+    """
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def should_block(rules, resource_type, url):
+    """
+    Decide whether a request should be aborted.
+
+    :param rules: dict with block_resource_types, block_domains and
+        allow_domains lists (see config.ROUTING_RULES)
+    :param resource_type: playwright resource type, e.g. "image"
+    :param url: str with request url
+
+    :return: str with the reason to block, or None to let it through
+    """
+    if resource_type in rules.get("block_resource_types", []):
+        return resource_type
+
+    host = urlparse(url).hostname or ""
+    if domain_matches(host, rules.get("allow_domains", [])):
+        return None
+    if domain_matches(host, rules.get("block_domains", [])):
+        return host
+
+    return None
+
+
+async def install_routes(page, store, rules = None):
+    """
+    Abort requests the parsers don't need (images, fonts, analytics, ...) on
+    a page. Routes go on the page rather than the context because pooled
+    contexts are shared between stores with different rules. Playwright
+    turns off the http cache for a page once it has a route (context routes
+    do the same to the whole context), so a filtered page never reuses the
+    pool's cached scripts and stylesheets. See config.request_filtering()
+    for why filtering still wins by default.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param store: store name (key in config.ROUTING_RULES)
+    :param rules: override for config.ROUTING_RULES[store]
+
+    :return: dict with running request stats, see log_route_stats
+    """
+    stats = {
+        "store": store,
+        "requests_blocked": 0,
+        "requests_loaded": 0,
+        "bytes_loaded": 0,
+        "blocked_by": Counter(),
+    }
+
+    if rules is None:
+        rules = ROUTING_RULES.get(store)
+
+    if not request_filtering() or rules is None:
+        logger.info("[%s] Request filtering disabled", store)
+        return stats
+
+    async def handle_route(route):
+        reason = should_block(rules, route.request.resource_type, route.request.url)
+        if reason is not None:
+            stats["requests_blocked"] += 1
+            stats["blocked_by"][reason] += 1
+            await route.abort("blockedbyclient")
+        else:
+            await route.fallback()
+
+    def handle_response(response):
+        stats["requests_loaded"] += 1
+        stats["bytes_loaded"] += int(response.headers.get("content-length", 0) or 0)
+
+    await page.route("**/*", handle_route)
+    page.on("response", handle_response)
+
+    logger.info("[%s] Request filtering enabled, http cache is off for this page", store)
+    return stats
+
+
+def log_route_stats(stats):
+    """
+    Log what request filtering saved. Blocked requests are never downloaded,
+    so their size is unknown; compare bytes_loaded against a run with
+    REQUEST_FILTERING=false to see the bandwidth difference.
+
+    :param stats: dict returned from install_routes
+    """
+    top_reasons = ", ".join(f"{reason}: {count}" for reason, count in stats["blocked_by"].most_common(5))
+    logger.info(
+        "[%s] blocked %s request(s) (%s), loaded %s request(s) totalling %.0f KB",
+        stats["store"], stats["requests_blocked"], top_reasons or "none", stats["requests_loaded"],
+        stats["bytes_loaded"] / 1024,
+    )
@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import re
+import time
+import weakref
+
+from . import tracing
+from .config import *
+
+logger = logging.getLogger(__name__)
+
+# seeds localStorage from a saved session without clobbering anything the
+# site has written since. Runs as an init script, so before any page script
+RESTORE_LOCAL_STORAGE_JS = """((origins) => {
+    try {
+        const saved = origins.find((o) => o.origin === window.location.origin);
+        if (!saved) return;
+        for (const item of saved.localStorage) {
+            if (window.localStorage.getItem(item.name) === null) {
+                window.localStorage.setItem(item.name, item.value);
+            }
+        }
+    } catch (e) {}
+})(%s);"""
+
+# pooled context -> session paths whose localStorage init script it already
+# has. Init scripts pile up on a context and all run on every navigation, so
+# each one is only added once per context
+seeded_contexts = weakref.WeakKeyDictionary()
+
+
+def session_path(store, street_address, zipcode):
+    """
+    Get the file a session for this store location is saved to.
+
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param street_address: string of the street address
+    :param zipcode: string of the zipcode
+
+    :return: str with path to the session file
+    """
+    slug = re.sub(r"[^a-z0-9]+", "-", f"{store} {street_address} {zipcode}".lower()).strip("-")
+    return os.path.join(session_dir(), slug + ".json")
+
+
+def load_session(store, street_address, zipcode, ttl_hours = None):
+    """
+    Load a saved session for this store location, if there is one and it
+    isn't stale.
+
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param street_address: string of the street address
+    :param zipcode: string of the zipcode
+    :param ttl_hours: how old a session can be, defaults to config.session_ttl_hours()
+
+    :return: dict with playwright storage state, or None if missing or stale
+    """
+    if ttl_hours is None:
+        ttl_hours = session_ttl_hours()
+
+    path = session_path(store, street_address, zipcode)
+    try:
+        age_hours = (time.time() - os.path.getmtime(path)) / 3600
+        if age_hours > ttl_hours:
+            logger.info("Saved session %s is stale (%.1f hours old)...", path, age_hours)
+            return None
+
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.info("No saved session at %s...", path)
+    except (OSError, ValueError):
+        logger.warning("Could not read saved session %s, ignoring it...", path)
+
+    return None
+
+
+async def save_session(context, store, street_address, zipcode):
+    """
+    Save the cookies and localStorage of a context for this store location.
+    Written to a temp file first so other workers never read half a session.
+
+    :param context: playwright async BrowserContext with the location set
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param street_address: string of the street address
+    :param zipcode: string of the zipcode
+    """
+    path = session_path(store, street_address, zipcode)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    state = await context.storage_state()
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+    logger.info("Saved session to %s", path)
+
+
+async def restore_session(context, state, path):
+    """
+    Load a saved storage state into an existing context. Contexts come from
+    the browser pool, so they can't be created with storage_state directly.
+    Cookies are added every time, the localStorage init script only the
+    first time this context sees the session.
+
+    :param context: playwright async BrowserContext
+    :param state: dict with playwright storage state from load_session
+    :param path: str with the file state came from, see session_path()
+    """
+    if state.get("cookies"):
+        await context.add_cookies(state["cookies"])
+
+    seeded = seeded_contexts.setdefault(context, set())
+    if state.get("origins") and path not in seeded:
+        await context.add_init_script(script = RESTORE_LOCAL_STORAGE_JS % json.dumps(state["origins"]))
+        seeded.add(path)
+
+
+@tracing.traced
+async def ensure_location(page, store, parser, street_address, zipcode):
+    """
+    Get to the storefront with the store location set, reusing a saved
+    session when possible. The location dialog only runs when there is no
+    usable session or the restored one didn't actually apply.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param parser: async parser module with navigate_to_storefront,
+        set_location and is_location_set
+    :param street_address: string of the street address to use
+    :param zipcode: string of the zipcode to use
+
+    :return: bool - True if a saved session was used
+    """
+    state = load_session(store, street_address, zipcode)
+    if state is not None:
+        logger.info("[%s] Restoring saved session...", store)
+        await restore_session(page.context, state, session_path(store, street_address, zipcode))
+
+    await parser.navigate_to_storefront(page)
+
+    if state is not None:
+        if await parser.is_location_set(page, street_address, zipcode):
+            logger.info("[%s] Saved session has the location set, skipping set_location", store)
+            return True
+        logger.info("[%s] Saved session did not apply, setting location again...", store)
+
+    await parser.set_location(page, street_address, zipcode)
+
+    if await parser.is_location_set(page, street_address, zipcode):
+        await save_session(page.context, store, street_address, zipcode)
+    else:
+        logger.warning("[%s] Could not confirm location, not saving session", store)
+
+    return False
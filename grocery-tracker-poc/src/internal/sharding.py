@@ -0,0 +1,268 @@
+import asyncio
+import collections
+import logging
+import multiprocessing
+import os
+from playwright.async_api import async_playwright
+from playwright_stealth import Stealth
+import queue
+import time
+
+from . import artifacts, logtag, readiness, tracing
+from .circuit import CircuitBreaker
+from .config import *
+from .orchestrator import run_store
+from .politeness import PolitenessScheduler, shared_slots
+from .pool import BrowserPool
+
+logger = logging.getLogger(__name__)
+
+# seconds the parent waits for a message before checking on its workers
+POLL_INTERVAL = 1.0
+
+# seconds a worker gets to close its browser after being told to stop
+SHUTDOWN_TIMEOUT = 30
+
+
+def shard(urls_by_store, workers):
+    """
+    Split every store's urls into at most one chunk per worker, dealt out
+    round robin. Chunks are interleaved by store, so the first few workers
+    don't all start on the same site and wait on each other's politeness
+    delays.
+
+    :param urls_by_store: dict of store name -> list of product urls
+    :param workers: number of worker processes
+
+    :return: list of chunk dicts with id, store and urls
+    """
+    by_store = []
+    for store, urls in urls_by_store.items():
+        count = min(workers, len(urls))
+        by_store.append([{"store": store, "urls": urls[i::count]} for i in range(count)])
+
+    chunks = []
+    for i in range(max([len(store_chunks) for store_chunks in by_store], default = 0)):
+        for store_chunks in by_store:
+            if i < len(store_chunks):
+                chunks.append({"id": len(chunks), **store_chunks[i]})
+
+    return chunks
+
+
+def worker(worker_id, scrapers, inbox, results, slots, launch_config = {}, browser_config = {}):
+    """
+    Worker process entry point, see run_worker.
+    """
+    try:
+        asyncio.run(run_worker(worker_id, scrapers, inbox, results, slots, launch_config, browser_config))
+    finally:
+        # the last lines are usually the ones saying why a worker failed
+        logtag.stop_listener()
+
+
+async def run_worker(worker_id, scrapers, inbox, results, slots, launch_config = {}, browser_config = {}):
+    """
+    Launch one browser and scrape chunks from inbox until it hands over None.
+    Every product is put on results as soon as it is scraped, so the parent
+    knows exactly which urls are left if this process dies halfway through.
+
+    :param worker_id: int identifying this worker in messages to the parent
+    :param scrapers: dict of store name -> coroutine function, like
+        orchestrator.run_stores takes
+    :param inbox: multiprocessing.Queue with chunks from shard(), then None
+    :param results: multiprocessing.Queue shared by every worker, gets
+        ("ready"|"product"|"done", worker_id, value) tuples
+    :param slots: dict from politeness.shared_slots()
+    :param launch_config: dictionary with playwright launch config parameters
+    :param browser_config: dictionary with playwright browser context parameters
+
+    :return: None
+    """
+    scheduler = PolitenessScheduler(enabled = har_mode() != "replay", slots = slots)
+    breaker = CircuitBreaker()
+
+    async with Stealth().use_async(async_playwright()) as p:
+        pool = BrowserPool(
+            playwright = p,
+            size = 1,
+            launch_config = launch_config,
+            browser_config = browser_config,
+            max_uses = pool_max_uses(),
+            max_rss_mb = pool_max_rss_mb(),
+        )
+
+        try:
+            await pool.start()
+            results.put(("ready", worker_id, None))
+
+            while True:
+                # the pool may be relaunching a browser in the background, so
+                # don't block the event loop while waiting for work
+                chunk = await asyncio.to_thread(inbox.get)
+                if chunk is None:
+                    break
+
+                store = chunk["store"]
+                await run_store(
+                    pool, store, scrapers[store], chunk["urls"], scheduler,
+                    on_product = lambda product: results.put(("product", worker_id, {**product, "store": store})),
+                    breaker = breaker,
+                )
+                results.put(("done", worker_id, chunk["id"]))
+        finally:
+            await artifacts.flush()
+            await pool.close()
+
+    breaker.save()
+    scheduler.log_stats()
+    readiness.log_stats()
+
+    # one trace per worker, they'd overwrite each other otherwise
+    root, extension = os.path.splitext(trace_file())
+    tracing.export(f"{root}.worker-{worker_id}{extension}")
+
+
+def run(scrapers, urls = None, workers = None, launch_config = {}, browser_config = {}, max_restarts = None):
+    """
+    Scrape stores with several worker processes, each driving its own
+    browser, so a run can use more than one core. The product urls are split
+    into chunks (see shard()) that are handed to whichever worker is free.
+    Products are streamed back as they are scraped. A worker that dies is
+    replaced and the urls it hadn't finished go back in line for the next
+    free worker.
+
+    Sites are still paced by config.POLITENESS_INTERVALS across all workers
+    together, so adding workers only speeds up a site until its politeness
+    delay is the bottleneck.
+
+    :param scrapers: dict of store name -> coroutine function taking
+        (page, urls, scheduler, on_product, breaker) and returning a list
+        of product dicts. Has to be importable by name, e.g. defined in main.py
+    :param urls: dict of store name -> list of product urls. Stores missing
+        from it fall back to config.PRODUCT_URLS
+    :param workers: number of worker processes. Defaults to
+        config.scrape_workers()
+    :param launch_config: dictionary with playwright launch config parameters
+    :param browser_config: dictionary with playwright browser context parameters
+    :param max_restarts: how many crashed workers to replace. Defaults to
+        config.worker_max_restarts()
+
+    :return: list of product dicts from every store, each tagged with "store"
+    """
+    if not isinstance(scrapers, dict):
+        raise ValueError(
+            f"({__name__}.run) invalid scrapers parameter. Expecting type dict, "
+            f"received {type(scrapers)} instead"
+        )
+
+    if urls is None:
+        urls = {}
+    if workers is None:
+        workers = scrape_workers()
+    if max_restarts is None:
+        max_restarts = worker_max_restarts()
+
+    if har_mode() == "record" and workers > 1:
+        # every worker would write the same per-store HAR file
+        logger.warning("HAR_MODE=record needs a single worker, ignoring %s workers", workers)
+        workers = 1
+
+    chunks = shard({store: urls.get(store, PRODUCT_URLS[store]) for store in scrapers}, workers)
+    pending = collections.deque(chunks)
+    workers = min(workers, len(chunks))
+
+    logger.info("Scraping %s chunk(s) with %s worker process(es)...", len(chunks), workers)
+    start_time = time.monotonic()
+
+    results = multiprocessing.Queue()
+    slots = shared_slots()
+
+    # worker id -> dict with process, inbox, ready and the chunk it's on.
+    # ids are never reused, so a message from a dead worker can't be
+    # mistaken for one from its replacement
+    states = {}
+    next_id = [0]
+
+    def start_worker():
+        worker_id = next_id[0]
+        next_id[0] += 1
+
+        inbox = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target = worker,
+            args = (worker_id, scrapers, inbox, results, slots, launch_config, browser_config),
+            name = f"scrape-worker-{worker_id}",
+            daemon = True,
+        )
+        process.start()
+        states[worker_id] = {"process": process, "inbox": inbox, "ready": False, "chunk": None}
+
+    products = []
+    scraped_urls = set()
+    restarts = 0
+
+    for _ in range(workers):
+        start_worker()
+
+    try:
+        while states and (pending or any(state["chunk"] is not None for state in states.values())):
+            try:
+                kind, worker_id, value = results.get(timeout = POLL_INTERVAL)
+            except queue.Empty:
+                kind = None
+
+            if kind == "product":
+                # a worker can die after sending a product but before we read
+                # it, and its url may have been handed out again since
+                if value["url"] not in scraped_urls:
+                    scraped_urls.add(value["url"])
+                    products.append(value)
+                    logger.debug(
+                        "[worker %s] got %s", worker_id, value["url"],
+                        extra = {"store": value["store"], "url": value["url"]},
+                    )
+            elif kind in ["ready", "done"] and worker_id in states:
+                states[worker_id]["ready"] = True
+                states[worker_id]["chunk"] = None
+
+            # replace dead workers and put what they didn't finish back in line
+            for worker_id, state in list(states.items()):
+                if state["process"].is_alive():
+                    continue
+
+                del states[worker_id]
+                logger.error("[worker %s] died with exit code %s!", worker_id, state["process"].exitcode)
+
+                if state["chunk"] is not None:
+                    left = [url for url in state["chunk"]["urls"] if url not in scraped_urls]
+                    if left:
+                        logger.info("[worker %s] re-queueing %s unfinished url(s)", worker_id, len(left))
+                        pending.appendleft({**state["chunk"], "urls": left})
+
+                if restarts < max_restarts:
+                    restarts += 1
+                    start_worker()
+
+            for worker_id, state in states.items():
+                if pending and state["ready"] and state["chunk"] is None:
+                    state["chunk"] = pending.popleft()
+                    state["inbox"].put(state["chunk"])
+    finally:
+        for state in states.values():
+            state["inbox"].put(None)
+        for state in states.values():
+            state["process"].join(SHUTDOWN_TIMEOUT)
+            if state["process"].is_alive():
+                logger.warning("%s did not stop, terminating it...", state["process"].name)
+                state["process"].terminate()
+
+    left = sum(len(chunk["urls"]) for chunk in pending)
+    if left:
+        logger.error("Gave up on %s url(s) after %s worker restart(s)!", left, restarts)
+
+    logger.info(
+        "Collected %s product(s) with %s worker process(es) in %.1f seconds",
+        len(products), workers, time.monotonic() - start_time,
+    )
+    return products
@@ -0,0 +1,70 @@
+import glob
+import logging
+import os
+import re
+
+from .config import *
+
+logger = logging.getLogger(__name__)
+
+
+def url_slug(url):
+    """
+    Turn a url into something safe to use in a file name.
+
+    :param url: product page url
+
+    :return: str with the url's letters and digits, joined by dashes
+    """
+    return re.sub(r"[^a-zA-Z0-9]+", "-", url.split("://", 1)[-1]).strip("-")
+
+
+def snapshot_path(store, url):
+    """
+    Get the file a product page snapshot is saved to.
+
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param url: product page url
+
+    :return: str with path to the html file
+    """
+    return os.path.join(snapshot_dir(), store, url_slug(url) + ".html")
+
+
+async def save_snapshot(page, store, url):
+    """
+    Save the rendered html of a product page.
+
+    :param page: valid handle to playwright.async_api.Page to control browser
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param url: product page url
+    """
+    # xhr capture can hand back a product before the page has rendered
+    await page.wait_for_load_state("load")
+
+    path = snapshot_path(store, url)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, "w") as f:
+        f.write(await page.content())
+
+    logger.info("[%s] Saved snapshot of %s to %s", store, url, path)
+
+
+def load_snapshots(store, directory = None):
+    """
+    Read every saved product page snapshot for a store.
+
+    :param store: store name (key in config.PRODUCT_URLS)
+    :param directory: override for config.snapshot_dir()
+
+    :return: dict of file path -> html string
+    """
+    if directory is None:
+        directory = snapshot_dir()
+
+    snapshots = {}
+    for path in sorted(glob.glob(os.path.join(directory, store, "*.html"))):
+        with open(path) as f:
+            snapshots[path] = f.read()
+
+    return snapshots
@@ -0,0 +1,181 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import statistics
+import time
+
+from .config import *
+
+logger = logging.getLogger(__name__)
+
+# tags a child span copies from its parent, so a parser call made while
+# scraping a url is filed under that store and url without being told
+INHERITED_TAGS = ["store", "url"]
+
+# every finished span of this run, in the order they finished
+spans = []
+
+# the innermost open span of the running task. contextvars give every asyncio
+# task its own copy, so stores scraped side by side don't nest into each other
+current_span = contextvars.ContextVar("current_span", default = None)
+
+# handed out while tracing is off, so callers can always write to the span
+disabled_span = contextlib.nullcontext({"tags": {}})
+
+# read once, checking the environment on every span would cost more than the
+# span itself
+enabled = tracing_enabled()
+
+
+@contextlib.contextmanager
+def record_span(name, tags):
+    """
+    Time a block and add it to spans. Use span() instead, it skips all of
+    this when tracing is off.
+
+    :param name: str with step name
+    :param tags: dict of tags for this span
+
+    :return: generator for contextmanager, yields the span dict
+    """
+    parent = current_span.get()
+    if parent is not None:
+        tags = {**{key: parent["tags"][key] for key in INHERITED_TAGS if key in parent["tags"]}, **tags}
+
+    record = {
+        "name": name,
+        "path": parent["path"] + "/" + name if parent is not None else name,
+        "tags": tags,
+        "start": time.time(),
+    }
+    token = current_span.set(record)
+    start_time = time.perf_counter()
+    try:
+        yield record
+        record["tags"].setdefault("outcome", "ok")
+    except BaseException as e:
+        record["tags"]["outcome"] = type(e).__name__
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - start_time
+        current_span.reset(token)
+        spans.append(record)
+
+
+def span(name, **tags):
+    """
+    Time a step, e.g. `with tracing.span("set_location", store = "costco"):`.
+    Spans nest, and record outcome "ok" or the name of the exception that
+    escaped. Call set_outcome() inside the block to report something else,
+    like "dom_fallback".
+
+    :param name: str with step name
+    :param tags: tags to record with the span, e.g. store and url
+
+    :return: context manager yielding a dict with the span's "tags"
+    """
+    if not enabled:
+        return disabled_span
+    return record_span(name, tags)
+
+
+def set_outcome(outcome):
+    """
+    Report how the innermost open span went, e.g. "fallback", instead of "ok".
+    Does nothing when tracing is off.
+
+    :param outcome: str with outcome
+
+    :return: None
+    """
+    record = current_span.get() if enabled else None
+    if record is not None:
+        record["tags"]["outcome"] = outcome
+
+
+def traced(function):
+    """
+    Decorator that wraps every call of a function (sync or async) in a span
+    named after it.
+
+    :param function: function or coroutine function to trace
+
+    :return: wrapped function
+    """
+    name = function.__module__.rsplit(".", 1)[-1] + "." + function.__name__
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            if not enabled:
+                return await function(*args, **kwargs)
+            with record_span(name, {}):
+                return await function(*args, **kwargs)
+    else:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with record_span(name, {}):
+                return function(*args, **kwargs)
+
+    return wrapper
+
+
+def summary():
+    """
+    Boil the recorded spans down to latency percentiles per step.
+
+    :return: dict of span path -> dict with count, total, p50, p95 (seconds)
+        and outcomes (dict of outcome -> count)
+    """
+    durations = {}
+    outcomes = {}
+    for record in spans:
+        durations.setdefault(record["path"], []).append(record["duration"])
+        counts = outcomes.setdefault(record["path"], {})
+        counts[record["tags"]["outcome"]] = counts.get(record["tags"]["outcome"], 0) + 1
+
+    result = {}
+    for path, times in durations.items():
+        if len(times) > 1:
+            cuts = statistics.quantiles(times, n = 100, method = "inclusive")
+            p50, p95 = cuts[49], cuts[94]
+        else:
+            p50 = p95 = times[0]
+
+        result[path] = {"count": len(times), "total": sum(times), "p50": p50, "p95": p95, "outcomes": outcomes[path]}
+
+    return result
+
+
+def export(path = None):
+    """
+    Write the run's summary and every span to a json file, log the summary
+    and start over for the next run. Does nothing when tracing is off.
+
+    :param path: override for config.trace_file()
+
+    :return: str with the path written, or None if tracing is off
+    """
+    if not enabled:
+        return None
+
+    if path is None:
+        path = trace_file()
+
+    result = summary()
+    with open(path, "w") as f:
+        json.dump({"summary": result, "spans": spans}, f, indent = 2, default = str)
+
+    for name, stats in sorted(result.items(), key = lambda item: -item[1]["total"]):
+        logger.info(
+            "%s: %sx, total %.2fs, p50 %.0fms, p95 %.0fms",
+            name, stats["count"], stats["total"], stats["p50"] * 1000, stats["p95"] * 1000,
+        )
+    logger.info("Wrote %s span(s) to %s", len(spans), path)
+    spans.clear()
+    return path
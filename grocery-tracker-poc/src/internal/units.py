@@ -0,0 +1,170 @@
+from fractions import Fraction
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# unit spelling -> (dimension, how many canonical units one of it is).
+# Canonical units are lb for weight, fl oz for volume and ct for counts,
+# since that's what us grocery shelf tags use
+UNITS = {
+    "lb": ("weight", 1.0),
+    "lbs": ("weight", 1.0),
+    "pound": ("weight", 1.0),
+    "pounds": ("weight", 1.0),
+    "oz": ("weight", 1 / 16),
+    "ounce": ("weight", 1 / 16),
+    "ounces": ("weight", 1 / 16),
+    "g": ("weight", 1 / 453.59237),
+    "gram": ("weight", 1 / 453.59237),
+    "grams": ("weight", 1 / 453.59237),
+    "kg": ("weight", 1000 / 453.59237),
+    "fl oz": ("volume", 1.0),
+    "floz": ("volume", 1.0),
+    "fluid ounce": ("volume", 1.0),
+    "fluid ounces": ("volume", 1.0),
+    "ml": ("volume", 1 / 29.5735295625),
+    "l": ("volume", 1000 / 29.5735295625),
+    "liter": ("volume", 1000 / 29.5735295625),
+    "liters": ("volume", 1000 / 29.5735295625),
+    "pt": ("volume", 16.0),
+    "pint": ("volume", 16.0),
+    "qt": ("volume", 32.0),
+    "quart": ("volume", 32.0),
+    "gal": ("volume", 128.0),
+    "gallon": ("volume", 128.0),
+    "ct": ("count", 1.0),
+    "count": ("count", 1.0),
+    "each": ("count", 1.0),
+    "ea": ("count", 1.0),
+    "pk": ("count", 1.0),
+    "pack": ("count", 1.0),
+}
+
+CANONICAL_UNITS = {
+    "weight": "lb",
+    "volume": "fl oz",
+    "count": "ct",
+}
+
+# weight and volume say more about value than "2 pack", so they win when a
+# name mentions both
+DIMENSION_PRIORITY = ["weight", "volume", "count"]
+
+# "2", "1.5", "1/2" or a mixed number like "1 1/2"
+number_pattern = r"[0-9]+(?:\.[0-9]+)?(?:\s+[0-9]+\s*/\s*[0-9]+|\s*/\s*[0-9]+)?"
+mixed_number_re = re.compile(r"(?P<whole>[0-9]+)\s+(?P<fraction>[0-9]+\s*/\s*[0-9]+)")
+unit_pattern = "|".join(re.escape(unit) for unit in sorted(UNITS, key = len, reverse = True))
+quantity_re = re.compile(
+    rf"(?:(?P<multiplier>[0-9]+)\s*(?:x|×)\s*)?(?P<amount>{number_pattern})\s*-?\s*(?P<unit>{unit_pattern})\.?(?![a-z])",
+    re.IGNORECASE,
+)
+
+# (store, sku) -> parsed quantity. Product names don't change between
+# scrapes, so each sku only has to be parsed once per process
+quantity_cache = {}
+
+
+def parse_number(text):
+    """
+    Parse "2", "1.5", "1/2" or "1 1/2" into a float. Raises ValueError if
+    text isn't a number and ZeroDivisionError for a fraction like "1/0".
+
+    :param text: str with a number, simple fraction or mixed number
+
+    :return: float
+    """
+    mixed = mixed_number_re.fullmatch(text.strip())
+    if mixed:
+        return int(mixed.group("whole")) + parse_number(mixed.group("fraction"))
+    return float(Fraction(text.replace(" ", "")))
+
+
+def parse_quantity(text):
+    """
+    Find the package size in a product name or size string, e.g.
+    "strawberries 2 lbs 2 lb" or "2 x 16 oz".
+
+    :param text: str to search
+
+    :return: dict with quantity and unit in canonical units, or None if no
+        size was found
+    """
+    if not text:
+        return None
+
+    best = None
+    for match in quantity_re.finditer(text):
+        dimension, factor = UNITS[re.sub(r"\s+", " ", match.group("unit").lower())]
+        try:
+            amount = parse_number(match.group("amount"))
+        except (ValueError, ZeroDivisionError):
+            logger.debug("Ignoring size \"%s\" in \"%s\"", match.group(0), text)
+            continue
+        if match.group("multiplier"):
+            amount *= int(match.group("multiplier"))
+
+        if amount <= 0:
+            continue
+
+        # later mentions win ties, the size usually comes at the end
+        candidate = {
+            "quantity": amount * factor,
+            "unit": CANONICAL_UNITS[dimension],
+            "rank": DIMENSION_PRIORITY.index(dimension),
+        }
+        if best is None or candidate["rank"] <= best["rank"]:
+            best = candidate
+
+    if best is None:
+        return None
+
+    return {"quantity": best["quantity"], "unit": best["unit"]}
+
+
+def product_quantity(product, store = None):
+    """
+    Get the package size of a product, using the cache when the sku has been
+    seen before. An explicit size field is preferred over the name.
+
+    :param product: Product
+    :param store: store name, defaults to product["store"]
+
+    :return: dict with quantity and unit, or None if unknown
+    """
+    key = (store or product.get("store"), product.get("sku"))
+    if key[1] is not None and key in quantity_cache:
+        return quantity_cache[key]
+
+    quantity = parse_quantity(product.get("size")) or parse_quantity(product.get("name"))
+
+    if key[1] is not None:
+        quantity_cache[key] = quantity
+    return quantity
+
+
+def normalize(product, store = None):
+    """
+    Add quantity, unit and unit_price (price per canonical unit) to a product
+    record in place.
+
+    :param product: Product
+    :param store: store name, defaults to product["store"]
+
+    :return: the same product
+    """
+    quantity = product_quantity(product, store)
+
+    if quantity is None:
+        logger.info("Could not find a package size for \"%s\"", product.get("name"))
+        product["quantity"] = None
+        product["unit"] = None
+        product["unit_price"] = None
+        return product
+
+    product["quantity"] = quantity["quantity"]
+    product["unit"] = quantity["unit"]
+    product["unit_price"] = (
+        round(product["price"] / quantity["quantity"], 4) if product.get("price") is not None else None
+    )
+    return product
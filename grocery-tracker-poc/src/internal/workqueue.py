@@ -0,0 +1,309 @@
+from abc import ABC, abstractmethod
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+from .config import *
+
+logger = logging.getLogger(__name__)
+
+# one row per (store, url). state goes pending -> leased -> done, or back to
+# pending when a lease is released or runs out. Times are unix timestamps,
+# since every node reading the queue has to agree on them
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work (
+    id INTEGER PRIMARY KEY,
+    store TEXT NOT NULL,
+    url TEXT NOT NULL,
+    state TEXT NOT NULL,
+    available_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_token TEXT,
+    lease_expires REAL,
+    done_at REAL,
+    UNIQUE (store, url)
+);
+CREATE INDEX IF NOT EXISTS work_state_available_at ON work (state, available_at);
+"""
+
+# a url that is put while it is already waiting or leased is left alone. One
+# that is done (or failed) is queued again, unless it was finished recently
+PUT_QUERY = """
+INSERT INTO work (store, url, state, available_at) VALUES (?, ?, 'pending', ?)
+ON CONFLICT (store, url) DO UPDATE SET
+    state = 'pending', available_at = excluded.available_at, attempts = 0,
+    lease_owner = NULL, lease_token = NULL, lease_expires = NULL
+WHERE work.state IN ('done', 'failed') AND COALESCE(work.done_at, 0) <= ?
+"""
+
+
+class WorkQueue(ABC):
+    """
+    Shared backlog of product urls for several scraper nodes. A node leases
+    a few urls, scrapes them and acknowledges each one it finished. A lease
+    runs out after its visibility timeout, so urls held by a node that died
+    go back to the other nodes without anyone cleaning up.
+
+    Items are dicts with id, store, url, token and attempts. Subclasses
+    implement every abstract method below, see SqliteWorkQueue, and are picked by
+    open_queue() through BACKENDS.
+    """
+
+    @abstractmethod
+    def put(self, urls_by_store, skip_done_within = 0):
+        """
+        Queue product urls. Urls that are already waiting or leased are left
+        alone, so every node can safely put its whole due list.
+
+        :param urls_by_store: dict of store name -> list of product urls,
+            like config.PRODUCT_URLS
+        :param skip_done_within: seconds, urls acknowledged more recently
+            than this aren't queued again
+
+        :return: int with number of urls queued
+        """
+
+    @abstractmethod
+    def lease(self, owner, count, visibility_timeout, stores = None):
+        """
+        Take up to count available urls. Nobody else gets them until they are
+        acknowledged, released or visibility_timeout seconds have passed.
+
+        :param owner: str naming the node, for logs and stats
+        :param count: maximum number of urls to lease
+        :param visibility_timeout: seconds until the lease runs out
+        :param stores: list of store names this node can scrape, None for any
+
+        :return: list of item dicts, empty if nothing is available
+        """
+
+    @abstractmethod
+    def ack(self, item):
+        """
+        Mark a leased url as done.
+
+        :param item: dict from lease()
+
+        :return: bool - False if the lease had already run out and the url
+            may have been handed to someone else
+        """
+
+    @abstractmethod
+    def release(self, item, delay = 0, count_attempt = True):
+        """
+        Give a leased url back without finishing it, e.g. after its scrape
+        failed.
+
+        :param item: dict from lease()
+        :param delay: seconds before the url can be leased again
+        :param count_attempt: False if the url was never tried, e.g. its
+            store's circuit was open, so the lease doesn't count towards
+            the url being given up on
+
+        :return: bool - False if the lease had already run out
+        """
+
+    @abstractmethod
+    def extend(self, item, visibility_timeout):
+        """
+        Keep a lease for visibility_timeout more seconds from now.
+
+        :param item: dict from lease()
+        :param visibility_timeout: seconds until the lease runs out
+
+        :return: bool - False if the lease had already run out
+        """
+
+    @abstractmethod
+    def stats(self):
+        """
+        :return: dict of state ("pending"|"leased"|"done"|"failed") -> count
+        """
+
+    def close(self):
+        """
+        Let go of any connection to the queue.
+        """
+
+
+class SqliteWorkQueue(WorkQueue):
+    """
+    WorkQueue in a sqlite file, so it runs without any outside service.
+    Nodes on the same machine, e.g. several containers with the file on a
+    shared volume, coordinate through sqlite's write lock. Sqlite locking
+    isn't reliable over network file systems, so nodes on different machines
+    need a networked backend instead (see BACKENDS).
+    """
+
+    def __init__(self, path, max_attempts = 5):
+        """
+        :param path: str with path to the sqlite file, created if missing
+        :param max_attempts: leases a url gets before it is marked failed
+            instead of being retried forever
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+
+        # autocommit, every write below opens its own transaction
+        self.conn = sqlite3.connect(path, timeout = 30, isolation_level = None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+
+    def put(self, urls_by_store, skip_done_within = 0):
+        now = time.time()
+        rows = [(store, url, now, now - skip_done_within) for store, urls in urls_by_store.items() for url in urls]
+
+        before = self.conn.total_changes
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(PUT_QUERY, rows)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return self.conn.total_changes - before
+
+    def lease(self, owner, count, visibility_timeout, stores = None):
+        now = time.time()
+        query = (
+            "SELECT id, store, url, attempts FROM work "
+            "WHERE ((state = 'pending' AND available_at <= ?) OR (state = 'leased' AND lease_expires <= ?))"
+        )
+        parameters = [now, now]
+        if stores is not None:
+            query += f" AND store IN ({', '.join('?' * len(stores))})"
+            parameters += stores
+        query += " ORDER BY available_at LIMIT ?"
+        parameters.append(count)
+
+        items = []
+
+        # take the write lock before looking, so two nodes can't pick the
+        # same rows
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for row in self.conn.execute(query, parameters).fetchall():
+                if row["attempts"] >= self.max_attempts:
+                    logger.warning(
+                        "Giving up on %s after %s attempt(s)", row["url"], row["attempts"],
+                        extra = {"store": row["store"], "url": row["url"]},
+                    )
+                    self.conn.execute("UPDATE work SET state = 'failed', done_at = ? WHERE id = ?", (now, row["id"]))
+                    continue
+
+                token = uuid.uuid4().hex
+                self.conn.execute(
+                    "UPDATE work SET state = 'leased', attempts = attempts + 1, "
+                    "lease_owner = ?, lease_token = ?, lease_expires = ? WHERE id = ?",
+                    (owner, token, now + visibility_timeout, row["id"]),
+                )
+                items.append({
+                    "id": row["id"],
+                    "store": row["store"],
+                    "url": row["url"],
+                    "token": token,
+                    "attempts": row["attempts"] + 1,
+                })
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return items
+
+    def update_lease(self, item, assignments, parameters):
+        """
+        Change a row only while item still holds its lease.
+
+        :param item: dict from lease()
+        :param assignments: str with the SET clause, with ? placeholders
+        :param parameters: tuple of values for the placeholders
+
+        :return: bool - True if the row was changed
+        """
+        cursor = self.conn.execute(
+            f"UPDATE work SET {assignments} WHERE id = ? AND state = 'leased' AND lease_token = ?",
+            (*parameters, item["id"], item["token"]),
+        )
+        if cursor.rowcount == 0:
+            logger.warning(
+                "Lease on %s ran out before it was finished", item["url"],
+                extra = {"store": item["store"], "url": item["url"]},
+            )
+            return False
+        return True
+
+    def ack(self, item):
+        return self.update_lease(
+            item, "state = 'done', done_at = ?, lease_token = NULL, lease_expires = NULL", (time.time(),)
+        )
+
+    def release(self, item, delay = 0, count_attempt = True):
+        return self.update_lease(
+            item,
+            "state = 'pending', available_at = ?, attempts = attempts - ?, lease_token = NULL, lease_expires = NULL",
+            (time.time() + delay, 0 if count_attempt else 1),
+        )
+
+    def extend(self, item, visibility_timeout):
+        return self.update_lease(item, "lease_expires = ?", (time.time() + visibility_timeout,))
+
+    def stats(self):
+        rows = self.conn.execute("SELECT state, COUNT(*) AS count FROM work GROUP BY state")
+        return {row["state"]: row["count"] for row in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+def sqlite_queue(url):
+    """
+    :param url: str like "sqlite:///data/queue.sqlite" (absolute path) or
+        "sqlite:queue.sqlite" (relative path)
+
+    :return: SqliteWorkQueue
+    """
+    return SqliteWorkQueue(url.split(":", 1)[1].removeprefix("//"))
+
+
+# url scheme -> function taking the whole config.work_queue() url and
+# returning a WorkQueue. A networked broker (redis, sqs, ...) plugs in here,
+# e.g. `workqueue.BACKENDS["redis"] = RedisWorkQueue.from_url`, and is then
+# picked with WORK_QUEUE=redis://host:6379/0
+BACKENDS = {
+    "sqlite": sqlite_queue,
+}
+
+
+def open_queue(url = None):
+    """
+    Open the shared work queue.
+
+    :param url: override for config.work_queue()
+
+    :return: WorkQueue from the backend matching the url's scheme
+    """
+    if url is None:
+        url = work_queue()
+
+    scheme = url.split(":", 1)[0]
+    if scheme not in BACKENDS:
+        raise ValueError(
+            f"({__name__}.open_queue) invalid url parameter. Expecting a scheme in "
+            f"{list(BACKENDS)}, received {url}"
+        )
+
+    return BACKENDS[scheme](url)
+
+
+def node_name():
+    """
+    :return: str naming this node in leases, the container id inside docker
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
@@ -1,123 +1,517 @@
+import asyncio
 from datetime import datetime
-import inspect
 import logging
 import os
+from playwright.async_api import async_playwright, Page as AsyncPage, TimeoutError as AsyncTimeoutError
 from playwright.sync_api import expect, Page, Playwright, sync_playwright, TimeoutError
 from playwright_stealth import Stealth
-import random
 import time
 
-from internal import common, config, diagnostic
-from internal.parsers import costco_sameday, safeway
+from internal import analytics, artifacts, capture, circuit, common, config, diagnostic, har, history, logtag, orchestrator, planner, politeness, ranking, routing, session, sharding, snapshot, tracing, units, workqueue
+from internal.parsers import costco_sameday, costco_sameday_async, safeway, safeway_async
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format = "[%(levelname)s] %(message)s")
-
-
-def get_safeway_products(page: Page):
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
-    if not isinstance(page, Page):
+logtag.setup()
+
+SAFEWAY_LOCATION = {
+    "street": "639 S Bernardo Ave",
+    "zip": "94087",
+}
+
+# hardcoded for now
+COSTCO_LOCATION = {
+    "street": "Rengstorff Avenue",
+    "zip": "94041"
+}
+
+
+async def scrape_safeway(page: AsyncPage, urls = None, scheduler = None, on_product = None, breaker = None):
+    """
+    Set the safeway store location and extract every product in urls.
+
+    :param page: playwright async page object
+    :param urls: list of safeway product urls, defaults to config.PRODUCT_URLS
+    :param scheduler: politeness.PolitenessScheduler shared with the other
+        stores, defaults to a new one
+    :param on_product: function called with every product dict as soon as it
+        is scraped, e.g. to stream it to another process
+    :param breaker: circuit.CircuitBreaker that stops the scrape once the
+        store keeps failing, defaults to a new one
+
+    :return: list of product dicts
+    """
+    if not isinstance(page, AsyncPage):
         raise ValueError(
-            f"({tag}) invalid page parameter. Expecting type playwright.sync_api.Page, "
+            f"({__name__}.scrape_safeway) invalid page parameter. "
+            f"Expecting type playwright.async_api.Page, "
             f"received {type(page)} instead"
         )
 
-    safeway_loc = {
-        "street": "639 S Bernardo Ave",
-        "zip": "94087",
-    }
-
-    safeway.navigate_to_storefront(page)
-    safeway.set_location(page, safeway_loc["street"], safeway_loc["zip"])
-
-    for url in config.PRODUCT_URLS["safeway"]:
-        page_nav_delay = 10 + random.uniform(-5, 30)
-
-        logger.info(f"({tag}) sleeping for {page_nav_delay} seconds before navigating...")
-        time.sleep(page_nav_delay)
-
-        logger.info(f"({tag}) browsing to {url} now...")
-        page.goto(url)
-
-        # extract information
-        product = {
-            "name": safeway.get_product_name(page),
-            "sku": safeway.get_product_inventory_number(page),
-            "price": safeway.get_product_price(page),
-            "availability": None,
-            "date": datetime.now(),
-            "location": safeway_loc["street"] + ", " + safeway_loc["zip"],
-        }
-
-        logger.info(f"Extracted information for \"{product['name']}\" from {url}...")
-        logger.info(f"{product}")
-
-    logger.info("Taking screenshot...")
-    page.screenshot(path="test-screenshot.no-git.png")
-
-
-def get_costco_products(page: Page):
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
-    if not isinstance(page, Page):
+    if scheduler is None:
+        scheduler = politeness.PolitenessScheduler(enabled = config.har_mode() != "replay")
+    if breaker is None:
+        breaker = circuit.CircuitBreaker()
+
+    await har.install_har(page, "safeway")
+    route_stats = await routing.install_routes(page, "safeway")
+
+    await session.ensure_location(
+        page, "safeway", safeway_async, SAFEWAY_LOCATION["street"], SAFEWAY_LOCATION["zip"]
+    )
+
+    if urls is None:
+        urls = config.PRODUCT_URLS["safeway"]
+
+    products = []
+    for i, url in enumerate(urls):
+        # stop burning timeouts on a site that keeps failing, the rest of the
+        # urls are picked up by a later run
+        if not breaker.allow("safeway"):
+            logger.warning("[safeway] circuit is open, deferring %s url(s)", len(urls) - i)
+            break
+
+        # only this store waits, the others keep going on the same event loop
+        with tracing.span("politeness_wait", url = url):
+            await scheduler.wait(url)
+
+        logger.info("browsing to %s now...", url)
+
+        with tracing.span("scrape_product", url = url):
+            start_time = time.monotonic()
+
+            # extract information
+            try:
+                product = await capture.extract_product_from_page(page, url, safeway, safeway_async)
+            except Exception as e:
+                logger.exception("Could not extract %s!", url)
+                tracing.set_outcome(type(e).__name__)
+                breaker.record_failure("safeway", f"{type(e).__name__} on {url}")
+                await artifacts.capture(page, "safeway", url, f"{type(e).__name__}: {e}")
+                continue
+
+            product["date"] = datetime.now()
+            product["location"] = SAFEWAY_LOCATION["street"] + ", " + SAFEWAY_LOCATION["zip"]
+            product["url"] = url
+            units.normalize(product, "safeway")
+
+            if config.save_snapshots():
+                await snapshot.save_snapshot(page, "safeway", url)
+
+            reasons = artifacts.anomalies(product)
+            if reasons:
+                logger.warning(
+                    "Suspicious product from %s: %s", url, ", ".join(reasons),
+                    extra = {"store": "safeway", "url": url},
+                )
+                await artifacts.capture(page, "safeway", url, ", ".join(reasons))
+
+            # a missing price can be a normal out of stock item, only a page
+            # without a name or sku means the site isn't what the parser expects
+            if product["name"] is None or product["sku"] is None:
+                breaker.record_failure("safeway", f"{', '.join(reasons)} on {url}")
+            else:
+                breaker.record_success("safeway")
+
+            logger.info(
+                "Extracted information for \"%s\" from %s...", product["name"], url,
+                extra = {
+                    "store": "safeway",
+                    "sku": product["sku"],
+                    "url": url,
+                    "price": product["price"],
+                    "duration": time.monotonic() - start_time,
+                },
+            )
+            logger.debug("%s", product)
+            products.append(product)
+            if on_product is not None:
+                on_product(product)
+
+    routing.log_route_stats(route_stats)
+
+    return products
+
+
+async def scrape_costco(page: AsyncPage, urls = None, scheduler = None, on_product = None, breaker = None):
+    """
+    Set the costco sameday store location and extract every product in urls.
+
+    :param page: playwright async page object
+    :param urls: list of costco product urls, defaults to config.PRODUCT_URLS
+    :param scheduler: politeness.PolitenessScheduler shared with the other
+        stores, defaults to a new one
+    :param on_product: function called with every product dict as soon as it
+        is scraped, e.g. to stream it to another process
+    :param breaker: circuit.CircuitBreaker that stops the scrape once the
+        store keeps failing, defaults to a new one
+
+    :return: list of product dicts
+    """
+    if not isinstance(page, AsyncPage):
         raise ValueError(
-            f"({tag}) invalid page parameter. Expecting type playwright.sync_api.Page, "
+            f"({__name__}.scrape_costco) invalid page parameter. "
+            f"Expecting type playwright.async_api.Page, "
             f"received {type(page)} instead"
         )
 
-    # hardcoded for now
-    costco_loc = {
-        "street": "Rengstorff Avenue",
-        "zip": "94041"
-    }
+    if scheduler is None:
+        scheduler = politeness.PolitenessScheduler(enabled = config.har_mode() != "replay")
+    if breaker is None:
+        breaker = circuit.CircuitBreaker()
 
-    # get to the website
-    costco_sameday.navigate_to_storefront(page)
+    await har.install_har(page, "costco")
+    route_stats = await routing.install_routes(page, "costco")
 
+    # get to the website
     try:
-        costco_sameday.set_location(page, costco_loc["street"], costco_loc["zip"])
-    except TimeoutError:
+        await session.ensure_location(
+            page, "costco", costco_sameday_async, COSTCO_LOCATION["street"], COSTCO_LOCATION["zip"]
+        )
+    except AsyncTimeoutError:
         logger.warning("set_location has timed out! This probably is fine... proceeding anyway.")
+        breaker.record_failure("costco", "set_location timed out")
 
     # now go to a product
-    for url in config.PRODUCT_URLS["costco"]:
-        page.goto(url)
-
-        # extract information
-        product = {
-            "name": costco_sameday.get_product_name(page),
-            "sku": costco_sameday.get_product_inventory_number(page),
-            "price": costco_sameday.get_product_price(page),
-            "availability": costco_sameday.get_product_availability(page),
-            "date": datetime.now(),
-            "location": costco_loc["street"] + ", " + costco_loc["zip"],
-        }
-
-        logger.info(f"Extracted information for \"{product['name']}\" from {url}...")
-        logger.info(f"{product}")
+    if urls is None:
+        urls = config.PRODUCT_URLS["costco"]
+
+    products = []
+    for i, url in enumerate(urls):
+        if not breaker.allow("costco"):
+            logger.warning("[costco] circuit is open, deferring %s url(s)", len(urls) - i)
+            break
+
+        with tracing.span("politeness_wait", url = url):
+            await scheduler.wait(url)
+
+        with tracing.span("scrape_product", url = url):
+            start_time = time.monotonic()
+
+            # extract information
+            try:
+                product = await capture.extract_product_from_page(
+                    page, url, costco_sameday, costco_sameday_async
+                )
+            except Exception as e:
+                logger.exception("Could not extract %s!", url)
+                tracing.set_outcome(type(e).__name__)
+                breaker.record_failure("costco", f"{type(e).__name__} on {url}")
+                await artifacts.capture(page, "costco", url, f"{type(e).__name__}: {e}")
+                continue
+
+            product["date"] = datetime.now()
+            product["location"] = COSTCO_LOCATION["street"] + ", " + COSTCO_LOCATION["zip"]
+            product["url"] = url
+            units.normalize(product, "costco")
+
+            if config.save_snapshots():
+                await snapshot.save_snapshot(page, "costco", url)
+
+            reasons = artifacts.anomalies(product)
+            if reasons:
+                logger.warning(
+                    "Suspicious product from %s: %s", url, ", ".join(reasons),
+                    extra = {"store": "costco", "url": url},
+                )
+                await artifacts.capture(page, "costco", url, ", ".join(reasons))
+
+            # a missing price can be a normal out of stock item, only a page
+            # without a name or sku means the site isn't what the parser expects
+            if product["name"] is None or product["sku"] is None:
+                breaker.record_failure("costco", f"{', '.join(reasons)} on {url}")
+            else:
+                breaker.record_success("costco")
+
+            logger.info(
+                "Extracted information for \"%s\" from %s...", product["name"], url,
+                extra = {
+                    "store": "costco",
+                    "sku": product["sku"],
+                    "url": url,
+                    "price": product["price"],
+                    "duration": time.monotonic() - start_time,
+                },
+            )
+            logger.debug("%s", product)
+            products.append(product)
+            if on_product is not None:
+                on_product(product)
+
+    routing.log_route_stats(route_stats)
+
+    return products
+
+
+def get_safeway_products(urls = None, launch_config = {}, browser_config = {}):
+    """
+    Blocking wrapper around scrape_safeway. Launches its own browser through
+    orchestrator.run, so unlike before the async engine it no longer takes
+    a sync playwright page.
+
+    :param urls: list of safeway product urls, defaults to config.PRODUCT_URLS
+    :param launch_config: dictionary with playwright launch config parameters
+    :param browser_config: dictionary with playwright browser context parameters
+
+    :return: list of product dicts
+    """
+    return orchestrator.run(
+        scrapers = {"safeway": scrape_safeway},
+        urls = {"safeway": urls} if urls is not None else None,
+        launch_config = launch_config,
+        browser_config = browser_config,
+    )
+
+
+def get_costco_products(urls = None, launch_config = {}, browser_config = {}):
+    """
+    Blocking wrapper around scrape_costco. Launches its own browser through
+    orchestrator.run, so unlike before the async engine it no longer takes
+    a sync playwright page.
+
+    :param urls: list of costco product urls, defaults to config.PRODUCT_URLS
+    :param launch_config: dictionary with playwright launch config parameters
+    :param browser_config: dictionary with playwright browser context parameters
+
+    :return: list of product dicts
+    """
+    return orchestrator.run(
+        scrapers = {"costco": scrape_costco},
+        urls = {"costco": urls} if urls is not None else None,
+        launch_config = launch_config,
+        browser_config = browser_config,
+    )
+
+
+def scrape_urls(scrapers, urls, launch_config = {}, browser_config = {}):
+    """
+    Scrape product urls in this process, or across worker processes if
+    config.scrape_workers() asks for more than one.
+
+    :param scrapers: dict of store name -> scrape_* coroutine function
+    :param urls: dict of store name -> list of product urls
+    :param launch_config: dictionary with playwright launch config parameters
+    :param browser_config: dictionary with playwright browser context parameters
+
+    :return: list of product dicts, each tagged with "store"
+    """
+    if config.scrape_workers() > 1:
+        # urls are split across worker processes, each with its own browser
+        return sharding.run(
+            scrapers = scrapers,
+            urls = urls,
+            launch_config = launch_config,
+            browser_config = browser_config,
+        )
 
-    logger.info("Taking screenshot...")
-    page.screenshot(path="test-screenshot.no-git.png")
+    # every store gets its own browser and context, all on one event loop
+    return orchestrator.run(
+        scrapers = scrapers,
+        urls = urls,
+        launch_config = launch_config,
+        browser_config = browser_config,
+    )
+
+
+def scrape_from_queue(work_queue, scrapers, conn, launch_config = {}, browser_config = {}):
+    """
+    Lease urls from a work queue shared with other nodes and scrape them
+    until none are left. Each batch is saved to the price history before
+    its urls are acknowledged, so a node that dies halfway through never
+    loses a url. Its lease runs out and another node scrapes it instead.
+
+    :param work_queue: workqueue.WorkQueue
+    :param scrapers: dict of store name -> scrape_* coroutine function. Only
+        urls for these stores are leased
+    :param conn: connection from history.connect()
+    :param launch_config: dictionary with playwright launch config parameters
+    :param browser_config: dictionary with playwright browser context parameters
+
+    :return: list of product dicts scraped by this node
+    """
+    if config.scrape_workers() > 1:
+        # every batch is split across worker processes. Waited on from a
+        # thread, so the event loop stays free to keep the leases alive
+        async def scrape(batch_scrapers, urls):
+            return await asyncio.to_thread(
+                sharding.run,
+                scrapers = batch_scrapers,
+                urls = urls,
+                launch_config = launch_config,
+                browser_config = browser_config,
+            )
+
+        return asyncio.run(drain_queue(work_queue, scrapers, conn, scrape))
+
+    async def main():
+        async with Stealth().use_async(async_playwright()) as p:
+            # one session for the whole queue, so browsers, contexts and
+            # store locations stay warm from one batch to the next
+            scrape_session = orchestrator.Session(
+                p, len(scrapers), launch_config = launch_config, browser_config = browser_config
+            )
+            try:
+                await scrape_session.start()
+                return await drain_queue(work_queue, scrapers, conn, scrape_session.scrape)
+            finally:
+                await scrape_session.close()
+
+    return asyncio.run(main())
+
+
+async def keep_leases(work_queue, items, visibility_timeout):
+    """
+    Extend leases every third of their visibility timeout until cancelled.
+    Leases that ran out anyway are dropped from items, someone else has them.
+
+    :param work_queue: workqueue.WorkQueue
+    :param items: list of item dicts from lease()
+    :param visibility_timeout: seconds each extension keeps a lease for
+
+    :return: None
+    """
+    while items:
+        await asyncio.sleep(visibility_timeout / 3)
+        items[:] = [item for item in items if work_queue.extend(item, visibility_timeout)]
+
+
+async def drain_queue(work_queue, scrapers, conn, scrape):
+    """
+    The lease, scrape, save and acknowledge loop behind scrape_from_queue.
+
+    :param work_queue: workqueue.WorkQueue
+    :param scrapers: dict of store name -> scrape_* coroutine function
+    :param conn: connection from history.connect()
+    :param scrape: coroutine function taking (scrapers, urls) and returning
+        a list of product dicts, each tagged with "store"
+
+    :return: list of product dicts scraped by this node
+    """
+    node = workqueue.node_name()
+
+    products = []
+    while True:
+        items = work_queue.lease(
+            node, config.work_queue_lease_size(), config.work_queue_visibility_timeout(), stores = list(scrapers)
+        )
+        if not items:
+            break
+
+        logger.info("Leased %s url(s) from the work queue", len(items))
+        urls = {}
+        for item in items:
+            urls.setdefault(item["store"], []).append(item["url"])
+
+        # politeness delays alone can take a batch past the visibility
+        # timeout, and another node would scrape the same urls again
+        heartbeat = asyncio.create_task(keep_leases(work_queue, list(items), config.work_queue_visibility_timeout()))
+        try:
+            batch = await scrape({store: scrapers[store] for store in urls}, urls)
+        finally:
+            heartbeat.cancel()
+        history.append(conn, batch)
+
+        # scrapers save circuit states as they go, including in worker processes
+        breaker = circuit.CircuitBreaker()
+
+        scraped = {product["url"] for product in batch}
+        for item in items:
+            if item["url"] in scraped:
+                work_queue.ack(item)
+            elif not breaker.allow(item["store"]):
+                # deferred without being tried, so it shouldn't use up one
+                # of the url's attempts. Retry once the circuit may be closed
+                work_queue.release(
+                    item,
+                    delay = breaker.state(item["store"])["open_until"] - time.time(),
+                    count_attempt = False,
+                )
+            else:
+                # give the site a while before retrying, longer every attempt
+                work_queue.release(item, delay = 60 * 2 ** item["attempts"])
+
+        products.extend(batch)
+
+    logger.info("Work queue: %s", work_queue.stats())
+    return products
 
 
 if __name__ == "__main__":
-    with Stealth().use_sync(sync_playwright()) as p:
-        logger.info("Starting grocery-tracker-poc!")
-        logger.info(f"Environment: {config.environment()}")
-        logger.info(f"Display: {os.environ['DISPLAY'] if 'DISPLAY' in os.environ else 'None'}")
-        logger.info(f"Are we in Docker? {'YES' if config.in_docker() else 'NO'}")
-        logger.info(f"Pause at beginning? {'YES' if common.should_pause_at_beginning() else 'NO' }")
-        logger.info(f"Browser: {'CHROMIUM' if 'BROWSER' in os.environ and os.environ['BROWSER'] == 'chromium' else 'FIREFOX'}")
-
-        launch_config = { "headless": False }
-        browser_config = {
-            "viewport": {"width": 1920, "height": 1080 },
+    logger.info("Starting grocery-tracker-poc!")
+    logger.info("Environment: %s", config.environment())
+    logger.info("Display: %s", os.environ["DISPLAY"] if "DISPLAY" in os.environ else "None")
+    logger.info("Are we in Docker? %s", "YES" if config.in_docker() else "NO")
+    logger.info("Pause at beginning? %s", "YES" if common.should_pause_at_beginning() else "NO")
+    logger.info("Browser: %s", "CHROMIUM" if "BROWSER" in os.environ and os.environ["BROWSER"] == "chromium" else "FIREFOX")
+    logger.info("Run mode: %s", config.run_mode())
+
+    launch_config = { "headless": False }
+    browser_config = {
+        "viewport": {"width": 1920, "height": 1080 },
+    }
+
+    if config.run_mode() == "scrape":
+        scrapers = {
+            "safeway": scrape_safeway,
+            "costco": scrape_costco,
         }
 
+        urls = {store: config.PRODUCT_URLS[store] for store in scrapers}
+        replay = config.har_mode() == "replay"
+        if replay:
+            # a replay scrapes the same recorded pages every time, so it skips
+            # the planner and keeps its prices out of the real history
+            logger.info("HAR_MODE=replay, scraping every url into a scratch history")
+            conn = history.connect(":memory:")
+        else:
+            conn = history.connect()
+            if config.rescrape_planning():
+                urls = planner.due_urls(conn, urls)
+
+        if config.work_queue() is not None and not replay:
+            # every node puts what it found due and then scrapes whatever it
+            # gets leased, so nodes split the backlog between themselves
+            work_queue = workqueue.open_queue()
+            added = work_queue.put(urls, skip_done_within = config.rescrape_min_hours() * 3600)
+            logger.info("Queued %s url(s)", added)
+
+            products = scrape_from_queue(work_queue, scrapers, conn, launch_config, browser_config)
+            work_queue.close()
+        else:
+            scrapers = {store: scraper for store, scraper in scrapers.items() if store in urls}
+            if not scrapers:
+                logger.info("Nothing is due for a scrape yet")
+                conn.close()
+                exit(0)
+
+            products = scrape_urls(scrapers, urls, launch_config, browser_config)
+            history.append(conn, products)
+
+        for product in products:
+            logger.info("%s", product)
+
+        ranking.invalidate(products)
+
+        stats = analytics.summarize(analytics.load_daily_prices(conn))
+        for (store, sku), stat in stats.items():
+            logger.info(
+                "[%s] %s: $%.2f, 30 day average $%.2f (%.1f%% below average)",
+                store, sku, stat["price"], stat["mean"], stat["percent_below_average"],
+            )
+
+        for group, product in ranking.best_for_list(conn, list(config.ITEM_GROUPS)).items():
+            if product is not None:
+                logger.info(
+                    "Best %s: [%s] %s $%.2f/%s",
+                    group, product["store"], product["name"], product["unit_price"], product["unit"],
+                )
+        conn.close()
+
+        exit(0)
+
+    with Stealth().use_sync(sync_playwright()) as p:
         logger.info("Spawning new browser and context with the following params:")
-        logger.info(f"Playwright config: {launch_config}")
-        logger.info(f"Browser config: {browser_config}")
+        logger.info("Playwright config: %s", launch_config)
+        logger.info("Browser config: %s", browser_config)
         browser, context = common.make_browser(
             playwright = p,
             launch_config = launch_config,
@@ -0,0 +1,77 @@
+import argparse
+import glob
+import json
+import logging
+from multiprocessing import Pool
+import os
+import sys
+import time
+
+from internal import config, logtag
+from internal.parsers import costco_sameday_static, safeway_static
+
+logger = logging.getLogger(__name__)
+logtag.setup()
+
+PARSERS = {
+    "costco": costco_sameday_static,
+    "safeway": safeway_static,
+}
+
+
+def reparse(job):
+    """
+    Parse one saved product page. Runs in a worker process. Errors are
+    returned instead of raised, so one odd page in a big archive doesn't
+    abort the whole run.
+
+    :param job: tuple of (store, path to html file)
+
+    :return: dict with store, path, the extracted product (or None) and
+        error (str, or None if the page parsed)
+    """
+    store, path = job
+    try:
+        with open(path) as f:
+            product = PARSERS[store].extract_product(f.read())
+    except Exception as e:
+        return {"store": store, "path": path, "product": None, "error": f"{type(e).__name__}: {e}"}
+
+    return {"store": store, "path": path, "product": product, "error": None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Re-parse saved product pages without a browser.")
+    parser.add_argument("--corpus", default = config.snapshot_dir(), help = "directory with saved snapshots (SAVE_SNAPSHOTS=true)")
+    parser.add_argument("--stores", nargs = "+", default = list(PARSERS), choices = list(PARSERS))
+    parser.add_argument("--workers", type = int, default = os.cpu_count(), help = "worker processes")
+    args = parser.parse_args()
+
+    # a warning per broken page would swamp the output on a big archive
+    logging.getLogger("internal").setLevel(logging.ERROR)
+
+    jobs = [
+        (store, path)
+        for store in args.stores
+        for path in sorted(glob.glob(os.path.join(args.corpus, store, "*.html")))
+    ]
+
+    start_time = time.monotonic()
+    parsed = 0
+    failed = 0
+    with Pool(args.workers) as pool:
+        for result in pool.imap_unordered(reparse, jobs, chunksize = 64):
+            if result["product"] is not None:
+                parsed += 1
+            if result["error"] is not None:
+                failed += 1
+            sys.stdout.write(json.dumps(result) + "\n")
+
+    if failed:
+        logger.warning("%s page(s) raised while parsing, see their \"error\" field", failed)
+
+    elapsed = time.monotonic() - start_time
+    logger.info(
+        "Re-parsed %s/%s page(s) in %.2f seconds (%.0f pages/sec) with %s worker(s)",
+        parsed, len(jobs), elapsed, len(jobs) / elapsed if elapsed > 0 else 0, args.workers,
+    )
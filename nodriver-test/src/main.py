@@ -1,19 +1,20 @@
 #!/bin/python
 
 import asyncio
-import inspect
 import nodriver as uc
 import logging
 import pdb
 import re
 
+import logtag
+
 FINGERPRINT_SCAN_URL = "https://fingerprint-scan.com/"
 COVER_YOUR_TRACKS_URL = "https://coveryourtracks.eff.org/"
 
 ENTROPY_WARNING_THRESHOLD = 1000
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format = "[%(levelname)s] %(message)s")
+logtag.setup()
 
 # there seems to be an issue in the nodriver code right now where running
 # query_selector, or select, or wait_for will not respect timeout and throw
@@ -47,28 +48,24 @@ async def run_diagnostics(browser: uc.Browser, quiet = True):
     """
     Run all diagnostic tests in a row.
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
-    logger.info(f"({tag}) Running diagnostics...")
+    logger.info("Running diagnostics...")
 
     score = await get_fingerprint_score(browser, quiet)
-    logger.info(f"({tag}) fingerprint Score => {score}")
+    logger.info("fingerprint Score => %s", score)
 
     entropy = await check_entropy(browser, quiet)
     if entropy == 1.0:
-        logger.info(f"({tag}) entropy => unique fingerprint detected...")
+        logger.info("entropy => unique fingerprint detected...")
     else:
-        logger.info(f"({tag}) entropy => {entropy}")
+        logger.info("entropy => %s", entropy)
 
-    logger.info(f"({tag}) Test complete.")
+    logger.info("Test complete.")
 
 
 async def get_fingerprint_score(browser: uc.Browser, quiet = False):
     """
     Returns the fingerprint score as an integer between 0 and 100
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     page = await browser.get(FINGERPRINT_SCAN_URL)
 
     # print out some generic bot test results and fingerprint id
@@ -84,7 +81,7 @@ async def get_fingerprint_score(browser: uc.Browser, quiet = False):
         else:
             fingerprint_hash = "not found"
 
-        logger.info(f"({tag}) fingerprint hash: {fingerprint_hash}")
+        logger.info("fingerprint hash: %s", fingerprint_hash)
 
         info_table = await page.find("table#fingerprintTable")
         rows = await info_table.query_selector_all("tr")
@@ -106,14 +103,14 @@ async def get_fingerprint_score(browser: uc.Browser, quiet = False):
             name = await row.query_selector(".property-name")
             result = await row.query_selector(".property-value")
 
-            logger.info(f"({tag}) {name.text_all} - {result.text_all}")
+            logger.info("%s - %s", name.text_all, result.text_all)
 
     score_element = await page.select("#fingerprintScore")
     score_match = re.match(r"Bot Risk Score:\s+(?P<score>[0-9]+)", score_element.text_all)
     score = int(score_match.groupdict()["score"]) if "score" in score_match.groupdict() else None
 
     if not quiet:
-        logger.info(f"({tag}) fingerprint score: {score if score != None else 'inconclusive'}")
+        logger.info("fingerprint score: %s", score if score != None else "inconclusive")
 
     return score
 
@@ -122,14 +119,12 @@ async def check_entropy(browser: uc.Browser, quiet = False):
     """
     Get browser fingerprinting stats.
     """
-    tag = __name__ + "." + inspect.stack()[0][0].f_code.co_name
-
     page = await browser.get(COVER_YOUR_TRACKS_URL)
 
     await wait_for(page, text = "Test Your Browser", timeout = 30)
     test_button = await page.select("a#kcarterlink", timeout = 30)
 
-    logger.info(f"({tag}) starting browser test...")
+    logger.info("starting browser test...")
 
     # click through to start the test
     await test_button.click()
@@ -141,13 +136,13 @@ async def check_entropy(browser: uc.Browser, quiet = False):
 
     # get assessment summary
     assessment = await page.query_selector("#fp_status > span")
-    logger.info(f"({tag}) Assessment => {assessment.text_all}")
+    logger.info("Assessment => %s", assessment.text_all)
 
     adblock_status = await page.query_selector("#ad_status")
-    logger.info(f"({tag}) Blocking tracking ads? => {adblock_status.text_all}")
+    logger.info("Blocking tracking ads? => %s", adblock_status.text_all)
 
     tracker_block_status = await page.query_selector("#tracker_status")
-    logger.info(f"({tag}) Blocking invisible trackers? => {tracker_block_status.text_all}")
+    logger.info("Blocking invisible trackers? => %s", tracker_block_status.text_all)
 
     # check entropy values
     results_table = await page.query_selector("div.detailed-results")
@@ -170,10 +165,10 @@ async def check_entropy(browser: uc.Browser, quiet = False):
             else:
                 entropy_msg = str(entropy)
 
-            logger.info(f"({tag}) {header.text_all} ({entropy_msg}) => {description}")
+            logger.info("%s (%s) => %s", header.text_all, entropy_msg, description)
 
         if quiet and entropy >= ENTROPY_WARNING_THRESHOLD:
-            logger.warning(f"({tag}) LOW ENTROPY DETECTED FOR {header.text_all}! ({entropy}) => {description}")
+            logger.warning("LOW ENTROPY DETECTED FOR %s! (%s) => %s", header.text_all, entropy, description)
 
     overall_entropy = await page.select("div.entropy")
     results = re.search(r"one in (?P<uniqueness>[0-9]*?(\.[0-9]+)?) browsers", overall_entropy.text_all)
@@ -183,7 +178,7 @@ async def check_entropy(browser: uc.Browser, quiet = False):
         entropy = 1.0
 
     if not quiet:
-        logger.info(f"({tag}) entropy => {entropy}")
+        logger.info("entropy => %s", entropy)
 
     return entropy
 